@@ -0,0 +1,199 @@
+"""
+This module builds the static assets once at startup.
+
+Every file gets a content-hashed name, and JavaScript module imports are
+rewritten to the hashed names of the modules they import. Text assets are
+compressed up front with gzip and, when the brotli package is installed,
+brotli. A hashed name always refers to the same bytes, so those responses
+can be cached by the browser for good.
+"""
+
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+
+try:
+    import brotli
+except ImportError:  # Optional: without it only gzip is offered
+    brotli = None
+
+# Cache-Control for hashed names, and for the plain names that may change
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+# Files smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 512
+
+COMPRESSIBLE_TYPES = (
+    'text/', 'application/javascript', 'application/json', 'application/manifest+json',
+    'image/svg+xml', 'image/vnd.microsoft.icon',
+)
+
+# Relative specifiers of static imports, re-exports and dynamic import()
+IMPORT_PATTERN = re.compile(r'''(\bfrom\s*|\bimport\s*\(?\s*)(['"])(\.{1,2}/[^'"]+)\2''')
+
+mimetypes.add_type('application/javascript', '.js')
+mimetypes.add_type('application/manifest+json', '.webmanifest')
+
+
+def accepted_encodings(header):
+    """
+    Parse an Accept-Encoding header.
+
+    :param header: The header value, e.g. "gzip, deflate, br;q=0.9".
+    :return: Set of content codings the client accepts.
+    """
+    accepted = set()
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class Asset:
+    """
+    One built static file with its precompressed bodies.
+    """
+
+    def __init__(self, path, hashed_path, body, content_type, digest):
+        """
+        Initializes the asset.
+
+        :param path: Path of the file below the static folder, e.g. "js/main.js".
+        :param hashed_path: The path with the content hash in the file name.
+        :param body: The file contents, imports already rewritten.
+        :param content_type: The MIME type to serve it with.
+        :param digest: Hex digest of `body`, used for the name and the ETag.
+        """
+        self.path = path
+        self.hashed_path = hashed_path
+        self.content_type = content_type
+        self.digest = digest
+        self.bodies = {'identity': body}
+
+    def compress(self, brotli_quality=11, gzip_level=9):
+        """
+        Compress the body, keeping only encodings that make it smaller.
+        """
+        body = self.bodies['identity']
+        if len(body) < MIN_COMPRESS_SIZE or not self.content_type.startswith(COMPRESSIBLE_TYPES):
+            return
+        # mtime=0 keeps the gzip bytes, and so the ETag, the same on every build
+        candidates = {'gzip': gzip.compress(body, gzip_level, mtime=0)}
+        if brotli is not None:
+            candidates['br'] = brotli.compress(body, quality=brotli_quality)
+        for encoding, data in candidates.items():
+            if len(data) < len(body):
+                self.bodies[encoding] = data
+
+    def select(self, accept_encoding):
+        """
+        Pick the smallest body the client accepts.
+
+        :param accept_encoding: The request's Accept-Encoding header.
+        :return: (encoding, body, etag) with encoding 'identity' when uncompressed.
+        """
+        accepted = accepted_encodings(accept_encoding)
+        encoding = min((encoding for encoding in self.bodies if encoding in accepted),
+                       key=lambda encoding: len(self.bodies[encoding]), default='identity')
+        etag = self.digest if encoding == 'identity' else f'{self.digest}-{encoding}'
+        return encoding, self.bodies[encoding], etag
+
+
+class AssetStore:
+    """
+    Holds the built static assets, looked up by plain or hashed path.
+    """
+
+    def __init__(self, static_dir, brotli_quality=11, gzip_level=9):
+        """
+        Initializes the store; call build() to fill it.
+
+        :param static_dir: The static folder.
+        :param brotli_quality: Brotli quality, 0 to 11.
+        :param gzip_level: Gzip compression level, 1 to 9.
+        """
+        self.static_dir = static_dir
+        self.brotli_quality = brotli_quality
+        self.gzip_level = gzip_level
+        self._assets = {}
+        self._hashed = {}
+
+    def build(self):
+        """
+        Read, fingerprint and compress every file below the static folder.
+
+        :return: The store.
+        """
+        sources = {}
+        for root, dirs, files in os.walk(self.static_dir):
+            dirs[:] = [name for name in dirs if not name.startswith('.')]
+            for name in files:
+                if name.startswith('.'):
+                    continue
+                full_path = os.path.join(root, name)
+                path = os.path.relpath(full_path, self.static_dir).replace(os.sep, '/')
+                with open(full_path, 'rb') as f:
+                    sources[path] = f.read()
+        for path in sorted(sources):
+            self._build_asset(path, sources, ())
+        for asset in self._assets.values():
+            asset.compress(self.brotli_quality, self.gzip_level)
+        self._hashed = {asset.hashed_path: asset for asset in self._assets.values()}
+        logging.info("Built %d static assets%s", len(self._assets), '' if brotli else ' (gzip only, brotli not installed)')
+        return self
+
+    def _build_asset(self, path, sources, importers):
+        asset = self._assets.get(path)
+        if asset is not None:
+            return asset
+        body = sources[path]
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if path.endswith('.js'):
+            # A module's hash covers the hashed names it imports, so changing
+            # any module renames everything that imports it
+            def rewrite(match):
+                target = posixpath.normpath(posixpath.join(posixpath.dirname(path), match.group(3)))
+                if target not in sources or target in importers or target == path:
+                    return match.group(0)  # Outside the static folder, or an import cycle
+                hashed = self._build_asset(target, sources, importers + (path,)).hashed_path
+                relative = posixpath.relpath(hashed, posixpath.dirname(path) or '.')
+                if not relative.startswith('.'):
+                    relative = './' + relative
+                return f'{match.group(1)}{match.group(2)}{relative}{match.group(2)}'
+            body = IMPORT_PATTERN.sub(rewrite, body.decode('utf-8')).encode('utf-8')
+        digest = hashlib.sha256(body).hexdigest()[:12]
+        stem, extension = posixpath.splitext(path)
+        asset = self._assets[path] = Asset(path, f'{stem}.{digest}{extension}', body, content_type, digest)
+        return asset
+
+    def url_path(self, path):
+        """
+        Map a path below the static folder to its hashed name, if it has one.
+        """
+        asset = self._assets.get(path)
+        return asset.hashed_path if asset is not None else path
+
+    def lookup(self, path):
+        """
+        Find an asset by hashed or plain path.
+
+        :return: (asset, immutable), with immutable True for a hashed path,
+                 or (None, False) if there is no such asset.
+        """
+        asset = self._hashed.get(path)
+        if asset is not None:
+            return asset, True
+        return self._assets.get(path), False
@@ -0,0 +1,249 @@
+"""
+This module benchmarks the sampling, storage and HTTP paths without any
+hardware and prints the results as JSON.
+
+The application is imported with the simulated hardware backend and a
+temporary working directory, so the real config.yaml and database.db are never
+touched. Run it from the repository root:
+
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --rows 1000000 --rows 10000000
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import yaml
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+# Labels of the fake sensors, one per type the simulated backend provides
+BENCHMARK_SENSORS = [
+    {'type': 'MAX31856', 'label': 'Pit', 'chip_select_pin': 'D5'},
+    {'type': 'MAX31865', 'label': 'Brisket', 'chip_select_pin': 'D6'},
+    {'type': 'MAX31855', 'label': 'Flat', 'chip_select_pin': 'D13', 'spi_bus': 1},
+    {'type': 'ADS1115', 'label': 'Probe'},
+]
+
+def timed(func, iterations):
+    """
+    Call `func` `iterations` times and return the elapsed wall time in seconds.
+    """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return time.perf_counter() - start
+
+async def timed_async(func, iterations):
+    """
+    Await `func()` `iterations` times and return the elapsed wall time in seconds.
+    """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await func()
+    return time.perf_counter() - start
+
+def result(name, value, unit, **details):
+    """Build one benchmark result entry."""
+    return {'name': name, 'value': round(value, 3), 'unit': unit, **details}
+
+def prepare_workdir(workdir):
+    """
+    Write a config.yaml for the simulated backend into `workdir`.
+
+    The simulated clock runs a million times faster than real time, so the
+    fake sensors cost their software overhead and not the chips' conversion time.
+    """
+    with open(os.path.join(REPO_ROOT, 'config.yaml'), 'r', encoding='utf-8') as config_file:
+        config = yaml.safe_load(config_file)
+    config['hardware']['backend'] = 'simulated'
+    config['hardware']['simulation']['time_scale'] = 1e6
+    config['sensors'] = BENCHMARK_SENSORS
+    path = os.path.join(workdir, 'config.yaml')
+    with open(path, 'w', encoding='utf-8') as config_file:
+        yaml.safe_dump(config, config_file, sort_keys=False)
+    return path
+
+def import_app(config_path):
+    """
+    Import masterpi and create the app against the benchmark configuration.
+    """
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    import config
+    config.config_store.path = config_path
+    import masterpi
+    masterpi.create_app()
+    return masterpi
+
+def bench_read_temperatures(masterpi, iterations):
+    """read_temperatures() and a full sampler sweep, in sweeps and sensor reads per second."""
+    sensors = len(masterpi.active_sensors)
+    elapsed = timed(masterpi.read_temperatures, iterations)
+    sweep_elapsed = timed(masterpi.sampler.sweep, iterations)
+    return [
+        result('read_temperatures', iterations / elapsed, 'sweeps/s', sensors=sensors,
+               reads_per_second=round(iterations * sensors / elapsed, 1)),
+        result('sampler_sweep', iterations / sweep_elapsed, 'sweeps/s', sensors=sensors,
+               reads_per_second=round(iterations * sensors / sweep_elapsed, 1)),
+    ]
+
+def bench_inserts(database, iterations, writer_rows):
+    """insert_temperature_data() one row per transaction, and the batching TemperatureWriter."""
+    database.init_db()
+    elapsed = timed(lambda: database.insert_temperature_data(random.uniform(20, 120), 'Pit'), iterations)
+
+    writer = database.TemperatureWriter(batch_size=500, flush_interval=1.0, max_queue=writer_rows + 1)
+    start = time.perf_counter()
+    writer.start()
+    for i in range(writer_rows):
+        writer.submit(random.uniform(20, 120), 'Pit')
+    writer.close()
+    writer_elapsed = time.perf_counter() - start
+    return [
+        result('insert_temperature_data', iterations / elapsed, 'rows/s', rows=iterations),
+        result('temperature_writer', writer_rows / writer_elapsed, 'rows/s', rows=writer_rows,
+               dropped=writer.dropped),
+    ]
+
+def populate_history(path, rows, sensors=('Pit', 'Brisket', 'Ambient'), interval=1.0):
+    """
+    Fill a fresh database with `rows` raw rows ending now, then backfill the
+    rollup tables from them.
+    """
+    import database
+    database.DATABASE_PATH = path
+    database.init_db()
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA synchronous=OFF')
+    samples_per_sensor = rows // len(sensors)
+    start_ms = int((time.time() - samples_per_sensor * interval) * 1000)
+    with conn:
+        ids = database.sensor_ids(conn, sensors)
+        def generate():
+            for i in range(samples_per_sensor):
+                ts = start_ms + int(i * interval * 1000)
+                for n, sensor in enumerate(sensors):
+                    yield (ids[sensor], ts, 100 + 10 * n + random.gauss(0, 1))
+        conn.executemany('INSERT INTO samples (sensor_id, ts, temperature) VALUES (?, ?, ?)', generate())
+        for bucket_seconds, table in database.ROLLUP_TIERS:
+            database.backfill_rollup(conn, bucket_seconds, table)
+    conn.close()
+
+def bench_history(workdir, rows, repeat):
+    """History queries against a database of `rows` rows, in ms per query."""
+    import database
+    from downsample import rows_to_series
+    path = os.path.join(workdir, f'history-{rows}.db')
+    build_start = time.perf_counter()
+    populate_history(path, rows)
+    build_seconds = time.perf_counter() - build_start
+
+    queries = [
+        ('history_1h_raw', lambda: database.get_temperature_data_by_range(60)),
+        ('history_24h_raw', lambda: database.get_temperature_data_by_range(24 * 60)),
+        ('history_24h_rollup', lambda: database.get_temperature_data_by_range(24 * 60, resolution=300)),
+        ('history_24h_raw_lttb',
+         lambda: rows_to_series(database.get_temperature_data_by_range(24 * 60), 300)),
+        ('latest_timestamp', database.get_latest_temperature_timestamp),
+    ]
+    results = []
+    for name, query in queries:
+        value = query()
+        returned = len(value) if isinstance(value, (list, tuple, dict)) else 1
+        elapsed = timed(query, repeat)
+        results.append(result(name, elapsed / repeat * 1000, 'ms', table_rows=rows, returned=returned))
+    results.append(result('history_db_build', build_seconds, 's', table_rows=rows))
+    os.remove(path)
+    return results
+
+async def bench_http(test_app, masterpi, requests):
+    """/api/status and /temp_data through the Quart test client, in requests per second."""
+    masterpi.sampler.sweep()  # So the handlers have a snapshot to serve
+    client = test_app.test_client()
+    results = []
+    for url in ('/api/status', '/temp_data'):
+        response = await client.get(url)
+        assert response.status_code == 200, f"{url} returned {response.status_code}"
+        elapsed = await timed_async(lambda: client.get(url), requests)
+        results.append(result(f'http{url.replace("/", "_")}', requests / elapsed, 'req/s', requests=requests))
+    return results
+
+async def run_app_benchmarks(masterpi, database, args):
+    """Run the benchmarks that need the started app."""
+    async with masterpi.app.test_app() as test_app:
+        # Stop the background loops so they do not compete with the measurements
+        await masterpi.control_loop.stop()
+        await masterpi.sampler.stop()
+        results = []
+        results += bench_read_temperatures(masterpi, args.iterations)
+        results += bench_inserts(database, args.inserts, args.writer_rows)
+        results += await bench_http(test_app, masterpi, args.requests)
+    return results
+
+def git_commit():
+    """Return the current commit hash, or None outside a git checkout."""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark MasterPI without hardware.')
+    parser.add_argument('--output', help='Write the JSON results to this file instead of stdout.')
+    parser.add_argument('--iterations', type=int, default=2000, help='Sensor sweeps to time.')
+    parser.add_argument('--inserts', type=int, default=2000, help='Rows for the insert_temperature_data benchmark.')
+    parser.add_argument('--writer-rows', type=int, default=100000, help='Rows for the TemperatureWriter benchmark.')
+    parser.add_argument('--rows', type=int, action='append',
+                        help='Size of a history database to query; repeat for several (default 1000000).')
+    parser.add_argument('--repeat', type=int, default=5, help='Repetitions of each history query.')
+    parser.add_argument('--requests', type=int, default=2000, help='HTTP requests per endpoint.')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='masterpi-bench-')
+    cwd = os.getcwd()
+    try:
+        config_path = prepare_workdir(workdir)
+        # database.db and logs/ are created relative to the working directory
+        os.chdir(workdir)
+        # Keep the application's startup prints out of the JSON on stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            masterpi = import_app(config_path)
+        import database
+
+        results = asyncio.run(run_app_benchmarks(masterpi, database, args))
+        for rows in args.rows or [1000000]:
+            results += bench_history(workdir, rows, args.repeat)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'sqlite': sqlite3.sqlite_version,
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            output_file.write(output + '\n')
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,310 @@
+"""
+This module provides shared bus objects and a pipelined sensor sweep that
+overlaps the conversion time of one-shot sensors.
+"""
+
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from metrics import registry
+
+# A physical bus shared by every sensor on it. `lock` serializes our own
+# transactions on the bus across threads.
+SharedBus = namedtuple('SharedBus', ['name', 'device', 'lock'])
+
+# Board pin names (clock, MOSI, MISO) of the Raspberry Pi's SPI buses
+SPI_BUS_PINS = {
+    0: ('SCLK', 'MOSI', 'MISO'),
+    1: ('SCLK_1', 'MOSI_1', 'MISO_1'),
+}
+
+# Longest time to wait for a one-shot conversion before giving up on it
+CONVERSION_TIMEOUT = 0.5
+CONVERSION_POLL_INTERVAL = 0.01
+
+SENSOR_READ_SECONDS = registry.histogram(
+    'masterpi_sensor_read_seconds',
+    'Time to read a sensor; for one-shot sensors from starting the conversion to collecting it.',
+    ['sensor'])
+SENSOR_READS_SKIPPED = registry.counter(
+    'masterpi_sensor_reads_skipped_total', 'Reads skipped because the sensor circuit was open.', ['sensor'])
+
+def create_spi(bus_id):
+    """
+    Create the busio.SPI object for a physical SPI bus.
+
+    :param bus_id: 0 or 1.
+    """
+    import board
+    import busio
+    clock, mosi, miso = SPI_BUS_PINS[bus_id]
+    return busio.SPI(clock=getattr(board, clock), MOSI=getattr(board, mosi), MISO=getattr(board, miso))
+
+class SPIBusManager:
+    """
+    Hands out one SharedBus per physical SPI bus, creating it on first use.
+    """
+
+    def __init__(self, factory=create_spi):
+        """
+        Initializes the manager.
+
+        :param factory: Callable taking a bus id and returning the bus device.
+        """
+        self.factory = factory
+        self._buses = {}
+        self._lock = threading.Lock()
+
+    def get(self, bus_id=0):
+        """
+        Returns the shared bus for a bus id.
+
+        :param bus_id: The SPI bus number.
+        :return: A SharedBus.
+        """
+        with self._lock:
+            bus = self._buses.get(bus_id)
+            if bus is None:
+                bus = SharedBus(f'spi{bus_id}', self.factory(bus_id), threading.Lock())
+                self._buses[bus_id] = bus
+            return bus
+
+def supports_one_shot(sensor):
+    """Check whether a sensor can start a conversion and collect it later."""
+    return hasattr(sensor, 'initiate_one_shot_measurement') and hasattr(sensor, 'unpack_temperature')
+
+def _locked(lock, func, *args):
+    if lock is None:
+        return func(*args)
+    with lock:
+        return func(*args)
+
+def pipelined_sweep(sensors, read_sensor, lock_for=lambda sensor: None, results=None):
+    """
+    Read a list of sensors, overlapping the conversions of one-shot sensors.
+
+    First a conversion is started on every sensor that supports it, then the
+    other sensors are read while those conversions run, and finally the
+    conversion results are collected. A sweep over several one-shot
+    thermocouples therefore takes about one conversion time instead of one per
+    sensor.
+
+    :param sensors: List of (sensor, label) tuples.
+    :param read_sensor: Callable taking (sensor, label) for a blocking read.
+    :param lock_for: Callable returning the bus lock for a sensor, or None.
+    :param results: Optional list of len(sensors) Nones, filled in as each read
+                    completes, so a caller that stops waiting keeps the finished ones.
+    :return: List of (temperature, timestamp, error) tuples in the same order;
+             error is the exception raised by a failed read, otherwise None.
+    """
+    results = [None] * len(sensors) if results is None else results
+    converting = []
+    started = [None] * len(sensors)
+
+    # Trigger: start a conversion on every one-shot sensor
+    for i, (sensor, label) in enumerate(sensors):
+        if supports_one_shot(sensor):
+            started[i] = time.perf_counter()
+            try:
+                _locked(lock_for(sensor), sensor.initiate_one_shot_measurement)
+                converting.append(i)
+            except Exception as e:
+                results[i] = (None, time.time(), e)
+
+    # Read everything else while the conversions run
+    for i, (sensor, label) in enumerate(sensors):
+        if results[i] is None and not supports_one_shot(sensor):
+            start = time.perf_counter()
+            try:
+                results[i] = (_locked(lock_for(sensor), read_sensor, sensor, label), time.time(), None)
+            except Exception as e:
+                results[i] = (None, time.time(), e)
+            SENSOR_READ_SECONDS.labels(label).observe(time.perf_counter() - start)
+
+    # Collect: wait for each conversion in turn; later ones finished meanwhile
+    deadline = time.monotonic() + CONVERSION_TIMEOUT
+    for i in converting:
+        sensor, label = sensors[i]
+        lock = lock_for(sensor)
+        try:
+            while _locked(lock, getattr, sensor, 'oneshot_pending'):
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"Conversion timed out for {label}")
+                time.sleep(CONVERSION_POLL_INTERVAL)
+            results[i] = (_locked(lock, sensor.unpack_temperature), time.time(), None)
+        except Exception as e:
+            results[i] = (None, time.time(), e)
+        SENSOR_READ_SECONDS.labels(label).observe(time.perf_counter() - started[i])
+
+    return results
+
+class CircuitBreaker:
+    """
+    Stops reading a sensor that keeps failing.
+
+    After `failure_threshold` consecutive failures the breaker opens and the
+    sensor is skipped for `backoff` seconds. Then one trial read is allowed;
+    if it fails too the breaker opens again for twice as long, up to
+    `max_backoff`, and a success closes it and resets the backoff.
+    """
+
+    def __init__(self, failure_threshold=3, backoff=10.0, max_backoff=300.0):
+        """
+        Initializes a closed breaker.
+
+        :param failure_threshold: Consecutive failures that open the breaker.
+        :param backoff: Initial time in seconds the breaker stays open.
+        :param max_backoff: Longest time in seconds the breaker stays open.
+        """
+        self.failure_threshold = failure_threshold
+        self.initial_backoff = backoff
+        self.max_backoff = max_backoff
+        self.failures = 0
+        self.backoff = backoff
+        self.open_until = None
+
+    def allow(self, now=None):
+        """
+        Checks whether the sensor may be read now.
+        """
+        if self.open_until is None:
+            return True
+        return (now if now is not None else time.monotonic()) >= self.open_until
+
+    def record_success(self):
+        """
+        Closes the breaker after a successful read.
+        """
+        self.failures = 0
+        self.backoff = self.initial_backoff
+        self.open_until = None
+
+    def record_failure(self, now=None):
+        """
+        Counts a failed read, opening the breaker once the threshold is reached.
+        """
+        now = now if now is not None else time.monotonic()
+        self.failures += 1
+        if self.open_until is not None:
+            # The trial read after a backoff failed; back off for longer
+            self.backoff = min(self.backoff * 2, self.max_backoff)
+            self.open_until = now + self.backoff
+        elif self.failures >= self.failure_threshold:
+            self.open_until = now + self.backoff
+
+class ParallelSweeper:
+    """
+    Reads the sensors of each physical bus on that bus's own worker thread, so
+    independent buses are read concurrently and a slow or hung bus only delays
+    its own sensors.
+
+    Each bus group is given until the largest read deadline of its sensors;
+    the sensors of a bus that misses it whose reads had not finished are
+    reported as timed out, and the bus is not given new work until the late
+    read returns.
+    """
+
+    def __init__(self, bus_name, read_sweep, deadline_for=lambda label: 1.0, breaker_factory=CircuitBreaker):
+        """
+        Initializes the sweeper.
+
+        :param bus_name: Callable returning the bus name of a sensor.
+        :param read_sweep: Callable reading a list of (sensor, label) tuples on one
+                           bus and returning (temperature, timestamp, error) tuples.
+                           It is also passed a list to fill in as each read completes.
+        :param deadline_for: Callable returning the read deadline in seconds for a label.
+        :param breaker_factory: Callable creating the CircuitBreaker for a sensor.
+        """
+        self.bus_name = bus_name
+        self.read_sweep = read_sweep
+        self.deadline_for = deadline_for
+        self.breaker_factory = breaker_factory
+        self.breakers = {}
+        self._executors = {}
+        self._inflight = {}
+
+    def _executor(self, name):
+        executor = self._executors.get(name)
+        if executor is None:
+            executor = self._executors[name] = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'bus-{name}')
+        return executor
+
+    def _breaker(self, label):
+        breaker = self.breakers.get(label)
+        if breaker is None:
+            breaker = self.breakers[label] = self.breaker_factory()
+        return breaker
+
+    def sweep(self, sensors):
+        """
+        Reads a list of sensors, one worker per bus.
+
+        :param sensors: List of (sensor, label) tuples.
+        :return: List of (temperature, timestamp, error) tuples in the same order.
+        """
+        results = [None] * len(sensors)
+        groups = {}
+        skipped = set()
+        now = time.monotonic()
+        for i, (sensor, label) in enumerate(sensors):
+            if not self._breaker(label).allow(now):
+                results[i] = (None, time.time(), RuntimeError(f"Circuit open for {label}, skipping read"))
+                skipped.add(i)
+                SENSOR_READS_SKIPPED.labels(label).inc()
+                continue
+            groups.setdefault(self.bus_name(sensor), []).append(i)
+
+        futures = {}
+        for name, indices in groups.items():
+            previous = self._inflight.get(name)
+            if previous is not None and not previous.done():
+                for i in indices:
+                    results[i] = (None, time.time(), TimeoutError(f"Bus {name} is still busy with a previous read"))
+                continue
+            group = [sensors[i] for i in indices]
+            partial = [None] * len(group)
+            future = self._executor(name).submit(self.read_sweep, group, partial)
+            self._inflight[name] = future
+            deadline = now + max(self.deadline_for(label) for _, label in group)
+            futures[name] = (future, indices, partial, deadline)
+
+        for name, (future, indices, partial, deadline) in futures.items():
+            try:
+                group_results = future.result(timeout=max(0.0, deadline - time.monotonic()))
+                for i, result in zip(indices, group_results):
+                    results[i] = result
+            except FutureTimeoutError:
+                # Reads that finished before the deadline still count; only the
+                # sensors the bus had not got to yet time out
+                for i, result in zip(indices, list(partial)):
+                    if result is None:
+                        result = (None, time.time(), TimeoutError(f"Read deadline exceeded on bus {name}"))
+                    results[i] = result
+            except Exception as e:
+                for i in indices:
+                    results[i] = (None, time.time(), e)
+
+        for i, ((sensor, label), (temperature, timestamp, error)) in enumerate(zip(sensors, results)):
+            if i in skipped:
+                continue
+            if error is None:
+                self._breaker(label).record_success()
+            else:
+                self._breaker(label).record_failure()
+        return results
+
+    def open_circuits(self):
+        """
+        Returns the labels of the sensors currently being skipped.
+        """
+        now = time.monotonic()
+        return [label for label, breaker in self.breakers.items() if not breaker.allow(now)]
+
+    def close(self):
+        """
+        Shuts down the bus workers without waiting for reads still in progress.
+        """
+        for executor in self._executors.values():
+            executor.shutdown(wait=False)
+        self._executors.clear()
@@ -1,11 +1,135 @@
 """
-This module provides functions to load and save configuration data
-from a YAML file asynchronously.
+This module provides a ConfigStore that caches the parsed YAML configuration,
+serializes and atomically writes changes, and notifies subscribers of them.
 """
 
 import asyncio
+import copy
+import logging
+import os
+import tempfile
 import yaml
 
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.yaml')
+
+class ConfigStore:
+    """
+    An in-process cache of the configuration file.
+
+    The file is parsed once and only parsed again when its modification time
+    changes. The dict returned by get() is shared and must be treated as
+    read-only; changes go through update(), which is serialized by a lock,
+    writes via a temporary file and rename, and notifies subscribers.
+    """
+
+    def __init__(self, path=CONFIG_PATH):
+        """
+        Initializes the store.
+
+        :param path: Path to the YAML configuration file.
+        """
+        self.path = path
+        self.version = 0
+        self._config = None
+        self._mtime = None
+        self._lock = asyncio.Lock()
+        self._subscribers = []
+
+    def get(self):
+        """
+        Returns the current configuration, re-reading the file only if it changed on disk.
+
+        :return: The configuration dict, or None if it has never loaded successfully.
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            logging.error("Config file not found. Please ensure '%s' exists.", self.path)
+            return self._config
+
+        if mtime != self._mtime:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as config_file:
+                    config = yaml.safe_load(config_file)
+            except (OSError, yaml.YAMLError) as e:
+                # Keep serving the last good configuration
+                logging.error("Error loading config file: %s", e)
+                return self._config
+            self._set(config, mtime)
+        return self._config
+
+    def subscribe(self, callback):
+        """
+        Registers a callback to be called with the new configuration after every change.
+
+        :param callback: Callable taking the configuration dict.
+        """
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        """
+        Removes a callback registered with subscribe().
+
+        :param callback: The callback to remove.
+        """
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    async def update(self, mutate):
+        """
+        Applies a change to a copy of the configuration and saves it.
+
+        :param mutate: Callable that modifies the configuration dict it is given
+                       in place. If it raises, nothing is saved.
+        :return: The new configuration.
+        """
+        async with self._lock:
+            config = copy.deepcopy(self.get())
+            mutate(config)
+            mtime = await asyncio.to_thread(self._write, config)
+            self._set(config, mtime)
+            return config
+
+    async def save(self, config):
+        """
+        Replaces the whole configuration and saves it.
+
+        :param config: The new configuration dict.
+        """
+        def replace(current):
+            current.clear()
+            current.update(copy.deepcopy(config))
+        return await self.update(replace)
+
+    def _write(self, config):
+        directory = os.path.dirname(self.path) or '.'
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.config-', suffix='.yaml')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as temp_file:
+                yaml.safe_dump(config, temp_file, sort_keys=False)
+                temp_file.flush()
+                os.fsync(temp_file.fileno())
+            # Readers see either the old or the new file, never a partial one
+            os.replace(temp_path, self.path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        return os.stat(self.path).st_mtime_ns
+
+    def _set(self, config, mtime):
+        self._config = config
+        self._mtime = mtime
+        self.version += 1
+        logging.info("Configuration loaded (version %d)", self.version)
+        for callback in self._subscribers:
+            try:
+                callback(config)
+            except Exception as e:
+                logging.error("Error in config subscriber %r: %s", callback, e)
+
+# The single store shared by the whole application
+config_store = ConfigStore()
+
 def load_config():
     """
     Load configuration from 'config.yaml'.
@@ -13,21 +137,7 @@ def load_config():
     Returns:
         dict: Configuration data if loaded successfully, None otherwise.
     """
-    try:
-        with open('config.yaml', 'r', encoding='utf-8') as config_file:
-            print("Config file opened successfully")
-            config = yaml.safe_load(config_file)
-            print("Config file loaded successfully")
-            return config
-    except FileNotFoundError:
-        print("Config file not found. Please ensure 'config.yaml' exists.")
-        return None
-    except yaml.YAMLError as e:
-        print(f"Error parsing config file: {e}")
-        return None
-    except Exception as e:
-        print(f"Unexpected error loading config file: {e}")
-        return None
+    return config_store.get()
 
 async def save_config(config):
     """
@@ -36,12 +146,4 @@ async def save_config(config):
     Args:
         config (dict): Configuration data to save.
     """
-    def _save_config():
-        with open('config.yaml', 'w', encoding='utf-8') as file:
-            yaml.dump(config, file)
-        print("Config file saved successfully")
-
-    # Run the synchronous file operation in a separate thread
-    await asyncio.to_thread(_save_config)
-
-# Ensure the file ends with a newline
\ No newline at end of file
+    await config_store.save(config)
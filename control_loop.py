@@ -0,0 +1,219 @@
+"""
+This module provides the fixed-rate control loop that feeds the PID controller
+from the latest sensor snapshot and drives the fan, and records how well the
+loop keeps its schedule.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from metrics import registry
+
+CONTROL_LATENESS_SECONDS = registry.histogram(
+    'masterpi_control_loop_lateness_seconds', 'How long after its scheduled time a control iteration started.')
+CONTROL_COMPUTE_SECONDS = registry.histogram(
+    'masterpi_control_loop_compute_seconds', 'Time taken by one control iteration.')
+CONTROL_OVERRUNS = registry.counter(
+    'masterpi_control_loop_overruns_total', 'Control iterations that started a whole period late.')
+
+
+def celsius_to_fahrenheit(temperature):
+    """Convert a sensor temperature, in Celsius, to Fahrenheit."""
+    return temperature * 9 / 5 + 32
+
+
+class LoopTimings:
+    """
+    Keeps the most recent timing samples of a periodic loop.
+
+    Lateness is how long after its scheduled time an iteration started, the
+    period is the time between the starts of consecutive iterations and the
+    compute time is how long an iteration's work took. All are in seconds.
+    """
+
+    def __init__(self, size=1000):
+        """
+        Initializes empty timings.
+
+        :param size: Number of recent iterations kept.
+        """
+        self.lateness = deque(maxlen=size)
+        self.periods = deque(maxlen=size)
+        self.compute_times = deque(maxlen=size)
+        self.iterations = 0
+        self.overruns = 0  # Iterations that started a whole period late
+
+    def record(self, lateness, period, compute_time):
+        """
+        Adds the timing of one iteration.
+        """
+        CONTROL_LATENESS_SECONDS.observe(lateness)
+        CONTROL_COMPUTE_SECONDS.observe(compute_time)
+        self.iterations += 1
+        self.lateness.append(lateness)
+        if period is not None:
+            self.periods.append(period)
+        self.compute_times.append(compute_time)
+
+    @staticmethod
+    def _summary(samples):
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        def percentile(p):
+            return ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000
+        return {
+            'p50_ms': round(percentile(0.5), 3),
+            'p99_ms': round(percentile(0.99), 3),
+            'max_ms': round(ordered[-1] * 1000, 3),
+        }
+
+    def summary(self):
+        """
+        Returns percentiles of the recent samples in milliseconds.
+        """
+        return {
+            'iterations': self.iterations,
+            'overruns': self.overruns,
+            'lateness': self._summary(self.lateness),
+            'period': self._summary(self.periods),
+            'compute': self._summary(self.compute_times),
+        }
+
+
+class ControlLoop:
+    """
+    Runs the PID controller every `sample_time` seconds on a monotonic schedule.
+
+    Each iteration reads the control sensor from the latest snapshot, computes
+    the PID output with the real time since the previous iteration and turns
+    it into a fan duty cycle: the fan is switched on for output percent of the
+    period and off for the rest (time-proportional control of an on/off fan).
+    The fan is held off while the setpoint is zero or the reading is missing
+    or stale.
+
+    Sensors report Celsius while the setpoint is in Fahrenheit, so readings
+    are converted with `convert_reading` before they reach the PID.
+    """
+
+    def __init__(self, pid, fan, get_reading, sample_time=1.0, max_reading_age=15.0,
+                 convert_reading=celsius_to_fahrenheit):
+        """
+        Initializes the loop.
+
+        :param pid: The PIDController; its output_limits should be (0, 100).
+        :param fan: The FanController to drive.
+        :param get_reading: Callable returning the control sensor's latest
+                            (temperature, timestamp) tuple, or None.
+        :param sample_time: Time in seconds between iterations.
+        :param max_reading_age: Age in seconds after which a reading is too old to act on.
+        :param convert_reading: Callable converting a reading to the unit of the PID setpoint.
+        """
+        self.pid = pid
+        self.fan = fan
+        self.get_reading = get_reading
+        self.sample_time = sample_time
+        self.max_reading_age = max_reading_age
+        self.convert_reading = convert_reading
+        self.timings = LoopTimings()
+        self.output = 0.0
+        self.duty = 0.0
+        self._fan_off_handle = None
+        self._last_compute = None
+        self._task = None
+
+    def step(self, now):
+        """
+        Runs one iteration of the loop.
+
+        :param now: The loop's monotonic time in seconds.
+        :return: The fan duty cycle between 0 and 1.
+        """
+        reading = self.get_reading()
+        if self.pid.setpoint <= 0 or reading is None or reading[0] is None:
+            return self._hold_off()
+        temperature, timestamp = reading
+        if time.time() - timestamp > self.max_reading_age:
+            logging.warning("Control reading is %.1f s old; holding the fan off", time.time() - timestamp)
+            return self._hold_off()
+
+        dt = self.sample_time if self._last_compute is None else now - self._last_compute
+        self._last_compute = now
+        self.output = self.pid.compute(self.convert_reading(temperature), dt)
+        low, high = self.pid.output_limits
+        self.duty = min(max((self.output - low) / (high - low), 0.0), 1.0)
+        return self.duty
+
+    def _hold_off(self):
+        self.pid.reset()
+        self._last_compute = None
+        self.output = 0.0
+        self.duty = 0.0
+        return self.duty
+
+    def _drive_fan(self, duty, loop):
+        if self._fan_off_handle is not None:
+            self._fan_off_handle.cancel()
+            self._fan_off_handle = None
+        if duty <= 0:
+            self.fan.turn_off_fan()
+            return
+        self.fan.turn_on_fan()
+        if duty < 1:
+            self._fan_off_handle = loop.call_later(duty * self.sample_time, self.fan.turn_off_fan)
+
+    async def run(self):
+        """
+        Runs the loop forever, once every `sample_time` seconds.
+        """
+        loop = asyncio.get_running_loop()
+        scheduled = loop.time()
+        previous_start = None
+        while True:
+            start = loop.time()
+            try:
+                duty = self.step(start)
+                self._drive_fan(duty, loop)
+            except Exception as e:
+                logging.error("Error in control loop: %s", e)
+                self.fan.turn_off_fan()
+            self.timings.record(
+                lateness=start - scheduled,
+                period=None if previous_start is None else start - previous_start,
+                compute_time=loop.time() - start
+            )
+            previous_start = start
+            scheduled += self.sample_time
+            delay = scheduled - loop.time()
+            if delay < 0:
+                # Missed a whole period; skip ahead instead of running back-to-back
+                self.timings.overruns += 1
+                CONTROL_OVERRUNS.inc()
+                scheduled = loop.time()
+                delay = 0
+            await asyncio.sleep(delay)
+
+    def start(self):
+        """
+        Starts the control task on the running event loop.
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        """
+        Cancels the control task, waits for it to finish and turns the fan off.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._fan_off_handle is not None:
+            self._fan_off_handle.cancel()
+            self._fan_off_handle = None
+        self.fan.turn_off_fan()
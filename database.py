@@ -1,75 +1,864 @@
 """
 This module provides functions to initialize a database and perform operations
 related to temperature data.
+
+Samples are stored in schema version 2: a `sensors` table gives every label a
+small integer id, and `samples` is a WITHOUT ROWID table clustered on
+(sensor_id, ts), with `ts` the read time in epoch milliseconds. A database
+still holding the version 1 `temperature_data` table is moved over in the
+background by SchemaMigration.
 """
 
+import asyncio
 import sqlite3
 import logging
-from datetime import datetime, timedelta  # Correct import order
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from metrics import registry
+
+DATABASE_PATH = 'database.db'
+
+# PRAGMA user_version of a fully migrated database
+SCHEMA_VERSION = 2
+
+# Rollup tiers as (bucket size in seconds, table name), finest first. Each
+# table keeps min/max/sum/count per sensor and bucket; the average is sum/count.
+ROLLUP_TIERS = (
+    (60, 'rollup_1m'),
+    (300, 'rollup_5m'),
+    (3600, 'rollup_1h'),
+)
+
+FLUSH_SECONDS = registry.histogram('masterpi_db_flush_seconds', 'Time to write one batch of temperature rows.')
+ROWS_WRITTEN = registry.counter('masterpi_db_rows_written_total', 'Temperature rows written to the database.')
+ROWS_DROPPED = registry.counter('masterpi_db_rows_dropped_total', 'Temperature rows dropped because the write queue was full.')
+ROWS_MIGRATED = registry.counter('masterpi_db_rows_migrated_total', 'Version 1 temperature rows moved to the samples table.')
+
+DB_READ_SECONDS = registry.histogram('masterpi_db_read_seconds', 'Time to run one read on the read pool.', ['query'])
+
+def _table_exists(conn, table):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None
+
+def connect_read_only(db_path=None, check_same_thread=True):
+    """
+    Open a read-only connection. Under WAL it reads a consistent snapshot
+    without ever blocking, or being blocked by, the writer.
+
+    :param db_path: Path to the SQLite database, defaults to DATABASE_PATH.
+    :param check_same_thread: False if other threads will use the connection, one at a time.
+    """
+    conn = sqlite3.connect(f'file:{db_path or DATABASE_PATH}?mode=ro', uri=True,
+                           check_same_thread=check_same_thread, timeout=30)
+    conn.execute('PRAGMA query_only=ON')
+    return conn
+
+@contextmanager
+def read_connection(conn=None):
+    """
+    Use `conn` for a read, or open a connection for just this read and close it after.
+    """
+    if conn is not None:
+        yield conn
+        return
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+def _convert_auto_vacuum(conn):
+    """Rewrite an existing database with one full VACUUM so incremental auto-vacuum takes effect."""
+    pages = conn.execute('PRAGMA page_count').fetchone()[0]
+    logging.info("Converting the %d page database to incremental auto-vacuum; this runs once", pages)
+    start = last_logged = time.monotonic()
+
+    def progress():
+        nonlocal last_logged
+        now = time.monotonic()
+        if now - last_logged >= 10:
+            logging.info("Still converting the database to incremental auto-vacuum after %.0f s", now - start)
+            last_logged = now
+        return 0
+
+    conn.set_progress_handler(progress, 100000)
+    try:
+        conn.execute('VACUUM')
+    finally:
+        conn.set_progress_handler(None, 0)
+    logging.info("Converted the database to incremental auto-vacuum in %.1f s", time.monotonic() - start)
+
+def init_db(convert_auto_vacuum=False):
+    """
+    Initialize the database, creating the schema or upgrading an older one.
 
-def init_db():
-    """Initialize the database and create the temperature_data table if it doesn't exist."""
-    conn = sqlite3.connect('database.db')
+    :param convert_auto_vacuum: Convert an existing database that does not use
+                                incremental auto-vacuum with one full VACUUM.
+                                It blocks for as long as rewriting the file takes.
+    """
+    conn = sqlite3.connect(DATABASE_PATH)
+    # Incremental auto-vacuum lets the retention job hand freed pages back in
+    # small steps. It only takes effect on a database without tables, so an
+    # existing file needs a full VACUUM, which is only run when asked for.
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        if conn.execute("SELECT count(*) FROM sqlite_master WHERE type = 'table'").fetchone()[0]:
+            if convert_auto_vacuum:
+                _convert_auto_vacuum(conn)
+            else:
+                logging.info("The database does not use incremental auto-vacuum, so freed pages are reused "
+                             "but the file never shrinks; set database.convert_auto_vacuum to convert it "
+                             "with one VACUUM at the next start")
+    # WAL lets readers run alongside the writer and is persistent for the file.
+    conn.execute('PRAGMA journal_mode=WAL')
+    legacy = _table_exists(conn, 'temperature_data')
     c = conn.cursor()
     c.execute('''
-        CREATE TABLE IF NOT EXISTS temperature_data (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        CREATE TABLE IF NOT EXISTS sensors (
+            id INTEGER PRIMARY KEY,
+            label TEXT NOT NULL UNIQUE
+        )
+    ''')
+    # Clustered on (sensor_id, ts): one sensor's samples over a time range are
+    # one contiguous run of the table, already in time order
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS samples (
+            sensor_id INTEGER NOT NULL REFERENCES sensors (id),
+            ts INTEGER NOT NULL,
             temperature REAL,
-            sensor_id INTEGER
+            cook_id INTEGER REFERENCES cooks (id),
+            PRIMARY KEY (sensor_id, ts)
+        ) WITHOUT ROWID
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_samples_ts ON samples (ts)')
+
+    # Cook sessions; samples read while a cook is active carry its id
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS cooks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            started_at REAL NOT NULL,
+            ended_at REAL
         )
     ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_cooks_started_at ON cooks (started_at)')
+    # Covers every per-cook query, so reading a cook never touches the table
+    # itself however much other data the database holds
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_samples_cook
+        ON samples (cook_id, sensor_id, ts, temperature)
+        WHERE cook_id IS NOT NULL
+    ''')
+
+    if legacy:
+        c.execute('INSERT OR IGNORE INTO sensors (label) SELECT DISTINCT CAST(sensor_id AS TEXT) FROM temperature_data')
+    for bucket_seconds, table in ROLLUP_TIERS:
+        exists = _table_exists(conn, table)
+        c.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                sensor_id INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                min_temperature REAL,
+                max_temperature REAL,
+                sum_temperature REAL,
+                count INTEGER,
+                PRIMARY KEY (sensor_id, bucket)
+            ) WITHOUT ROWID
+        ''')
+        c.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_bucket ON {table} (bucket)')
+        if exists:
+            continue
+        legacy_table = f'temperature_{table}'
+        if _table_exists(conn, legacy_table):
+            # Version 1 rollups were keyed by label; carry them over as they are
+            c.execute(f'INSERT OR IGNORE INTO sensors (label) SELECT DISTINCT sensor_id FROM {legacy_table}')
+            c.execute(f'''
+                INSERT INTO {table} (sensor_id, bucket, min_temperature, max_temperature, sum_temperature, count)
+                SELECT sensors.id, bucket, min_temperature, max_temperature, sum_temperature, count
+                FROM {legacy_table} JOIN sensors ON sensors.label = {legacy_table}.sensor_id
+            ''')
+            c.execute(f'DROP TABLE {legacy_table}')
+        elif legacy:
+            # Backfill a newly added tier from the version 1 rows, which the
+            # migration moves over without folding them into the rollups again
+            c.execute(f'''
+                INSERT INTO {table} (sensor_id, bucket, min_temperature, max_temperature, sum_temperature, count)
+                SELECT sensors.id, CAST(strftime('%s', timestamp) AS INTEGER) / ? * ? AS bucket,
+                       min(temperature), max(temperature), sum(temperature), count(temperature)
+                FROM temperature_data JOIN sensors ON sensors.label = CAST(temperature_data.sensor_id AS TEXT)
+                WHERE temperature IS NOT NULL
+                GROUP BY sensors.id, bucket
+            ''', (bucket_seconds, bucket_seconds))
+        else:
+            backfill_rollup(conn, bucket_seconds, table)
+
+    # Version 1 stays the recorded version until its rows have all been moved
+    c.execute(f'PRAGMA user_version = {1 if legacy else SCHEMA_VERSION}')
     conn.commit()
     conn.close()
 
+def backfill_rollup(conn, bucket_seconds, table):
+    """
+    Fill a rollup tier from the samples table. Run once when a tier is added;
+    from then on it is kept up to date as batches are written.
+    """
+    conn.execute(f'''
+        INSERT INTO {table} (sensor_id, bucket, min_temperature, max_temperature, sum_temperature, count)
+        SELECT sensor_id, ts / 1000 / ? * ? AS bucket,
+               min(temperature), max(temperature), sum(temperature), count(temperature)
+        FROM samples
+        WHERE temperature IS NOT NULL
+        GROUP BY sensor_id, bucket
+    ''', (bucket_seconds, bucket_seconds))
+
+def sensor_ids(conn, labels, cache=None):
+    """
+    Map sensor labels to their ids, adding labels seen for the first time to
+    the sensors table. The caller owns the transaction.
+
+    :param labels: Iterable of sensor labels.
+    :param cache: Optional dict of known label ids, updated in place.
+    :return: Dict mapping each label to its id.
+    """
+    cache = {} if cache is None else cache
+    missing = {str(label) for label in labels} - cache.keys()
+    for label in missing:
+        conn.execute('INSERT OR IGNORE INTO sensors (label) VALUES (?)', (label,))
+        cache[label] = conn.execute('SELECT id FROM sensors WHERE label = ?', (label,)).fetchone()[0]
+    return cache
+
+def _rollup_rows(rows, bucket_seconds):
+    """Aggregate (ts_ms, temperature, sensor_id, cook_id) rows into rollup rows for one tier."""
+    buckets = {}
+    for ts, temp, sensor_id, _ in rows:
+        key = (sensor_id, ts // 1000 // bucket_seconds * bucket_seconds)
+        current = buckets.get(key)
+        if current is None:
+            buckets[key] = [temp, temp, temp, 1]
+        else:
+            if temp < current[0]:
+                current[0] = temp
+            if temp > current[1]:
+                current[1] = temp
+            current[2] += temp
+            current[3] += 1
+    return [(sensor_id, bucket, *values) for (sensor_id, bucket), values in buckets.items()]
+
+def write_temperature_rows(conn, rows, cache=None):
+    """
+    Insert (epoch, temperature, label, cook_id) rows and fold the inserted ones
+    into every rollup tier. The caller owns the transaction.
+
+    A sensor keeps the first sample written for a millisecond; later rows for
+    it, in this batch or a later one, are dropped rather than counted twice in
+    the rollups.
+
+    :param cache: Optional dict of known label ids, as for sensor_ids().
+    """
+    ids = sensor_ids(conn, [row[2] for row in rows], cache)
+    inserted = []
+    for epoch, temp, label, cook_id in rows:
+        row = (int(round(epoch * 1000)), temp, ids[str(label)], cook_id)
+        cursor = conn.execute('INSERT OR IGNORE INTO samples (ts, temperature, sensor_id, cook_id) VALUES (?, ?, ?, ?)', row)
+        if cursor.rowcount and temp is not None:
+            inserted.append(row)
+    rows = inserted
+    for bucket_seconds, table in ROLLUP_TIERS:
+        conn.executemany(f'''
+            INSERT INTO {table} (sensor_id, bucket, min_temperature, max_temperature, sum_temperature, count)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (sensor_id, bucket) DO UPDATE SET
+                min_temperature = min(min_temperature, excluded.min_temperature),
+                max_temperature = max(max_temperature, excluded.max_temperature),
+                sum_temperature = sum_temperature + excluded.sum_temperature,
+                count = count + excluded.count
+        ''', _rollup_rows(rows, bucket_seconds))
+
 def insert_temperature_data(temp, sensor_id):
     """Insert a new temperature record into the database."""
-    conn = sqlite3.connect('database.db')
-    c = conn.cursor()
-    c.execute('INSERT INTO temperature_data (temperature, sensor_id) VALUES (?, ?)', (temp, sensor_id))
-    conn.commit()
+    conn = sqlite3.connect(DATABASE_PATH)
+    with conn:
+        write_temperature_rows(conn, [(time.time(), temp, sensor_id, None)])
     conn.close()
     logging.info("Inserted temperature data: %s for sensor_id: %s", temp, sensor_id)  # Use lazy % formatting
 
-def get_last_24_hours_temperature_data():
+class TemperatureWriter:
+    """
+    A write-behind writer that batches temperature rows onto one long-lived
+    connection from a dedicated thread.
+
+    Rows are queued by submit() and written with executemany in a single
+    transaction once `batch_size` rows are pending or `flush_interval` seconds
+    have passed, whichever comes first.
+    """
+
+    _STOP = object()
+
+    def __init__(self, db_path=None, batch_size=500, flush_interval=5.0, max_queue=10000):
+        """
+        Initializes the writer.
+
+        :param db_path: Path to the SQLite database, defaults to DATABASE_PATH.
+        :param batch_size: Number of pending rows that triggers a flush.
+        :param flush_interval: Maximum time in seconds a row waits before being flushed.
+        :param max_queue: Maximum number of queued rows; further rows are dropped.
+        """
+        self.db_path = db_path or DATABASE_PATH
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._sensor_ids = {}
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+
+    def start(self):
+        """
+        Starts the writer thread.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='temperature-writer', daemon=True)
+            self._thread.start()
+
+    def submit(self, temp, sensor_id, timestamp=None, cook_id=None):
+        """
+        Queues a temperature row for writing without blocking.
+
+        :param temp: The temperature value.
+        :param sensor_id: The sensor label.
+        :param timestamp: Epoch time of the reading, defaults to now.
+        :param cook_id: ID of the cook the reading belongs to, if any.
+        :return: True if the row was queued, False if the queue was full.
+        """
+        row = (timestamp if timestamp is not None else time.time(), temp, sensor_id, cook_id)
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            ROWS_DROPPED.inc()
+            logging.warning("Temperature write queue full, dropped reading for %s", sensor_id)
+            return False
+
+    def queue_depth(self):
+        """
+        Returns the number of rows waiting to be written.
+        """
+        return self._queue.qsize()
+
+    def close(self, timeout=None):
+        """
+        Flushes everything still queued, then stops the writer thread.
+
+        :param timeout: Maximum time in seconds to wait for the thread to finish.
+        """
+        if self._thread is None:
+            return
+        self._queue.put(self._STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path)
+        # synchronous=NORMAL is durable across application crashes in WAL mode
+        # and only syncs on checkpoints, which is what saves the SD card.
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        batch = []
+        deadline = None
+        try:
+            while True:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    row = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    row = None
+
+                if row is self._STOP:
+                    break
+                if row is not None:
+                    batch.append(row)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flush_interval
+
+                if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                    self._flush(conn, batch)
+                    batch = []
+                    deadline = None
+
+            # Drain whatever was queued before the stop request.
+            while True:
+                try:
+                    row = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if row is not self._STOP:
+                    batch.append(row)
+            if batch:
+                self._flush(conn, batch)
+        finally:
+            conn.close()
+
+    def _flush(self, conn, batch):
+        start = time.perf_counter()
+        try:
+            with conn:
+                write_temperature_rows(conn, batch, self._sensor_ids)
+            FLUSH_SECONDS.observe(time.perf_counter() - start)
+            ROWS_WRITTEN.inc(len(batch))
+            logging.debug("Flushed %d temperature rows", len(batch))
+        except sqlite3.Error as e:
+            # The ids added in the failed transaction were rolled back with it
+            self._sensor_ids.clear()
+            logging.error("Error writing %d temperature rows: %s", len(batch), e)
+
+class SchemaMigration:
+    """
+    Moves the rows of a version 1 `temperature_data` table into `samples` in
+    small transactions on a background thread, newest first so recent history
+    is back within seconds, while the app keeps sampling into `samples`.
+
+    Each batch is copied and deleted from the old table in one transaction, so
+    the migration resumes where it stopped after a restart. When the old table
+    is empty it is dropped and the schema version is set to 2.
+    """
+
+    def __init__(self, db_path=None, batch_size=2000, batch_pause=0.05):
+        """
+        Initializes the migration.
+
+        :param db_path: Path to the SQLite database, defaults to DATABASE_PATH.
+        :param batch_size: Rows moved per transaction.
+        :param batch_pause: Time in seconds the writer gets between two transactions.
+        """
+        self.db_path = db_path or DATABASE_PATH
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def pending(self):
+        """
+        Checks whether the database still holds version 1 rows.
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return _table_exists(conn, 'temperature_data')
+        finally:
+            conn.close()
+
+    def start(self):
+        """
+        Starts the migration thread.
+        """
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self.run, name='schema-migration', daemon=True)
+            self._thread.start()
+
+    def close(self, timeout=None):
+        """
+        Stops the migration after its current batch.
+
+        :param timeout: Maximum time in seconds to wait for the thread to finish.
+        """
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def run(self):
+        """
+        Moves every version 1 row, then drops the old table. Blocks until done or closed.
+        """
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute('PRAGMA synchronous=NORMAL')
+        try:
+            if not _table_exists(conn, 'temperature_data'):
+                return
+            columns = [column[1] for column in conn.execute('PRAGMA table_info(temperature_data)')]
+            cook_id = 'cook_id' if 'cook_id' in columns else 'NULL'
+            select = f'''
+                SELECT id, CAST(strftime('%s', timestamp) AS INTEGER) * 1000, temperature,
+                       CAST(sensor_id AS TEXT), {cook_id}
+                FROM temperature_data ORDER BY id DESC LIMIT ?
+            '''
+            logging.info("Moving version 1 temperature rows to the samples table")
+            ids = {}
+            moved = 0
+            while not self._stopping.is_set():
+                rows = conn.execute(select, (self.batch_size,)).fetchall()
+                if not rows:
+                    with conn:
+                        conn.execute('DROP TABLE temperature_data')
+                        conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+                    logging.info("Schema migration finished; moved %d rows", moved)
+                    return
+                with conn:
+                    sensor_ids(conn, [row[3] for row in rows], ids)
+                    # Version 1 timestamps have second resolution, so a sensor read
+                    # more than once a second keeps one sample per second
+                    conn.executemany(
+                        'INSERT OR IGNORE INTO samples (sensor_id, ts, temperature, cook_id) VALUES (?, ?, ?, ?)',
+                        [(ids[label], ts, temperature, cook) for _, ts, temperature, label, cook in rows]
+                    )
+                    # The rollups already hold these rows; init_db() carried them over
+                    conn.execute('DELETE FROM temperature_data WHERE id >= ?', (rows[-1][0],))
+                moved += len(rows)
+                ROWS_MIGRATED.inc(len(rows))
+                self._stopping.wait(self.batch_pause)
+        except sqlite3.Error as e:
+            logging.error("Error migrating temperature rows: %s", e)
+        finally:
+            conn.close()
+
+class ReadPool:
+    """
+    Runs database reads on a small pool of threads, each holding one long-lived
+    read-only connection, so a long query never stalls the event loop and at
+    most `size` reads hit the disk at once.
+
+    Connections live as long as the pool, so sqlite3's per-connection statement
+    cache keeps every query prepared after its first run.
+    """
+
+    def __init__(self, db_path=None, size=2):
+        """
+        Initializes the pool.
+
+        :param db_path: Path to the SQLite database, defaults to DATABASE_PATH.
+        :param size: Number of reader threads and connections.
+        """
+        self.db_path = db_path or DATABASE_PATH
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='db-read')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = connect_read_only(self.db_path, check_same_thread=False)
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _call(self, name, func, args, kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, conn=self._connection(), **kwargs)
+        finally:
+            DB_READ_SECONDS.labels(name).observe(time.perf_counter() - start)
+
+    async def run(self, name, func, *args, **kwargs):
+        """
+        Run a read function of this module on a pooled connection.
+
+        :param name: Name of the query, the `query` label of its read time metric.
+        :param func: A function taking a `conn` keyword argument, e.g. get_cook.
+        :return: What `func` returns.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._call, name, func, args, kwargs)
+
+    async def iterate(self, name, func, **kwargs):
+        """
+        Run a paged read such as get_temperature_chunk() one page at a time,
+        yielding the rows of each. Every page is a read of its own, so a long
+        export holds neither a connection nor a read transaction between pages.
+
+        :param name: Name of the query, as for run().
+        :param func: A function taking `after` and `conn` keyword arguments and
+                     returning (rows, after), where after is None on the last page.
+        """
+        after = None
+        while True:
+            rows, after = await self.run(name, func, after=after, **kwargs)
+            if rows:
+                yield rows
+            if after is None:
+                return
+
+    def close(self):
+        """
+        Waits for running reads and closes every connection.
+        """
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+def select_rollup_tier(resolution):
+    """
+    Pick the coarsest rollup tier whose buckets are no wider than `resolution`.
+
+    :param resolution: Desired spacing between points in seconds, or None for raw data.
+    :return: The (bucket_seconds, table) tier, or None if raw rows are needed.
+    """
+    tier = None
+    if resolution:
+        for candidate in ROLLUP_TIERS:
+            if candidate[0] <= resolution:
+                tier = candidate
+    return tier
+
+def get_last_24_hours_temperature_data(resolution=None):
     """Retrieve temperature data from the last 24 hours."""
-    conn = sqlite3.connect('database.db')
-    c = conn.cursor()
-    c.execute('''
-        SELECT timestamp, temperature, sensor_id
-        FROM temperature_data 
-        WHERE timestamp >= datetime('now', '-24 hours') 
-        ORDER BY timestamp ASC
-    ''')
-    data = c.fetchall()
-    conn.close()
+    return get_temperature_data_by_range(24 * 60, resolution)
+
+def get_temperature_data_by_range(time_range, resolution=None, conn=None):
+    """
+    Retrieve temperature data within the last `time_range` minutes.
+
+    When `resolution` (seconds between points) is given, rows are read from the
+    coarsest rollup tier that still meets it, with the bucket average as the
+    temperature, instead of from the raw table. Either way each sensor's rows
+    are one range scan of its clustered key.
+
+    :return: List of (ts_ms, temperature, label) rows ordered by sensor, then time.
+    """
+    with read_connection(conn) as conn:
+        cursor = conn.cursor()
+
+        end_ms = int(time.time() * 1000)
+        start_ms = end_ms - int(time_range * 60 * 1000)
+
+        tier = select_rollup_tier(resolution)
+        # CROSS JOIN keeps sensors as the outer loop, so samples is read by its key
+        if tier is None:
+            query = """
+            SELECT samples.ts, samples.temperature, sensors.label
+            FROM sensors CROSS JOIN samples ON samples.sensor_id = sensors.id
+            WHERE samples.ts >= ? AND samples.ts <= ?
+            ORDER BY sensors.id, samples.ts
+            """
+            params = (start_ms, end_ms)
+        else:
+            bucket_seconds, table = tier
+            query = f"""
+            SELECT r.bucket * 1000, r.sum_temperature / r.count, sensors.label
+            FROM sensors CROSS JOIN {table} AS r ON r.sensor_id = sensors.id
+            WHERE r.bucket >= ? AND r.bucket <= ?
+            ORDER BY sensors.id, r.bucket
+            """
+            params = (start_ms // 1000 // bucket_seconds * bucket_seconds, end_ms // 1000)
+
+        cursor.execute(query, params)
+        data = cursor.fetchall()
+
+    return data
+
+def get_temperature_data_since(since_ms, conn=None):
+    """
+    Retrieve raw temperature rows read after a cursor.
+
+    :param since_ms: Cursor as epoch milliseconds; rows read strictly after it are returned.
+    :return: List of (ts_ms, temperature, label) rows ordered by sensor, then time.
+    """
+    with read_connection(conn) as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT samples.ts, samples.temperature, sensors.label
+            FROM sensors CROSS JOIN samples ON samples.sensor_id = sensors.id
+            WHERE samples.ts > ?
+            ORDER BY sensors.id, samples.ts
+        ''', (since_ms,))
+        data = cursor.fetchall()
     return data
 
-def get_temperature_data_by_range(time_range, timezone):
-    """Retrieve temperature data within a specified time range and timezone."""
-    conn = sqlite3.connect('database.db')
-    cursor = conn.cursor()
+def get_temperature_chunk(start_ms=None, end_ms=None, cook_id=None, chunk_size=1000, after=None, conn=None):
+    """
+    Read one page of stored temperature rows, for exports of any size.
+
+    Pages are keyed on the last row of the previous page rather than an
+    offset, so each page is a short index range scan however far into the
+    export it is.
+
+    :param start_ms: Only rows read at or after this epoch time in milliseconds.
+    :param end_ms: Only rows read at or before this epoch time in milliseconds.
+    :param cook_id: Only rows of this cook, ordered by sensor then time.
+    :param chunk_size: Rows per page.
+    :param after: The key returned with the previous page, or None for the first.
+    :return: (rows, after): a list of (timestamp, label, temperature, cook_id)
+             rows, with ISO 8601 UTC timestamps, and the key of the next page,
+             or None if this was the last one.
+    """
+    # A cook is read in its covering index's order, anything else in time order
+    order = 'samples.sensor_id, samples.ts' if cook_id is not None else 'samples.ts, samples.sensor_id'
+    conditions, params = [], []
+    if after is not None:
+        conditions.append(f'({order}) > (?, ?)')
+        params.extend(after)
+    if cook_id is not None:
+        conditions.append('samples.cook_id = ?')
+        params.append(cook_id)
+    if start_ms is not None:
+        conditions.append('samples.ts >= ?')
+        params.append(start_ms)
+    if end_ms is not None:
+        conditions.append('samples.ts <= ?')
+        params.append(end_ms)
+    where = ' AND '.join(conditions) or '1'
+    with read_connection(conn) as conn:
+        rows = conn.execute(f"""
+            SELECT strftime('%Y-%m-%dT%H:%M:%fZ', samples.ts / 1000.0, 'unixepoch'), sensors.label,
+                   samples.temperature, samples.cook_id, {order}
+            FROM samples JOIN sensors ON sensors.id = samples.sensor_id
+            WHERE {where}
+            ORDER BY {order}
+            LIMIT ?
+        """, params + [chunk_size]).fetchall()
+    after = rows[-1][4:] if len(rows) == chunk_size else None
+    return [row[:4] for row in rows], after
+
+def get_latest_temperature_timestamp(conn=None):
+    """
+    Retrieve the read time of the newest stored temperature row.
+
+    :return: Epoch milliseconds, or None if there are no rows.
+    """
+    with read_connection(conn) as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT max(ts) FROM samples')
+        latest = cursor.fetchone()[0]
+    return latest
 
-    # Calculate the start time based on the time range
-    end_time = datetime.now(timezone)
-    start_time = end_time - timedelta(minutes=time_range)
+def _cook_dict(row):
+    cook_id, name, started_at, ended_at = row
+    return {'id': cook_id, 'name': name, 'started_at': started_at, 'ended_at': ended_at,
+            'active': ended_at is None}
 
-    # Example SQL query to fetch data including sensor_id
-    query = """
-    SELECT timestamp, temperature, sensor_id
-    FROM temperature_data
-    WHERE timestamp >= ? AND timestamp <= ?
-    ORDER BY timestamp ASC
+def start_cook(name, started_at=None):
     """
-    # Execute the query and fetch the data
-    cursor.execute(query, (start_time, end_time))
-    data = cursor.fetchall()
+    Start a cook session, ending the one that is still active, if any.
 
-    # Close the database connection
+    :param name: Name of the cook, e.g. "Brisket".
+    :param started_at: Epoch time the cook started, defaults to now.
+    :return: The new cook as a dict.
+    """
+    started_at = time.time() if started_at is None else started_at
+    conn = sqlite3.connect(DATABASE_PATH)
+    with conn:
+        conn.execute('UPDATE cooks SET ended_at = ? WHERE ended_at IS NULL', (started_at,))
+        cook_id = conn.execute('INSERT INTO cooks (name, started_at) VALUES (?, ?)', (name, started_at)).lastrowid
     conn.close()
+    logging.info("Started cook %d: %s", cook_id, name)
+    return _cook_dict((cook_id, name, started_at, None))
+
+def end_cook(ended_at=None):
+    """
+    End the active cook session.
+
+    :param ended_at: Epoch time the cook ended, defaults to now.
+    :return: The ended cook as a dict, or None if no cook was active.
+    """
+    cook = get_active_cook()
+    if cook is None:
+        return None
+    cook['ended_at'] = time.time() if ended_at is None else ended_at
+    cook['active'] = False
+    conn = sqlite3.connect(DATABASE_PATH)
+    with conn:
+        conn.execute('UPDATE cooks SET ended_at = ? WHERE id = ?', (cook['ended_at'], cook['id']))
+    conn.close()
+    logging.info("Ended cook %d", cook['id'])
+    return cook
+
+def get_active_cook(conn=None):
+    """
+    Retrieve the cook session that has not ended.
+
+    :return: The cook as a dict, or None.
+    """
+    with read_connection(conn) as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id, name, started_at, ended_at FROM cooks
+            WHERE ended_at IS NULL ORDER BY started_at DESC LIMIT 1
+        ''')
+        row = cursor.fetchone()
+    return _cook_dict(row) if row is not None else None
+
+def get_cook(cook_id, conn=None):
+    """
+    Retrieve one cook session.
+
+    :return: The cook as a dict, or None if there is no such cook.
+    """
+    with read_connection(conn) as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT id, name, started_at, ended_at FROM cooks WHERE id = ?', (cook_id,))
+        row = cursor.fetchone()
+    return _cook_dict(row) if row is not None else None
+
+def list_cooks(limit=50, before=None, conn=None):
+    """
+    Retrieve cook sessions, newest first.
 
+    :param limit: Maximum number of cooks to return.
+    :param before: Only return cooks that started before this epoch time, for paging.
+    :return: List of cook dicts.
+    """
+    with read_connection(conn) as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id, name, started_at, ended_at FROM cooks
+            WHERE started_at < ? ORDER BY started_at DESC LIMIT ?
+        ''', (before if before is not None else float('inf'), limit))
+        cooks = [_cook_dict(row) for row in cursor.fetchall()]
+    return cooks
+
+def get_cook_data(cook_id, sensor_id=None, conn=None):
+    """
+    Retrieve the temperature rows of one cook from its covering index.
+
+    :param cook_id: The cook ID.
+    :param sensor_id: Only return rows of this sensor label.
+    :return: List of (ts_ms, temperature, label) rows ordered by sensor, then time.
+    """
+    with read_connection(conn) as conn:
+        cursor = conn.cursor()
+        if sensor_id is None:
+            cursor.execute('''
+                SELECT samples.ts, samples.temperature, sensors.label
+                FROM samples JOIN sensors ON sensors.id = samples.sensor_id
+                WHERE samples.cook_id = ? ORDER BY samples.sensor_id, samples.ts
+            ''', (cook_id,))
+        else:
+            cursor.execute('''
+                SELECT samples.ts, samples.temperature, sensors.label
+                FROM samples JOIN sensors ON sensors.id = samples.sensor_id
+                WHERE samples.cook_id = ? AND sensors.label = ? ORDER BY samples.ts
+            ''', (cook_id, sensor_id))
+        data = cursor.fetchall()
     return data
 
+def get_cook_summary(cook_id, conn=None):
+    """
+    Summarize each sensor's temperatures over one cook from its covering index.
+
+    :return: List of dicts with the sensor label, sample count, minimum, maximum
+             and average temperature, and the first and last read time in epoch ms.
+    """
+    with read_connection(conn) as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT sensors.label, count(temperature), min(temperature), max(temperature), avg(temperature),
+                   min(ts), max(ts)
+            FROM samples JOIN sensors ON sensors.id = samples.sensor_id
+            WHERE samples.cook_id = ?
+            GROUP BY samples.sensor_id
+        ''', (cook_id,))
+        summary = [
+            {'label': label, 'samples': samples, 'min': minimum, 'max': maximum, 'average': average,
+             'first': first, 'last': last}
+            for label, samples, minimum, maximum, average, first, last in cursor.fetchall()
+        ]
+    return summary
+
 if __name__ == '__main__':
     init_db()
 
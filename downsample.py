@@ -0,0 +1,103 @@
+"""
+This module provides server-side downsampling of temperature history for the
+charts using the Largest-Triangle-Three-Buckets (LTTB) algorithm.
+"""
+
+import numpy as np
+
+
+def lttb_indices(x, y, threshold):
+    """
+    Select the indices of the points to keep when downsampling a series with LTTB.
+
+    The first and last points are always kept. The points in between are split
+    into threshold - 2 buckets and from each bucket the point forming the
+    largest triangle with the previously kept point and the average of the next
+    bucket is kept. Only the walk over buckets is a Python loop; bucket averages
+    and triangle areas are computed with NumPy.
+
+    :param x: Monotonically increasing x values (e.g. epoch milliseconds).
+    :param y: The y values, same length as x.
+    :param threshold: Number of points to keep.
+    :return: A NumPy array of indices into x and y.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # Bucket boundaries over the interior points 1 .. n-2
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    starts = edges[:-1]
+    ends = edges[1:]
+
+    # Average of every bucket at once from cumulative sums
+    x_sums = np.concatenate(([0.0], np.cumsum(x)))
+    y_sums = np.concatenate(([0.0], np.cumsum(y)))
+    counts = ends - starts
+    avg_x = (x_sums[ends] - x_sums[starts]) / counts
+    avg_y = (y_sums[ends] - y_sums[starts]) / counts
+    # The point after the last bucket is the final point of the series
+    next_x = np.append(avg_x[1:], x[-1])
+    next_y = np.append(avg_y[1:], y[-1])
+
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = starts[i], ends[i]
+        ax, ay = x[a], y[a]
+        # Twice the triangle area; the factor does not change the argmax
+        areas = np.abs(
+            (ax - next_x[i]) * (y[start:end] - ay) - (ax - x[start:end]) * (next_y[i] - ay)
+        )
+        a = start + int(np.argmax(areas))
+        indices[i + 1] = a
+    return indices
+
+
+def downsample_series(timestamps, temperatures, threshold=None):
+    """
+    Downsample one sensor's series to at most `threshold` points.
+
+    :param timestamps: Epoch milliseconds in time order (any array-like).
+    :param temperatures: The matching temperatures.
+    :param threshold: Maximum number of points, or None to keep every point.
+    :return: A (timestamps, temperatures) tuple of lists, temperatures rounded
+             to two decimals to keep the payload small.
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    temperatures = np.asarray(temperatures, dtype=np.float64)
+    if threshold is not None:
+        keep = lttb_indices(timestamps, temperatures, threshold)
+        timestamps, temperatures = timestamps[keep], temperatures[keep]
+    return timestamps.tolist(), np.round(temperatures, 2).tolist()
+
+
+def rows_to_series(rows, threshold=None):
+    """
+    Group (ts_ms, temperature, label) rows into per-sensor columnar arrays,
+    each downsampled to at most `threshold` points.
+
+    :param rows: Rows as returned by database.get_temperature_data_by_range.
+    :param threshold: Maximum number of points per sensor, or None to keep every point.
+    :return: Dict mapping sensor label to a (timestamps, temperatures) tuple of
+             lists, with timestamps in epoch milliseconds.
+    """
+    if not rows:
+        return {}
+
+    timestamps, temperatures, labels = zip(*rows)
+    timestamps = np.array(timestamps, dtype=np.int64)
+    temperatures = np.array(temperatures, dtype=np.float64)
+    labels = np.array([str(label) for label in labels])
+    valid = ~np.isnan(temperatures)
+
+    series = {}
+    unique_labels, inverse = np.unique(labels, return_inverse=True)
+    for i, label in enumerate(unique_labels):
+        mask = (inverse == i) & valid
+        series[str(label)] = downsample_series(timestamps[mask], temperatures[mask], threshold)
+    return series
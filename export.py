@@ -0,0 +1,58 @@
+"""
+This module streams stored temperature rows as gzip-compressed CSV or NDJSON.
+
+Rows are pulled from the database a chunk at a time on the read pool and
+compressed as they go, so an export of any size holds one chunk in memory.
+"""
+
+import csv
+import io
+import json
+import zlib
+
+# Export formats as (content type of the uncompressed data, file extension)
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+COLUMNS = ('timestamp', 'sensor', 'temperature', 'cook_id')
+
+
+def encode_rows(rows, export_format):
+    """
+    Encode (timestamp, sensor, temperature, cook_id) rows in an export format.
+
+    :param rows: The rows of one chunk.
+    :param export_format: 'csv' or 'ndjson'.
+    :return: The encoded rows as bytes.
+    """
+    if export_format == 'csv':
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator='\n').writerows(rows)
+        return buffer.getvalue().encode('utf-8')
+    return ''.join(
+        json.dumps(dict(zip(COLUMNS, row)), separators=(',', ':')) + '\n' for row in rows
+    ).encode('utf-8')
+
+
+async def gzip_export(chunks, export_format):
+    """
+    Compress chunks of rows into a gzip stream without blocking the event loop.
+
+    :param chunks: Async iterator yielding lists of rows, e.g. database.ReadPool.iterate()
+                   over database.get_temperature_chunk().
+    :param export_format: 'csv' or 'ndjson'.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 writes a gzip header
+    try:
+        if export_format == 'csv':
+            yield compressor.compress(encode_rows([COLUMNS], export_format))
+        async for rows in chunks:
+            data = compressor.compress(encode_rows(rows, export_format))
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        # Also runs when the client disconnects mid-export, so no further page is read
+        await chunks.aclose()
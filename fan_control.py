@@ -2,21 +2,29 @@
 This module provides a FanController class to manage fan operations based on temperature.
 """
 
-import digitalio
-import board
-
 class FanController:
     """
     A class to control a fan based on the target temperature.
     """
 
-    def __init__(self, fan_pin, target_temperature):
+    def __init__(self, fan_pin, target_temperature, output=None):
         """
         Initializes the FanController with a specified pin and target temperature.
 
         :param fan_pin: The pin number or name where the fan is connected.
         :param target_temperature: The temperature at which the fan should turn on.
+        :param output: An object with a boolean `value` to drive instead of the
+                       GPIO pin, e.g. a simulated fan.
         """
+        self.target_temperature = target_temperature
+        if output is not None:
+            self.fan = output
+            return
+
+        # Only touch the GPIO libraries when driving a real pin
+        import digitalio
+        import board
+
         if isinstance(fan_pin, str):
             self.fan = digitalio.DigitalInOut(getattr(board, fan_pin))
         elif isinstance(fan_pin, int):
@@ -28,7 +36,6 @@ class FanController:
         else:
             raise ValueError(f"Invalid fan_pin type: {type(fan_pin)}. Expected str or int.")
         self.fan.direction = digitalio.Direction.OUTPUT
-        self.target_temperature = target_temperature
 
     def update(self, current_temperature):
         """
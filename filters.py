@@ -0,0 +1,260 @@
+"""
+This module provides streaming filters that smooth sensor readings between
+the raw read and the snapshot.
+
+Each stage keeps a fixed amount of state, allocated when it is created, and
+does a bounded amount of work per sample: constant for the EMA and Kalman
+stages, and a memmove of at most MAX_MEDIAN_WINDOW values for the median.
+Stages are chained per sensor from the configuration, e.g.
+
+    filters:
+      - {type: median, window: 5}   # Rejects single-read spikes and dropouts
+      - {type: ema, alpha: 0.3}
+      - {type: kalman, process_noise: 0.01, measurement_noise: 0.5}
+"""
+
+import bisect
+import logging
+import math
+
+# Label the raw values of a sensor are stored under when they are kept
+RAW_LABEL = '{}:raw'
+
+# Largest median window; keeping the window sorted costs time in proportion to it
+MAX_MEDIAN_WINDOW = 51
+
+
+class MedianFilter:
+    """
+    Median of the last `window` samples. A spike or dropout shorter than half
+    the window never reaches the output. Over an even number of samples, as
+    while the window fills, the lower of the two middle samples is returned,
+    so the output is always a value that was actually read.
+    """
+
+    def __init__(self, window=5):
+        """
+        Initializes the filter.
+
+        :param window: Number of samples the median is taken over, from 1 to MAX_MEDIAN_WINDOW.
+        """
+        if not 1 <= window <= MAX_MEDIAN_WINDOW:
+            raise ValueError(f"median window must be between 1 and {MAX_MEDIAN_WINDOW}")
+        self.window = int(window)
+        self._ring = [0.0] * self.window
+        self._sorted = []
+        self._next = 0
+
+    def update(self, value):
+        """Adds a sample and returns the (lower) median of the samples held."""
+        if len(self._sorted) == self.window:
+            # Drop the oldest sample before its slot is reused
+            del self._sorted[bisect.bisect_left(self._sorted, self._ring[self._next])]
+        self._ring[self._next] = value
+        self._next = (self._next + 1) % self.window
+        bisect.insort(self._sorted, value)
+        return self._sorted[(len(self._sorted) - 1) // 2]
+
+    def reset(self):
+        """Forgets every sample."""
+        self._sorted.clear()
+        self._next = 0
+
+
+class EmaFilter:
+    """
+    Exponential moving average; each sample moves the output `alpha` of the
+    way towards it.
+    """
+
+    def __init__(self, alpha=0.3):
+        """
+        Initializes the filter.
+
+        :param alpha: Smoothing factor between 0 (frozen) and 1 (no smoothing).
+        """
+        if not 0 < alpha <= 1:
+            raise ValueError("ema alpha must be in (0, 1]")
+        self.alpha = float(alpha)
+        self._value = None
+
+    def update(self, value):
+        """Adds a sample and returns the average."""
+        if self._value is None:
+            self._value = value
+        else:
+            self._value += self.alpha * (value - self._value)
+        return self._value
+
+    def reset(self):
+        """Forgets the average."""
+        self._value = None
+
+
+class KalmanFilter:
+    """
+    One-dimensional Kalman filter for a slowly drifting temperature read
+    through a noisy sensor.
+    """
+
+    def __init__(self, process_noise=0.01, measurement_noise=0.5):
+        """
+        Initializes the filter.
+
+        :param process_noise: Variance the true temperature drifts by between two samples.
+        :param measurement_noise: Variance of the sensor's read noise.
+        """
+        if process_noise < 0 or measurement_noise <= 0:
+            raise ValueError("kalman noise variances must be positive")
+        self.process_noise = float(process_noise)
+        self.measurement_noise = float(measurement_noise)
+        self._estimate = None
+        self._error = 0.0
+
+    def update(self, value):
+        """Adds a sample and returns the new estimate."""
+        if self._estimate is None:
+            self._estimate = value
+            self._error = self.measurement_noise
+            return value
+        error = self._error + self.process_noise
+        gain = error / (error + self.measurement_noise)
+        self._estimate += gain * (value - self._estimate)
+        self._error = (1 - gain) * error
+        return self._estimate
+
+    def reset(self):
+        """Forgets the estimate."""
+        self._estimate = None
+        self._error = 0.0
+
+
+FILTER_TYPES = {
+    'median': MedianFilter,
+    'ema': EmaFilter,
+    'kalman': KalmanFilter,
+}
+
+
+class FilterChain:
+    """
+    Stages applied one after the other to the samples of one sensor.
+    """
+
+    def __init__(self, stages=()):
+        """
+        Initializes the chain.
+
+        :param stages: Filter objects with update() and reset() methods.
+        """
+        self.stages = tuple(stages)
+
+    @classmethod
+    def from_config(cls, spec):
+        """
+        Build a chain from a list of stage settings.
+
+        :param spec: List of dicts, each with a `type` from FILTER_TYPES and
+                     the keyword arguments of that filter.
+        :raises ValueError: If a stage type or setting is invalid.
+        """
+        stages = []
+        for stage in spec or ():
+            settings = dict(stage)
+            kind = settings.pop('type', None)
+            if kind not in FILTER_TYPES:
+                raise ValueError(f"Unknown filter type {kind!r}; expected one of {', '.join(FILTER_TYPES)}")
+            try:
+                stages.append(FILTER_TYPES[kind](**settings))
+            except TypeError as e:
+                raise ValueError(f"Invalid {kind} filter settings: {e}") from None
+        return cls(stages)
+
+    def update(self, value):
+        """Runs a sample through every stage and returns the result."""
+        for stage in self.stages:
+            value = stage.update(value)
+        return value
+
+    def reset(self):
+        """Resets every stage."""
+        for stage in self.stages:
+            stage.reset()
+
+
+class SensorFilters:
+    """
+    The filter chain of every sensor, built from the configuration.
+
+    Sensors take their chain from their own `filters` setting, or from
+    `sampler.filters`, which also covers sensors that are not configured,
+    such as Meater probes. Chains keep their state across configuration
+    changes that leave their settings alone.
+    """
+
+    def __init__(self, config=None):
+        """
+        Initializes the filters.
+
+        :param config: The application configuration dict.
+        """
+        self.keep_raw = False
+        self.reset_after = None
+        self._default = []
+        self._specs = {}
+        self._chains = {}
+        self._last_seen = {}
+        if config is not None:
+            self.configure(config)
+
+    def configure(self, config):
+        """
+        Apply a new configuration, dropping the chains whose settings changed.
+
+        :param config: The application configuration dict.
+        """
+        sampler_config = config.get('sampler', {})
+        default = sampler_config.get('filters') or []
+        specs = {sensor['label']: sensor.get('filters', default) or []
+                 for sensor in config.get('sensors', []) if 'label' in sensor}
+        chains = {label: chain for label, chain in self._chains.items()
+                  if specs.get(label, default) == self._specs.get(label, self._default)}
+        self.keep_raw = sampler_config.get('keep_raw', False)
+        self.reset_after = sampler_config.get('filter_reset_after')
+        self._default = default
+        self._specs = specs
+        # Swapped in whole; the sampler thread may be filtering right now
+        self._chains = chains
+
+    def _chain(self, label):
+        chain = self._chains.get(label)
+        if chain is None:
+            try:
+                chain = FilterChain.from_config(self._specs.get(label, self._default))
+            except ValueError as e:
+                logging.error("Not filtering %s: %s", label, e)
+                chain = FilterChain()
+            self._chains[label] = chain
+        return chain
+
+    def apply(self, label, value, timestamp):
+        """
+        Filter one successful reading.
+
+        :param label: The sensor label.
+        :param value: The raw temperature.
+        :param timestamp: Epoch time of the read; after a gap longer than
+                          `sampler.filter_reset_after` seconds the chain starts over.
+        :return: (temperature, raw), where raw is the unfiltered temperature if
+                 it is kept and the sensor has any filters, else None.
+        """
+        if value is None or math.isnan(value):
+            return value, None
+        chain = self._chain(label)
+        if not chain.stages:
+            return value, None
+        last_seen = self._last_seen.get(label)
+        if self.reset_after is not None and last_seen is not None and timestamp - last_seen > self.reset_after:
+            chain.reset()
+        self._last_seen[label] = timestamp
+        return chain.update(value), value if self.keep_raw else None
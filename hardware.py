@@ -0,0 +1,159 @@
+"""
+This module provides the hardware backend that talks to the real sensors and
+fan through Adafruit Blinka on the Raspberry Pi.
+
+Driver modules are imported when the first sensor of their type is created, so
+only the drivers for the configured sensors are ever loaded.
+"""
+
+import importlib
+import weakref
+from contextlib import nullcontext
+from bus import SPIBusManager, pipelined_sweep
+
+def _driver_class(module_name, class_name):
+    """Import a driver module on first use and return one of its classes."""
+    return getattr(importlib.import_module(module_name), class_name)
+
+# Driver class of each SPI sensor type, as (module, class)
+SPI_DRIVERS = {
+    'MAX31865': ('adafruit_max31865', 'MAX31865'),
+    'MAX31855': ('adafruit_max31855', 'MAX31855'),
+    'MAX31856': ('adafruit_max31856', 'MAX31856'),
+}
+
+class HardwareBackend:
+    """
+    Creates and reads the physical sensors described in the configuration.
+    """
+
+    name = 'real'
+
+    def __init__(self):
+        self.spi_buses = SPIBusManager()
+        # The shared bus of each SPI sensor, so sweeps can take its lock
+        self._sensor_buses = weakref.WeakKeyDictionary()
+        # The name of the bus each sensor is on, so each bus gets its own read worker
+        self._bus_names = weakref.WeakKeyDictionary()
+        # The configured type of each sensor, so reads dispatch without the driver classes
+        self._sensor_types = weakref.WeakKeyDictionary()
+        # Pins and buses each sensor holds, released by release_sensor()
+        self._resources = weakref.WeakKeyDictionary()
+
+    def initialize_sensor(self, sensor_config):
+        """
+        Initializes a sensor based on its configuration.
+
+        :param sensor_config: The sensor's entry from the `sensors` list in config.yaml.
+        :return: The driver object for the sensor.
+        """
+        sensor_type = sensor_config['type']
+        chip_select_pin = sensor_config.get('chip_select_pin')
+
+        if sensor_type in SPI_DRIVERS:
+            import board
+            import digitalio
+            driver = _driver_class(*SPI_DRIVERS[sensor_type])
+            # All SPI sensors on a physical bus share one bus object
+            bus = self.spi_buses.get(sensor_config.get('spi_bus', 0))
+            cs_pin = getattr(board, chip_select_pin) if chip_select_pin else None
+            cs = digitalio.DigitalInOut(cs_pin) if cs_pin else None
+            with bus.lock:
+                if sensor_type == 'MAX31865':
+                    sensor = driver(bus.device, cs, rtd_nominal=100, ref_resistor=430.0)
+                    # Convert continuously so a read returns the latest result
+                    # instead of biasing the RTD and waiting ~75 ms for a one-shot
+                    sensor.auto_convert = True
+                else:
+                    sensor = driver(bus.device, cs)
+            self._sensor_buses[sensor] = bus
+            self._bus_names[sensor] = bus.name
+            if cs is not None:
+                self._resources[sensor] = [cs]
+        elif sensor_type == 'ADS1115':
+            import board
+            import busio
+            import adafruit_ads1x15.ads1115 as ADS
+            from adafruit_ads1x15.analog_in import AnalogIn
+            i2c = busio.I2C(board.SCL, board.SDA)
+            ads = ADS.ADS1115(i2c)
+            sensor = AnalogIn(ads, ADS.P0)  # Assuming we're using the first channel
+            self._bus_names[sensor] = 'i2c1'
+            self._resources[sensor] = [i2c]
+        elif sensor_type == 'DHT22':
+            import board
+            import adafruit_dht
+            pin = getattr(board, chip_select_pin) if chip_select_pin else board.D4  # Default to D4 if not specified
+            sensor = adafruit_dht.DHT22(pin)
+            # Each DHT22 is bit-banged on its own GPIO pin
+            self._bus_names[sensor] = f"gpio-{chip_select_pin or 'D4'}"
+        else:
+            raise ValueError(f"Unsupported sensor type: {sensor_type}")
+        self._sensor_types[sensor] = sensor_type
+        return sensor
+
+    def release_sensor(self, sensor):
+        """
+        Releases the chip select pin, I2C bus or GPIO a sensor holds. The
+        sensor must not be read afterwards.
+
+        :param sensor: A driver object returned by initialize_sensor().
+        """
+        bus = self._sensor_buses.get(sensor)
+        # Not in the middle of another sensor's transfer on the same bus
+        with bus.lock if bus is not None else nullcontext():
+            for resource in self._resources.pop(sensor, []):
+                resource.deinit()
+            if self._sensor_types.get(sensor) == 'DHT22':
+                sensor.exit()
+
+    def read_sensor(self, sensor, sensor_id):
+        """
+        Reads the temperature from a sensor, raising an exception if the read fails.
+
+        :param sensor: A driver object returned by initialize_sensor().
+        :param sensor_id: The sensor label, used in error messages.
+        :return: The temperature.
+        """
+        sensor_type = self._sensor_types.get(sensor)
+        if sensor_type in SPI_DRIVERS:
+            return sensor.temperature
+        elif sensor_type == 'ADS1115':
+            # Convert voltage to temperature for ADS1115
+            voltage = sensor.voltage
+            # Example conversion: assuming a linear relationship
+            # Replace with actual conversion logic for your sensor
+            return (voltage - 0.5) * 100  # Example for TMP36 sensor
+        elif sensor_type == 'DHT22':
+            return sensor.temperature
+        raise ValueError(f"Unsupported sensor type for {sensor_id}")
+
+    def read_sweep(self, sensors, results=None):
+        """
+        Reads a list of sensors, starting every MAX31856 conversion before
+        collecting any of them.
+
+        :param sensors: List of (sensor, label) tuples.
+        :param results: Optional list filled in as each read completes, as for pipelined_sweep().
+        :return: List of (temperature, timestamp, error) tuples in the same order.
+        """
+        return pipelined_sweep(sensors, self.read_sensor, self._bus_lock, results)
+
+    def bus_name(self, sensor):
+        """
+        Returns the name of the bus a sensor is on; sensors on different buses can be read in parallel.
+        """
+        return self._bus_names.get(sensor, 'default')
+
+    def _bus_lock(self, sensor):
+        bus = self._sensor_buses.get(sensor)
+        return bus.lock if bus is not None else None
+
+    def fan_output(self, fan_pin):
+        """
+        Returns the output the FanController should drive.
+
+        :param fan_pin: The fan pin from config.yaml.
+        :return: None, so that FanController drives the GPIO pin itself.
+        """
+        return None
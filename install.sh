@@ -98,7 +98,7 @@ if [ -f "requirements.txt" ]; then
 fi
 
 # Run Quart application
-hypercorn masterpi:app & 
+hypercorn "masterpi:create_app()" & 
 if [ $? -ne 0 ]; then
     echo "Failed to start Quart application"
     exit 1
@@ -1,39 +1,98 @@
+import time
+_import_started = time.perf_counter()
+
 import os
 import hmac
 import secrets
 import asyncio
 import logging
+import signal
+import traceback
+from contextlib import contextmanager
 from logging.handlers import RotatingFileHandler
 from quart_csrf import CSRFProtect
 from werkzeug.exceptions import BadRequest
 from pid_controller import PIDController
 from fan_control import FanController
-from database import init_db, insert_temperature_data
-import digitalio
-import board
-import aiohttp
-from meater import MeaterApi
-import nest_asyncio
-import adafruit_dht
-from hypercorn.asyncio import serve
-from hypercorn.config import Config as HypercornConfig
-import yaml
-import busio
-from adafruit_max31865 import MAX31865
-from adafruit_max31855 import MAX31855
-import adafruit_ads1x15.ads1115 as ADS
-from adafruit_ads1x15.analog_in import AnalogIn
-import aiofiles
-import time
-from quart import Quart, jsonify, request, render_template, send_from_directory, url_for
-from config import load_config, save_config
-from adafruit_max31856 import MAX31856
-
-# Initialize the global active_sensors list
+from database import (
+    DB_READ_SECONDS, init_db, TemperatureWriter, SchemaMigration, ReadPool, get_temperature_data_by_range,
+    get_temperature_data_since, get_latest_temperature_timestamp,
+    get_temperature_chunk, start_cook, end_cook, get_active_cook, get_cook, list_cooks, get_cook_data, get_cook_summary
+)
+from retention import RetentionJob
+from sampler import TemperatureSampler
+from filters import SensorFilters, RAW_LABEL
+from bus import ParallelSweeper, CircuitBreaker
+from control_loop import ControlLoop
+from metrics import registry, EventLoopLagMonitor
+from ring_buffer import RingBufferStore
+from stream import SnapshotBroadcaster, format_event
+from assets import AssetStore, IMMUTABLE, REVALIDATE
+from page_cache import PageCache, PAGE_CACHE_REQUESTS
+from shared_state import SharedStateWriter, SharedStateReader, serve_commands, send_command
+from quart import Quart, jsonify, request, render_template, send_from_directory, url_for, make_response, g, current_app
+from config import config_store
+
+# Create your Quart app. It is configured by create_app(); importing this
+# module has no side effects on the hardware, the database or the filesystem.
+# Static files are served by serve_static() from the built assets.
+app = Quart(__name__, static_folder=None)
+
+# Runtime state. The configuration is loaded by create_app(), everything else
+# is created by startup() when the app begins serving.
+config = None
+csrf = None
+hardware_backend = None
 active_sensors = []
-
-# Create your Quart app
-app = Quart(__name__)
+pid = None
+fan_controller = None
+read_deadlines = {}
+sampler_config = {}
+sweeper = None
+sampler = None
+sensor_filters = None
+control_loop = None
+temperature_writer = None
+retention_job = None
+schema_migration = None
+read_pool = None
+active_cook_id = None
+# Read time of the last reading of each sensor queued for writing
+stored_read_times = {}
+ring_buffers = None
+stream_config = {}
+broadcaster = None
+event_loop_lag = None
+aiohttp_session = None
+meater_api = None
+meater_poller = None
+static_assets = None
+# Rendered index and settings pages, re-rendered only when the configuration changes
+page_cache = PageCache()
+
+# Multi-worker serving: the hardware-owner process publishes its state through
+# shared_writer and takes commands on command_server; each web worker reads
+# that state through shared_state and has no hardware or control objects.
+worker_mode = False
+shared_state = None
+shared_writer = None
+command_server = None
+background_tasks = []
+
+# Duration in seconds of each startup phase, logged once the app is serving
+startup_timings = {}
+STARTUP_PHASE_SECONDS = registry.gauge(
+    'masterpi_startup_phase_seconds', 'Time taken by each phase of the last startup.', ['phase'])
+
+@contextmanager
+def startup_phase(name):
+    """Time one phase of startup."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_timings[name] = time.perf_counter() - start
+        STARTUP_PHASE_SECONDS.labels(name).set(startup_timings[name])
 
 class CustomCSRFProtect(CSRFProtect):
     def __init__(self, app=None):
@@ -65,202 +124,190 @@ def validate_csrf(data):
         current_app.logger.error("Error in validate_csrf: %s", e)
         return False
 
-# Set up CSRF protection
-csrf = CustomCSRFProtect(app)
-csrf._validate_csrf = validate_csrf
-
-# Add CSRF token to all templates
-@app.context_processor
 async def inject_csrf_token():
+    """Add a CSRF token to all templates."""
     return {'csrf_token': await csrf.generate_csrf()}
 
-def load_config_sync():
-    """Load configuration synchronously."""
-    config_path = os.path.join(app.root_path, 'config.yaml')
-    try:
-        with open(config_path, 'r', encoding='utf-8') as config_file:
-            config = yaml.safe_load(config_file)
-        app.logger.info("Loaded configuration: %s", config)
-        return config
-    except Exception as e:
-        app.logger.error("Error loading configuration: %s", e)
-        return None
-
-def save_config_sync(config):
-    """Save configuration synchronously."""
-    config_path = os.path.join(app.root_path, 'config.yaml')
-    try:
-        with open(config_path, 'w', encoding='utf-8') as config_file:
-            yaml.safe_dump(config, config_file)
-        app.logger.info("Saved configuration: %s", config)
-        
-        # Add a small delay to ensure file is written
-        time.sleep(0.1)
-        
-        # Verify the saved configuration
-        with open(config_path, 'r', encoding='utf-8') as config_file:
-            saved_config = yaml.safe_load(config_file)
-        app.logger.info("Verified saved configuration: %s", saved_config)
-        
-        if saved_config != config:
-            app.logger.error("Saved configuration does not match the intended configuration!")
-    except Exception as e:
-        app.logger.error("Error saving configuration: %s", e)
-
-async def load_config():
-    """Load configuration asynchronously."""
-    try:
-        async with aiofiles.open('config.yaml', 'r') as config_file:
-            print("Config file opened successfully")
-            config = yaml.safe_load(await config_file.read())
-            print("Config file loaded successfully")
-            return config
-    except FileNotFoundError:
-        print("Config file not found. Please ensure 'config.yaml' exists.")
-        return None
-    except yaml.YAMLError as e:
-        print(f"Error parsing config file: {e}")
-        return None
-    except Exception as e:
-        print(f"Unexpected error loading config file: {e}")
-        return None
-
-config = load_config_sync()
-
-if config is None:
-    print("Failed to load configuration. Exiting.")
-    exit(1)
-
-# Apply nest_asyncio to allow nested event loops
-nest_asyncio.apply()
-
-# Set the secret key from the environment variable
-app.secret_key = os.environ.get('SECRET_KEY')
-
-if not app.secret_key:
-    raise ValueError("No SECRET_KEY set for Quart application")
-
-# Log the secret key for debugging (remove this in production)
-app.logger.info("Using SECRET_KEY: %s", app.secret_key)
-
-# Ensure config is not None before accessing its values
-app.config['DEBUG'] = config['app']['debug']
-app.config['REQUEST_TIMEOUT'] = 120
-app.static_folder = 'static'
-
-# Setup logging
-if not os.path.exists('logs'):
-    os.mkdir('logs')
-file_handler = RotatingFileHandler(config['logging']['filename'], maxBytes=10240, backupCount=10)
-file_handler.setFormatter(logging.Formatter(config['logging']['format']))
-file_handler.setLevel(logging.INFO)
-app.logger.addHandler(file_handler)
-app.logger.setLevel(logging.INFO)
-app.logger.info('Application startup')
-
-@app.context_processor
-async def inject_csrf_token():
-    return {'csrf_token': await csrf.generate_csrf()}
+REQUEST_SECONDS = registry.histogram(
+    'masterpi_http_request_seconds', 'Time to handle an HTTP request.', ['route', 'method', 'status'])
+STREAM_SUBSCRIBERS = registry.gauge('masterpi_stream_subscribers', 'Connected Server-Sent Events clients.')
+
+# Metrics a web worker records itself; in worker mode the hardware owner's copies stay empty
+WORKER_METRICS = (REQUEST_SECONDS.name, DB_READ_SECONDS.name, PAGE_CACHE_REQUESTS.name, STREAM_SUBSCRIBERS.name)
+
+@app.before_request
+async def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+async def record_request_latency(response):
+    start = getattr(g, 'request_start', None)
+    if start is not None:
+        # Label by route pattern, not path, so the number of series stays bounded
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        REQUEST_SECONDS.labels(route, request.method, str(response.status_code)).observe(time.perf_counter() - start)
+    return response
+
+def create_app():
+    """
+    Configure the application and return it.
+
+    Only the configuration, logging and CSRF protection are set up here. The
+    hardware, the database and the background tasks are started by startup()
+    when the app begins serving, so creating the app is fast and works without
+    any hardware attached.
+    """
+    global config, csrf, static_assets
+    if csrf is not None:
+        return app  # Already configured
+
+    with startup_phase('config'):
+        # All configuration reads go through the shared store, which parses the
+        # file once and only again when it changes
+        config = config_store.get()
+        if config is None:
+            raise RuntimeError("Failed to load configuration")
+
+    with startup_phase('app'):
+        # Set the secret key from the environment variable
+        app.secret_key = os.environ.get('SECRET_KEY')
+        if not app.secret_key:
+            raise ValueError("No SECRET_KEY set for Quart application")
+
+        app.config['DEBUG'] = config['app']['debug']
+        app.config['REQUEST_TIMEOUT'] = 120
+        app.static_folder = 'static'
+
+        # Setup logging
+        logging.basicConfig(level=logging.INFO)
+        if not os.path.exists('logs'):
+            os.mkdir('logs')
+        file_handler = RotatingFileHandler(config['logging']['filename'], maxBytes=10240, backupCount=10)
+        file_handler.setFormatter(logging.Formatter(config['logging']['format']))
+        file_handler.setLevel(logging.INFO)
+        app.logger.addHandler(file_handler)
+        handler = RotatingFileHandler('app.log', maxBytes=10000, backupCount=1)
+        handler.setLevel(logging.INFO)
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+        app.logger.addHandler(handler)
+        app.logger.setLevel(logging.INFO)
+        app.logger.info('Application startup')
+
+        # Set up CSRF protection
+        csrf = CustomCSRFProtect(app)
+        csrf._validate_csrf = validate_csrf
+        # Registered after the extension's own processor so our token wins
+        app.context_processor(inject_csrf_token)
+
+    with startup_phase('assets'):
+        # Fingerprinted and compressed once, so every response is served from memory
+        static_assets = AssetStore(os.path.join(app.root_path, app.static_folder),
+                                   brotli_quality=config['app'].get('brotli_quality', 11)).build()
+    return app
+
+def create_hardware_backend(config):
+    """Create the sensor/actuator backend selected in the configuration."""
+    hardware_config = config.get('hardware', {})
+    backend = hardware_config.get('backend', 'real')
+    if backend == 'simulated':
+        from simulation import SimulatedBackend
+        return SimulatedBackend(hardware_config.get('simulation', {}))
+    elif backend == 'real':
+        # Imported here so the Blinka/Adafruit drivers are only needed on real hardware
+        from hardware import HardwareBackend
+        return HardwareBackend()
+    raise ValueError(f"Unsupported hardware backend: {backend}")
 
 def initialize_sensor(sensor_config):
     """Initialize a sensor based on its configuration."""
     try:
-        sensor_type = sensor_config['type']
-        chip_select_pin = sensor_config.get('chip_select_pin')
-
-        if sensor_type == 'MAX31865':
-            spi = busio.SPI(clock=board.SCLK, MISO=board.MISO, MOSI=board.MOSI)
-            cs_pin = getattr(board, chip_select_pin) if chip_select_pin else None
-            cs = digitalio.DigitalInOut(cs_pin) if cs_pin else None
-            sensor = MAX31865(spi, cs, rtd_nominal=100, ref_resistor=430.0)
-        elif sensor_type == 'MAX31855':
-            spi = busio.SPI(clock=board.SCLK, MISO=board.MISO)
-            cs_pin = getattr(board, chip_select_pin) if chip_select_pin else None
-            cs = digitalio.DigitalInOut(cs_pin) if cs_pin else None
-            sensor = MAX31855(spi, cs)
-        elif sensor_type == 'MAX31856':
-            spi = busio.SPI(clock=board.SCLK, MISO=board.MISO, MOSI=board.MOSI)
-            cs_pin = getattr(board, chip_select_pin) if chip_select_pin else None
-            cs = digitalio.DigitalInOut(cs_pin) if cs_pin else None
-            sensor = MAX31856(spi, cs)
-        elif sensor_type == 'ADS1115':
-            i2c = busio.I2C(board.SCL, board.SDA)
-            ads = ADS.ADS1115(i2c)
-            sensor = AnalogIn(ads, ADS.P0)  # Assuming we're using the first channel
-        elif sensor_type == 'DHT22':
-            pin = getattr(board, chip_select_pin) if chip_select_pin else board.D4  # Default to D4 if not specified
-            sensor = adafruit_dht.DHT22(pin)
-        else:
-            raise ValueError(f"Unsupported sensor type: {sensor_type}")
-        
+        sensor = hardware_backend.initialize_sensor(sensor_config)
         return sensor, sensor_config['label']
     except Exception as e:
-        app.logger.error("Error initializing %s sensor: %s", sensor_type, e)
+        app.logger.error("Error initializing %s sensor: %s", sensor_config.get('type'), e)
         raise
 
 def initialize_sensors(config):
-    """Initialize all sensors based on the configuration."""
+    """Initialize all sensors based on the configuration, replacing and releasing the current ones."""
     global active_sensors
-    active_sensors = []
+    sensors = []
     for sensor_config in config['sensors']:
         try:
-            sensor, label = initialize_sensor(sensor_config)
-            active_sensors.append((sensor, label))
+            sensors.append(initialize_sensor(sensor_config))
         except Exception as e:
             app.logger.error("Failed to initialize sensor %s: %s", sensor_config['label'], e)
-    return active_sensors
-
-# In your main code:
-print("Initializing temperature sensors...")
-active_sensors = initialize_sensors(config)
-print(f"Temperature sensors initialized. Active sensors: {len(active_sensors)}")
-
-# Initialize PID controller
-pid = PIDController(kp=config['pid']['kp'], ki=config['pid']['ki'], kd=config['pid']['kd'], setpoint=config['pid']['target_temperature'])
-
-# Initialize FanController
-fan_pin = config['fan']['pin']
-if isinstance(fan_pin, str):
-    fan_pin = getattr(board, fan_pin)
-fan_controller = FanController(fan_pin=fan_pin, target_temperature=config['pid']['target_temperature'])
-
-# Initialize aiohttp session and Meater API
-aiohttp_session = None
-meater_api = None
+    # One assignment, so a sweep sees either the old list or the new one, never part of it
+    previous, active_sensors = active_sensors, sensors
+    for sensor, label in previous:
+        try:
+            hardware_backend.release_sensor(sensor)
+        except Exception as e:
+            app.logger.warning("Failed to release sensor %s: %s", label, e)
+    return sensors
 
 async def create_aiohttp_session():
-    """Create an aiohttp session."""
-    global aiohttp_session, meater_api
+    """Create the aiohttp session and the Meater poller, if the Meater integration is enabled."""
+    global aiohttp_session, meater_api, meater_poller
+    meater_config = config.get('meater_integration', {})
+    if not meater_config.get('enabled'):
+        return
+    # Only imported when enabled, so a setup without Meater never loads aiohttp
+    import aiohttp
+    from meater import MeaterApi, MeaterPoller
     aiohttp_session = aiohttp.ClientSession()
-    meater_api = MeaterApi(aiohttp_session)
-
-# Initialize the DHT sensor
-dht_device = adafruit_dht.DHT22(board.D4)
+    meater_api = MeaterApi(
+        aiohttp_session,
+        base_url=meater_config.get('base_url'),
+        email=meater_config.get('username'),
+        password=meater_config.get('password')
+    )
+    # One background poller answers every read of a Meater probe from its
+    # cache, so the cloud API is not hit per sweep or per page load
+    meater_poller = MeaterPoller(
+        meater_api,
+        interval=meater_config.get('poll_interval', 60),
+        ttl=meater_config.get('cache_ttl', 180),
+        max_backoff=meater_config.get('max_backoff', 900),
+        labels=meater_config.get('labels'),
+        include_ambient=meater_config.get('include_ambient', False)
+    )
+
+def sampled_sensors():
+    """Return the local sensors followed by the Meater probes, as (sensor, label) tuples."""
+    if meater_poller is None:
+        return active_sensors
+    return active_sensors + meater_poller.sensors()
+
+def is_meater_probe(sensor):
+    """Check whether a sampled sensor is a Meater probe; there are none without the poller."""
+    if meater_poller is None:
+        return False
+    from meater import MeaterProbe
+    return isinstance(sensor, MeaterProbe)
+
+def sensor_bus_name(sensor):
+    """Return the bus a sensor is read on; Meater probes share a bus of their own."""
+    if is_meater_probe(sensor):
+        from meater import MEATER_BUS
+        return MEATER_BUS
+    return hardware_backend.bus_name(sensor)
+
+def read_bus_sweep(sensors, results=None):
+    """Read the sensors of one bus, from the Meater cache or from the hardware."""
+    if sensors and is_meater_probe(sensors[0][0]):
+        return meater_poller.read_sweep(sensors, results)
+    return hardware_backend.read_sweep(sensors, results)
+
+def read_sensor_value(sensor, sensor_id):
+    """Read temperature from a sensor, raising an exception if the read fails."""
+    if is_meater_probe(sensor):
+        return meater_poller.read(sensor, sensor_id)[0]
+    return hardware_backend.read_sensor(sensor, sensor_id)
 
 def read_sensor_temperature(sensor, sensor_id):
     """Read temperature from a sensor."""
     try:
-        if isinstance(sensor, MAX31856):
-            temperature = sensor.temperature
-        elif isinstance(sensor, MAX31865):
-            temperature = sensor.temperature
-        elif isinstance(sensor, MAX31855):
-            temperature = sensor.temperature
-        elif isinstance(sensor, AnalogIn):
-            # Convert voltage to temperature for ADS1115
-            voltage = sensor.voltage
-            # Example conversion: assuming a linear relationship
-            # Replace with actual conversion logic for your sensor
-            temperature = (voltage - 0.5) * 100  # Example for TMP36 sensor
-        elif isinstance(sensor, adafruit_dht.DHT22):
-            temperature = sensor.temperature
-        else:
-            raise ValueError(f"Unsupported sensor type for {sensor_id}")
-        
-        # Insert the temperature data into the database with the sensor_id
-        insert_temperature_data(temperature, sensor_id)
-        
-        return temperature
+        return read_sensor_value(sensor, sensor_id)
     except Exception as e:
         app.logger.error("Error reading temperature for %s: %s", sensor_id, e)
         return None
@@ -276,21 +323,491 @@ def read_temperatures():
             app.logger.error("Error reading temperature for %s: %s", label, e)
     return temperatures
 
+def sensor_read_deadlines(config):
+    """Map each sensor label to its read deadline in seconds."""
+    default = config.get('sampler', {}).get('read_deadline', 1.0)
+    return {s['label']: s.get('read_deadline', default) for s in config.get('sensors', [])}
+
+def ring_buffer_capacity(config, interval):
+    """Return the samples per sensor the ring buffers need to hold `ring_buffer.minutes` at a sampling interval."""
+    return int(config.get('ring_buffer', {}).get('minutes', 120) * 60 / interval) + 1
+
+def apply_config(new_config):
+    """Apply a changed configuration to the running components."""
+    global config, read_deadlines, sampler_config
+    config = new_config
+    read_deadlines = sensor_read_deadlines(new_config)
+    sampler_config = new_config.get('sampler', {})
+    sensor_filters.configure(new_config)
+    # The setpoint is left alone: it may have been changed at runtime, e.g. by
+    # an emergency shutdown, and an unrelated settings save must not undo that
+    pid.kp = new_config['pid']['kp']
+    pid.ki = new_config['pid']['ki']
+    pid.kd = new_config['pid']['kd']
+    pid.output_limits = (new_config['fan'].get('min_speed', 0), new_config['fan'].get('max_speed', 100))
+    sampler.interval = new_config.get('sampler', {}).get('interval', sampler.interval)
+    # A shorter interval needs more samples to cover the same minutes
+    ring_buffers.resize(ring_buffer_capacity(new_config, sampler.interval))
+    control_loop.sample_time = new_config['pid'].get('sample_time', control_loop.sample_time)
+    control_loop.max_reading_age = new_config['pid'].get('max_reading_age', 3 * sampler.interval)
+
+def control_reading():
+    """Return the (temperature, timestamp) of the sensor the PID controls, or None."""
+    readings = sampler.snapshot().readings
+    label = config['pid'].get('control_sensor')
+    for reading in readings:
+        if label is None or reading.label == label:
+            return reading.temperature, reading.timestamp
+    return None
+
+def store_snapshot(snapshot):
+    """Queue every successful reading in a snapshot for writing, once per read time."""
+    for reading in snapshot.readings:
+        # Meater probes repeat their last poll's reading until the next poll
+        if reading.timestamp <= stored_read_times.get(reading.label, float('-inf')):
+            continue
+        stored_read_times[reading.label] = reading.timestamp
+        if reading.temperature is not None:
+            temperature_writer.submit(reading.temperature, reading.label, reading.timestamp, active_cook_id)
+        if reading.raw is not None:
+            temperature_writer.submit(reading.raw, RAW_LABEL.format(reading.label), reading.timestamp, active_cook_id)
+
+def begin_cook(name):
+    """Start a cook session and record the samples that follow against it."""
+    global active_cook_id
+    cook = start_cook(name)
+    active_cook_id = cook['id']
+    return cook
+
+def finish_cook():
+    """End the active cook session, returning it, or None if none was active."""
+    global active_cook_id
+    cook = end_cook()
+    active_cook_id = None
+    return cook
+
+def history_labels():
+    """Return the labels of the configured sensors followed by those of the Meater probes."""
+    labels = [sensor['label'] for sensor in config.get('sensors', [])]
+    # Meater probes are not configured sensors; they are known from the snapshot
+    labels += [reading.label for reading in current_snapshot().readings if reading.label not in labels]
+    return labels
+
+def ring_buffer_series(buffers, labels, since_ms, threshold=None):
+    """Build per-sensor series from a RingBufferStore for samples read after since_ms."""
+    from downsample import downsample_series
+    series = {}
+    for label in labels:
+        buffer = buffers.get(label)
+        if buffer is not None:
+            timestamps, temperatures = buffer.since(since_ms)
+            series[label] = downsample_series(timestamps, temperatures, threshold)
+    return series
+
+def snapshot_temperatures(snapshot=None):
+    """Return the sampled temperatures of a snapshot (the latest by default) as a list of dicts."""
+    if snapshot is None:
+        snapshot = current_snapshot()
+    temperatures = []
+    for reading in snapshot.readings:
+        temperature = {
+            'label': reading.label,
+            'temperature': reading.temperature,
+            'timestamp': reading.timestamp,
+            'error': reading.error
+        }
+        if reading.raw is not None:
+            temperature['raw'] = reading.raw
+        temperatures.append(temperature)
+    return temperatures
+
+def current_snapshot():
+    """Return the latest sampler snapshot, from the sampler or the hardware owner."""
+    if shared_state is not None:
+        return shared_state.read().snapshot
+    return sampler.snapshot()
+
+def current_ring_buffers():
+    """Return the ring buffers, from this process or the hardware owner."""
+    if shared_state is not None:
+        return shared_state.read().ring_buffers
+    return ring_buffers
+
+def control_state():
+    """Return the fan state and target temperature, from the control objects or the hardware owner."""
+    if shared_state is not None:
+        return shared_state.read().state
+    return {'fan_on': fan_controller.is_fan_on(), 'target_temperature': pid.setpoint}
+
+def control_status():
+    """Return the control loop's state and how well it keeps its schedule."""
+    return {
+        'setpoint': pid.setpoint,
+        'control_sensor': config['pid'].get('control_sensor'),
+        'sample_time': control_loop.sample_time,
+        'output': control_loop.output,
+        'duty': control_loop.duty,
+        'fan_on': fan_controller.is_fan_on(),
+        'timings': control_loop.timings.summary()
+    }
+
+def emergency_stop():
+    """Set the target temperature to 0 degrees and turn the fan off."""
+    pid.setpoint = 0.0
+    fan_controller.set_target_temperature(0.0)
+    app.logger.info("Set target temperature to 0 degrees.")
+
+    # Ensure the fan is turned off
+    fan_controller.turn_off_fan()
+    app.logger.info("Fan controller updated. Fan value: %s", fan_controller.fan.value)
+
+def snapshot_event(snapshot):
+    """Encode a snapshot together with the fan state as a stream event."""
+    state = control_state()
+    return format_event('snapshot', {
+        'sequence': snapshot.sequence,
+        'taken_at': snapshot.taken_at,
+        'fan_on': state.get('fan_on'),
+        'target_temperature': state.get('target_temperature'),
+        'temperatures': snapshot_temperatures(snapshot)
+    })
+
+async def start_hardware():
+    """Initialize the hardware and the database and start the background tasks."""
+    global hardware_backend, pid, fan_controller, read_deadlines, sampler_config, sweeper, sampler, sensor_filters
+    global control_loop, temperature_writer, retention_job, schema_migration, read_pool, active_cook_id, ring_buffers, stream_config, broadcaster, event_loop_lag
+    with startup_phase('hardware'):
+        hardware_backend = create_hardware_backend(config)
+        app.logger.info("Using %s hardware backend", hardware_backend.name)
+
+    with startup_phase('sensors'):
+        await asyncio.to_thread(initialize_sensors, config)
+        app.logger.info("Temperature sensors initialized. Active sensors: %d", len(active_sensors))
+
+    with startup_phase('control'):
+        pid = PIDController(
+            kp=config['pid']['kp'], ki=config['pid']['ki'], kd=config['pid']['kd'],
+            setpoint=config['pid']['target_temperature'],
+            # The output is the fan duty cycle in percent
+            output_limits=(config['fan'].get('min_speed', 0), config['fan'].get('max_speed', 100))
+        )
+        fan_pin = config['fan']['pin']
+        fan_controller = FanController(
+            fan_pin=fan_pin,
+            target_temperature=config['pid']['target_temperature'],
+            output=hardware_backend.fan_output(fan_pin)
+        )
+
+    with startup_phase('database'):
+        await asyncio.to_thread(init_db, config.get('database', {}).get('convert_auto_vacuum', False))
+        # A cook that was active when the app stopped carries on
+        active_cook = await asyncio.to_thread(get_active_cook)
+        active_cook_id = active_cook['id'] if active_cook is not None else None
+        # Samples are persisted by a single write-behind writer that batches rows onto
+        # one connection, so neither the sampler nor the web handlers wait on the disk.
+        database_config = config.get('database', {})
+        temperature_writer = TemperatureWriter(
+            batch_size=database_config.get('batch_size', 500),
+            flush_interval=database_config.get('flush_interval', 30),
+            max_queue=database_config.get('max_queue', 10000)
+        )
+        # History, export and cook reads run on their own connections and threads,
+        # so a long query holds up neither the event loop nor the writer
+        read_pool = ReadPool(size=database_config.get('read_connections', 2))
+        # Rows of an older schema are moved over while the app runs
+        schema_migration = SchemaMigration(batch_size=database_config.get('migration_batch_size', 2000))
+        if not await asyncio.to_thread(schema_migration.pending):
+            schema_migration = None
+        # Expired rows are deleted in the background a batch at a time
+        retention_config = config.get('retention', {})
+        if retention_config.get('enabled', False):
+            retention_job = RetentionJob(
+                raw_days=retention_config.get('raw_days', 30),
+                rollup_days=retention_config.get('rollup_days'),
+                interval=retention_config.get('interval', 3600),
+                batch_size=retention_config.get('batch_size', 500),
+                batch_pause=retention_config.get('batch_pause', 0.05),
+                vacuum_pages=retention_config.get('vacuum_pages', 256),
+                archive_dir=retention_config.get('archive_dir')
+            )
+
+    with startup_phase('sampler'):
+        read_deadlines = sensor_read_deadlines(config)
+        sampler_config = config.get('sampler', {})
+
+        # Each bus is read on its own worker thread, so a slow DHT22 or a hung bus
+        # cannot hold up the thermocouples, and sensors that keep failing are skipped
+        # for a while instead of costing a deadline every sweep.
+        sweeper = ParallelSweeper(
+            bus_name=sensor_bus_name,
+            read_sweep=read_bus_sweep,
+            deadline_for=lambda label: read_deadlines.get(label, sampler_config.get('read_deadline', 1.0)),
+            breaker_factory=lambda: CircuitBreaker(
+                failure_threshold=sampler_config.get('failure_threshold', 3),
+                backoff=sampler_config.get('breaker_backoff', 10),
+                max_backoff=sampler_config.get('breaker_max_backoff', 300)
+            )
+        )
+
+        # Spikes and noise are filtered out before a reading reaches the snapshot,
+        # so the database, the charts and the fan all see the same smoothed value
+        sensor_filters = SensorFilters(config)
+
+        # A single sampler owns all hardware reads; request handlers only ever look at
+        # its latest snapshot, so the read rate does not depend on how many clients poll.
+        sampler = TemperatureSampler(
+            get_sensors=sampled_sensors,
+            read_sensor=read_sensor_value,
+            interval=sampler_config.get('interval', 5),
+            read_sweep=sweeper.sweep,
+            filters=sensor_filters
+        )
+
+        # The control loop runs on its own fixed schedule, independent of the sweep
+        # interval and of web load, and records how well it keeps that schedule.
+        control_loop = ControlLoop(
+            pid=pid,
+            fan=fan_controller,
+            get_reading=control_reading,
+            sample_time=config['pid'].get('sample_time', 1.0),
+            max_reading_age=config['pid'].get('max_reading_age', 3 * sampler.interval)
+        )
+
+        sampler.add_listener(store_snapshot)
+
+        # Recent history is kept in fixed-size per-sensor ring buffers so the charts'
+        # default window is answered from memory rather than from SQLite
+        ring_buffers = RingBufferStore(capacity=ring_buffer_capacity(config, sampler.interval))
+        sampler.add_listener(ring_buffers.append_snapshot)
+
+        # Every new snapshot is encoded once and pushed to all connected stream clients
+        stream_config = config.get('stream', {})
+        broadcaster = SnapshotBroadcaster(queue_size=stream_config.get('queue_size', 8))
+        sampler.add_listener(lambda snapshot: broadcaster.publish(snapshot_event(snapshot)))
+
+        config_store.subscribe(apply_config)
+
+        # Values that are cheaper to read when scraped than to track as they change
+        registry.gauge('masterpi_db_queue_depth', 'Temperature rows waiting to be written.').set_function(temperature_writer.queue_depth)
+        STREAM_SUBSCRIBERS.set_function(lambda: broadcaster.subscriber_count)
+        registry.gauge('masterpi_pid_output', 'Latest PID output in percent fan duty.').set_function(lambda: control_loop.output)
+        event_loop_lag = EventLoopLagMonitor(
+            registry.histogram('masterpi_event_loop_lag_seconds', 'How late the event loop wakes a sleeping task.')
+        )
+
+    with startup_phase('meater'):
+        await create_aiohttp_session()
+
+    with startup_phase('tasks'):
+        # Start the database writer before the sampler so no snapshot is missed
+        temperature_writer.start()
+        if schema_migration is not None:
+            schema_migration.start()
+        if retention_job is not None:
+            retention_job.start()
+        if meater_poller is not None:
+            meater_poller.start()
+        sampler.start()
+        control_loop.start()
+        event_loop_lag.start()
+
+async def stop_hardware():
+    """Stop the background tasks, flush pending rows and release the hardware."""
+    await event_loop_lag.stop()
+    await control_loop.stop()
+    await sampler.stop()
+    if meater_poller is not None:
+        await meater_poller.stop()
+    sweeper.close()
+    if retention_job is not None:
+        await retention_job.stop()
+    if schema_migration is not None:
+        await asyncio.to_thread(schema_migration.close)
+    await asyncio.to_thread(temperature_writer.close)  # Flush pending rows
+    await asyncio.to_thread(read_pool.close)
+    config_store.unsubscribe(apply_config)
+    if aiohttp_session is not None:
+        await aiohttp_session.close()  # Ensure the aiohttp session is closed properly
+
+def apply_worker_config(new_config):
+    """Apply a changed configuration in a web worker, which only uses the dict itself."""
+    global config
+    config = new_config
+
+async def relay_snapshots(poll_interval=0.1):
+    """Push each new snapshot published by the hardware owner to this worker's stream clients."""
+    sequence = None
+    while True:
+        snapshot = shared_state.read().snapshot
+        if snapshot.sequence != sequence:
+            sequence = snapshot.sequence
+            broadcaster.publish(snapshot_event(snapshot))
+        await asyncio.sleep(poll_interval)
+
+async def start_web_worker():
+    """Attach a web worker to the state the hardware owner publishes."""
+    global shared_state, read_pool, stream_config, broadcaster
+    with startup_phase('shared_state'):
+        shared_state = await asyncio.to_thread(SharedStateReader, config['quart'].get('shared_memory', 'masterpi'))
+        # Workers read the database directly; only the hardware owner writes it
+        read_pool = ReadPool(size=config.get('database', {}).get('read_connections', 2))
+        stream_config = config.get('stream', {})
+        broadcaster = SnapshotBroadcaster(queue_size=stream_config.get('queue_size', 8))
+        STREAM_SUBSCRIBERS.set_function(lambda: broadcaster.subscriber_count)
+        config_store.subscribe(apply_worker_config)
+        background_tasks.append(asyncio.create_task(relay_snapshots()))
+
+async def stop_web_worker():
+    """Stop relaying snapshots and detach from the shared state."""
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    config_store.unsubscribe(apply_worker_config)
+    await asyncio.to_thread(read_pool.close)
+    shared_state.close()
+
+@app.before_serving
+async def startup():
+    """Start the hardware, or in a web worker attach to the hardware owner's state."""
+    if worker_mode:
+        await start_web_worker()
+    else:
+        await start_hardware()
+    app.logger.info(
+        "Startup finished in %.3f s: %s", sum(startup_timings.values()),
+        ', '.join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in startup_timings.items())
+    )
+
+@app.after_serving
+async def shutdown():
+    """Stop whatever startup() started."""
+    if worker_mode:
+        await stop_web_worker()
+    else:
+        await stop_hardware()
+
+def owner_socket_path():
+    """Return the path of the Unix socket the hardware owner takes commands on."""
+    return config['quart'].get('owner_socket', 'masterpi-owner.sock')
+
+def publish_shared_state(snapshot=None):
+    """Publish the latest snapshot, fan state and ring buffers to the web workers."""
+    shared_writer.publish(snapshot or sampler.snapshot(), control_state(), ring_buffers)
+
+async def handle_owner_command(command, args):
+    """Carry out a command a web worker sent to the hardware owner."""
+    if command == 'emergency_shutdown':
+        emergency_stop()
+        publish_shared_state()
+        return None
+    elif command == 'reinitialize_sensors':
+        await asyncio.to_thread(initialize_sensors, config_store.get())
+        return len(active_sensors)
+    elif command == 'start_cook':
+        return await asyncio.to_thread(begin_cook, args['name'])
+    elif command == 'stop_cook':
+        return await asyncio.to_thread(finish_cook)
+    elif command == 'control_status':
+        return control_status()
+    elif command == 'metrics':
+        return registry.render(exclude=args.get('exclude', ()))
+    raise ValueError(f"Unknown command: {command}")
+
+async def hardware_owner_main():
+    """
+    Run the hardware, the sampler and the control loop, and share their state
+    with the web workers until SIGINT or SIGTERM.
+    """
+    global shared_writer, command_server
+    create_app()
+    await start_hardware()
+    quart_config = config['quart']
+    shared_writer = SharedStateWriter(quart_config.get('shared_memory', 'masterpi'),
+                                      quart_config.get('shared_memory_size', 4 * 1024 * 1024))
+    publish_shared_state()
+    sampler.add_listener(publish_shared_state)
+    command_server = await serve_commands(owner_socket_path(), handle_owner_command)
+    app.logger.info("Hardware owner ready after %.3f s", sum(startup_timings.values()))
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signal_number, stop.set)
+    try:
+        published = control_state()
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), quart_config.get('publish_interval', 0.5))
+            except asyncio.TimeoutError:
+                pass
+            # The web workers write the configuration file; pick up their changes
+            config_store.get()
+            # The fan switches between sweeps, so publish state changes as they happen
+            state = control_state()
+            if state != published:
+                publish_shared_state()
+                published = state
+    finally:
+        command_server.close()
+        await command_server.wait_closed()
+        await stop_hardware()
+        shared_writer.close()
+
+def run_hardware_owner():
+    """Entry point of the hardware-owner process."""
+    asyncio.run(hardware_owner_main())
+
+def create_worker_app():
+    """
+    Create the app for a web worker, which serves requests from the state the
+    hardware owner publishes and never touches the hardware itself.
+    """
+    global worker_mode
+    worker_mode = True
+    return create_app()
+
+def serve_workers(workers):
+    """
+    Serve with one process owning the hardware and `workers` Hypercorn web
+    worker processes, so web traffic is spread over the cores without
+    touching the control path.
+    """
+    import multiprocessing
+    from hypercorn.config import Config as HypercornConfig
+    from hypercorn.run import run
+
+    owner = multiprocessing.get_context('spawn').Process(target=run_hardware_owner, name='masterpi-hardware')
+    owner.start()
+    hypercorn_config = HypercornConfig()
+    hypercorn_config.bind = ["0.0.0.0:5000"]  # Ensure this is correct
+    hypercorn_config.workers = workers
+    hypercorn_config.application_path = 'masterpi:create_worker_app()'
+    try:
+        return run(hypercorn_config)
+    finally:
+        owner.terminate()  # SIGTERM; the owner flushes pending rows and exits
+        owner.join(30)
+
 @app.route('/')
 async def index():
     """Render the index page."""
-    device_name = config['device']['name']  # Get device name from config
-    sensors = config.get('sensors', [])  # Example sensors
-
-    # Ensure personalization settings are available
-    if 'personalization' not in config:
-        config['personalization'] = {
-            'navColor': '#827f7f',
-            'buttonColor': '#f2f2f2',
-            'backgroundColor': '#ffffff'
-        }
+    config = config_store.get()
 
-    return await render_template('index.html', device_name=device_name, sensors=sensors, config=config)
+    async def render(csrf_token):
+        page_config = config
+        # Ensure personalization settings are available without touching the shared config
+        if 'personalization' not in page_config:
+            page_config = dict(page_config, personalization={
+                'navColor': '#827f7f',
+                'buttonColor': '#f2f2f2',
+                'backgroundColor': '#ffffff'
+            })
+        return await render_template('index.html', device_name=page_config['device']['name'],
+                                     sensors=page_config.get('sensors', []), config=page_config,
+                                     csrf_token=csrf_token)
+
+    return await page_cache.get('index', config_store.version, render, await csrf.generate_csrf())
 
 @app.route('/add_sensor', methods=['POST'])
 async def add_sensor():
@@ -304,10 +821,8 @@ async def add_sensor():
         return jsonify({'error': 'Missing required fields'}), 400
 
     try:
-        config = await load_config()
-        
         # Check if a sensor with the same label already exists
-        if any(sensor['label'] == label for sensor in config['sensors']):
+        if any(sensor['label'] == label for sensor in config_store.get()['sensors']):
             return jsonify({'error': 'A sensor with this label already exists'}), 400
 
         new_sensor = {
@@ -326,12 +841,8 @@ async def add_sensor():
             new_sensor['gain'] = data.get('gain')
             new_sensor['data_rate'] = data.get('data_rate')
 
-        config['sensors'].append(new_sensor)
-        await save_config(config)  # Use the async version of save_config
-
-        # Reload the configuration to verify the changes
-        config = await load_config()
-        app.logger.info("Sensor added successfully. New configuration: %s", config)
+        await config_store.update(lambda config: config['sensors'].append(new_sensor))
+        app.logger.info("Sensor added successfully: %s", new_sensor)
         return jsonify({'message': f'Sensor {label} added successfully'})
     except Exception as e:
         app.logger.error("Error adding sensor: %s", e, exc_info=True)
@@ -341,7 +852,7 @@ async def add_sensor():
 def get_available_pins():
     """Get available GPIO pins."""
     try:
-        config = load_config_sync()
+        config = config_store.get()
         all_pins = ['D5', 'D6', 'D13', 'D19', 'D26']  # List all possible pins
         used_pins = [sensor['chip_select_pin'] for sensor in config['sensors'] if 'chip_select_pin' in sensor]
         available_pins = [pin for pin in all_pins if pin not in used_pins]
@@ -351,16 +862,18 @@ def get_available_pins():
         return jsonify({'error': 'Failed to get available pins'}), 500
     
 @app.route('/favicon.ico')
-def favicon():
+async def favicon():
     """Serve the favicon."""
-    return send_from_directory(os.path.join(app.root_path, 'static'),
-                               'favicon.ico', mimetype='image/vnd.microsoft.icon')
+    return await serve_static('favicon.ico')
 
 @app.route('/initialize_sensors', methods=['POST'])
 async def initialize_sensors_route():
     """Initialize sensors via HTTP request."""
     try:
-        load_active_sensors()
+        if worker_mode:
+            await send_command(owner_socket_path(), 'reinitialize_sensors', timeout=60)
+        else:
+            await asyncio.to_thread(initialize_sensors, config_store.get())
         app.logger.info('Sensors initialized successfully.')
         return jsonify({"message": "Sensors initialized successfully"}), 200
     except Exception as e:
@@ -393,35 +906,19 @@ async def power_options():
 async def settings():
     """Render the settings page."""
     try:
-        app.logger.info("Settings route called")
-        
-        # Load config with explicit logging
-        app.logger.info("Loading config...")
-        config = await load_config()
-        app.logger.info("Config loaded: %s", config)
-        
-        # Generate CSRF token with logging
-        app.logger.info("Generating CSRF token...")
-        csrf_token = await csrf.generate_csrf()
-        app.logger.info("CSRF token generated")
-        
-        # Get available pins
-        app.logger.info("Getting available pins...")
-        available_pins = config.get('available_pins', [])
-        app.logger.info("Available pins: %s", available_pins)
-        
-        # Render template with logging
-        app.logger.info("Rendering template...")
-        response = await render_template(
-            'settings.html',
-            config=config,
-            available_pins=available_pins,
-            csrf_token=csrf_token
-        )
-        app.logger.info("Template rendered successfully")
-        
-        return response
-        
+        config = config_store.get()
+
+        async def render(csrf_token):
+            app.logger.debug("Rendering settings page for configuration version %d", config_store.version)
+            return await render_template(
+                'settings.html',
+                config=config,
+                available_pins=config.get('available_pins', []),
+                csrf_token=csrf_token
+            )
+
+        return await page_cache.get('settings', config_store.version, render, await csrf.generate_csrf())
+
     except Exception as e:
         app.logger.error("Error in settings route: %s", e, exc_info=True)
         traceback.print_exc()
@@ -433,26 +930,27 @@ async def save_settings():
     try:
         data = await request.get_json()
         app.logger.info("Received settings data: %s", data)
-        config = await load_config()
-        
-        if 'device_name' in data:
-            config['device']['name'] = data['device_name']
-        elif 'temperatureUnit' in data:
-            config['units']['temperature'] = data['temperatureUnit']
-        elif 'timezone' in data:
-            config['units']['timezone'] = data['timezone']  # Save the timezone setting
-        elif any(key in data for key in ['navColor', 'buttonColor', 'backgroundColor', 'navTextColor', 'buttonTextColor']):
-            # Handle personalization settings
-            config.setdefault('personalization', {})
-            for key in ['navColor', 'buttonColor', 'backgroundColor', 'navTextColor', 'buttonTextColor']:
-                if key in data:
-                    config['personalization'][key] = data[key]
-        else:
+        if not any(key in data for key in ['device_name', 'temperatureUnit', 'timezone', 'navColor', 'buttonColor',
+                                           'backgroundColor', 'navTextColor', 'buttonTextColor']):
             app.logger.warning("Unknown setting received: %s", data)
             return jsonify({'success': False, 'error': 'Invalid setting'}), 400
-        
-        app.logger.info("Updated config: %s", config)
-        await save_config(config)
+
+        def apply_setting(config):
+            if 'device_name' in data:
+                config['device']['name'] = data['device_name']
+            elif 'temperatureUnit' in data:
+                config['units']['temperature'] = data['temperatureUnit']
+            elif 'timezone' in data:
+                config['units']['timezone'] = data['timezone']  # Save the timezone setting
+            else:
+                # Handle personalization settings
+                config.setdefault('personalization', {})
+                for key in ['navColor', 'buttonColor', 'backgroundColor', 'navTextColor', 'buttonTextColor']:
+                    if key in data:
+                        config['personalization'][key] = data[key]
+
+        await config_store.update(apply_setting)
+        app.logger.info("Updated config version: %s", config_store.version)
         
         return jsonify({'success': True, 'message': 'Setting updated successfully'})
     except Exception as e:
@@ -475,14 +973,11 @@ async def save_personalization_settings():
 async def emergency_shutdown():
     """Initiate an emergency shutdown."""
     try:
-        # Set the target temperature to 0 degrees
-        pid.setpoint = 0.0
-        fan_controller.set_target_temperature(0.0)
-        app.logger.info("Set target temperature to 0 degrees.")
-
-        # Ensure the fan is turned off
-        fan_controller.turn_off_fan()
-        app.logger.info("Fan controller updated. Fan value: %s", fan_controller.fan.value)
+        if worker_mode:
+            # Only the hardware owner can touch the fan
+            await send_command(owner_socket_path(), 'emergency_shutdown')
+        else:
+            emergency_stop()
 
         app.logger.info("Emergency shutdown initiated: Fan turned off and target temperature set to 0 degrees.")
         return jsonify({'status': 'success', 'message': 'Emergency shutdown initiated.'})
@@ -490,65 +985,53 @@ async def emergency_shutdown():
         app.logger.error("Error during emergency shutdown: %s", e, exc_info=True)
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
-@app.route('/static/<path:filename>')
-def serve_static(filename):
-    """Serve static files."""
-    app.logger.debug("Attempting to serve static file: %s", filename)
-    return send_from_directory(app.static_folder, filename)
-
-# Configure logging
-handler = RotatingFileHandler('app.log', maxBytes=10000, backupCount=1)
-handler.setLevel(logging.INFO)
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-handler.setFormatter(formatter)
-app.logger.addHandler(handler)
-app.logger.setLevel(logging.INFO)
-
-# Initialize the database
-init_db()
-
-# Configure logging
-logging.basicConfig(level=logging.INFO)
-
-async def read_temperature_data():
-    """Read temperature data periodically."""
-    while True:
-        try:
-            temperatures = read_temperatures()
-            for temp_data in temperatures:
-                label = temp_data['label']
-                temperature = temp_data['temperature']
-                if temperature is not None:
-                    logging.info("Read temperature: %s", temperature)
-                    insert_temperature_data(temperature, label)
-                    logging.info("Inserted temperature data: %s", temperature)
-                else:
-                    logging.error("Failed to read temperature: received None")
-        except Exception as e:
-            logging.error("Error reading temperature: %s", e)
-        await asyncio.sleep(60)  # Read temperature data every 60 seconds
+@app.url_defaults
+def static_url_defaults(endpoint, values):
+    """Point url_for('static', ...) at the hashed name of the file."""
+    if endpoint == 'static' and static_assets is not None and 'filename' in values:
+        values['filename'] = static_assets.url_path(values['filename'])
+
+@app.route('/static/<path:filename>', endpoint='static')
+async def serve_static(filename):
+    """
+    Serve a static file from the built assets, compressed when the client
+    accepts it. Hashed names are cached for good; plain names are revalidated
+    against their ETag on every use.
+    """
+    asset, immutable = static_assets.lookup(filename)
+    if asset is None:
+        app.logger.debug("Serving static file not in the built assets: %s", filename)
+        return await send_from_directory(os.path.join(app.root_path, app.static_folder), filename)
+    encoding, body, etag = asset.select(request.headers.get('Accept-Encoding', ''))
+    headers = {
+        'Cache-Control': IMMUTABLE if immutable else REVALIDATE,
+        'Vary': 'Accept-Encoding',
+    }
+    if request.if_none_match.contains_weak(etag):
+        response = await make_response('', 304, headers)
+    else:
+        response = await make_response(body, headers)
+        response.content_type = asset.content_type
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    return response
 
 async def main():
     """Main entry point for the application."""
-    global config
-    config = await load_config()  # Load the configuration asynchronously
-    await create_aiohttp_session()
-    init_db()  # Initialize the database
+    # Only serving needs the server, so it is not imported with the module
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config as HypercornConfig
     hypercorn_config = HypercornConfig()
     hypercorn_config.bind = ["0.0.0.0:5000"]  # Ensure this is correct
-    try:
-        # Start the temperature reading loop
-        asyncio.create_task(read_temperature_data())
-        await serve(app, hypercorn_config)
-    finally:
-        await aiohttp_session.close()  # Ensure the aiohttp session is closed properly
+    await serve(create_app(), hypercorn_config)
 
 @app.route('/temp_data', methods=['GET'])
 async def temp_data():
     """Fetch temperature data."""
     try:
-        # Read the current temperatures from the sensors
-        temperatures = read_temperatures()
+        # Return the latest snapshot from the sampler instead of reading the sensors
+        temperatures = snapshot_temperatures()
         
         # Ensure the temperatures are returned in the expected format
         return jsonify({'temperatures': temperatures})
@@ -556,6 +1039,215 @@ async def temp_data():
         app.logger.error("Error fetching temperature data: %s", e, exc_info=True)
         return jsonify({'error': 'Failed to fetch temperature data'}), 500
 
+# Bounds for the number of points per sensor a history request may ask for
+HISTORY_DEFAULT_POINTS = 300
+HISTORY_MAX_POINTS = 2000
+
+def read_series(query, *args, points=None, conn=None, **kwargs):
+    """
+    Run a database read and group its rows into per-sensor series, downsampled
+    to `points` each; meant for ReadPool.run(), so the LTTB pass runs off the
+    event loop too.
+    """
+    from downsample import rows_to_series
+    return rows_to_series(query(*args, conn=conn, **kwargs), points)
+
+@app.route('/api/history', methods=['GET'])
+async def api_history():
+    """
+    Fetch temperature history downsampled to a point budget per sensor.
+
+    With a `since` cursor (epoch ms) only the points read after it are
+    returned, so a polling chart can append them instead of reloading the
+    window. A cursor older than the window is moved up to its start, so a
+    stale or forged cursor reads no more than a full reload would. Every
+    response carries the cursor to pass on the next poll.
+    Ranges the ring buffers still hold are served from memory.
+    """
+    try:
+        time_range = request.args.get('time_range', default=config['chart']['history_minutes'], type=float)
+        points = request.args.get('points', default=HISTORY_DEFAULT_POINTS, type=int)
+        points = max(3, min(points, HISTORY_MAX_POINTS))
+        since = request.args.get('since', type=int)
+
+        labels = history_labels()
+        start_ms = int((time.time() - time_range * 60) * 1000)
+
+        # One read, so every check below sees the same publish of the buffers
+        buffers = current_ring_buffers()
+        if since is not None:
+            since = max(since, start_ms)
+            if buffers.covers(since):
+                series = ring_buffer_series(buffers, labels, since, points)
+            else:
+                series = await read_pool.run('history_since', read_series, get_temperature_data_since, since,
+                                             points=points)
+            cursor = max([timestamps[-1] for timestamps, _ in series.values() if timestamps], default=since)
+        elif buffers.covers(start_ms):
+            series = ring_buffer_series(buffers, labels, start_ms, points)
+            cursor = buffers.newest_timestamp() or 0
+        else:
+            cursor = await read_pool.run('latest_timestamp', get_latest_temperature_timestamp) or 0
+            # Read from the coarsest rollup tier that still gives `points` per range,
+            # then LTTB the rest of the way down
+            series = await read_pool.run('history_range', read_series, get_temperature_data_by_range, time_range,
+                                         resolution=time_range * 60 / points, points=points)
+
+        sensors = []
+        for label in labels:
+            timestamps, temperatures = series.get(label, ([], []))
+            sensors.append({
+                'label': label,
+                'timestamps': timestamps,
+                'temperatures': temperatures
+            })
+        return jsonify({'time_range': time_range, 'points': points, 'cursor': cursor, 'sensors': sensors})
+    except Exception as e:
+        app.logger.error("Error fetching temperature history: %s", e, exc_info=True)
+        return jsonify({'error': 'Failed to fetch temperature history'}), 500
+
+@app.route('/api/export', methods=['GET'])
+async def api_export():
+    """
+    Download stored temperatures as gzip-compressed CSV or NDJSON.
+
+    Select the rows with `cook_id`, with `start` and `end` (epoch ms) or with
+    `time_range` (minutes back from now). The rows are streamed from the
+    database a chunk at a time, so memory use does not grow with the range.
+    """
+    from export import FORMATS, gzip_export
+    export_format = request.args.get('format', 'csv')
+    if export_format not in FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(FORMATS)}"}), 400
+    cook_id = request.args.get('cook_id', type=int)
+    start_ms = request.args.get('start', type=int)
+    end_ms = request.args.get('end', type=int)
+    time_range = request.args.get('time_range', type=float)
+    if time_range is not None:
+        start_ms = int((time.time() - time_range * 60) * 1000)
+    if cook_id is None and start_ms is None and end_ms is None:
+        start_ms = int((time.time() - config['chart']['history_minutes'] * 60) * 1000)
+
+    chunks = read_pool.iterate('export', get_temperature_chunk, start_ms=start_ms, end_ms=end_ms, cook_id=cook_id,
+                               chunk_size=config.get('database', {}).get('export_chunk_size', 1000))
+    content_type, extension = FORMATS[export_format]
+    name = f"masterpi-cook-{cook_id}" if cook_id is not None else time.strftime('masterpi-%Y%m%d-%H%M%S')
+    response = await make_response(gzip_export(chunks, export_format), {
+        'Content-Type': 'application/gzip',
+        'Content-Disposition': f'attachment; filename="{name}.{extension}.gz"',
+        'X-Content-Type-Options': 'nosniff'
+    })
+    response.timeout = None  # A long export may take longer than the default response timeout
+    return response
+
+@app.route('/api/cooks', methods=['GET'])
+async def api_cooks():
+    """List cook sessions, newest first; pass `before` (epoch seconds) to page back."""
+    try:
+        limit = max(1, min(request.args.get('limit', default=50, type=int), 500))
+        before = request.args.get('before', type=float)
+        cooks = await read_pool.run('list_cooks', list_cooks, limit, before)
+        return jsonify({'cooks': cooks})
+    except Exception as e:
+        app.logger.error("Error listing cooks: %s", e, exc_info=True)
+        return jsonify({'error': 'Failed to list cooks'}), 500
+
+@app.route('/api/cooks', methods=['POST'])
+async def api_start_cook():
+    """Start a cook session; samples read from now on are recorded against it."""
+    try:
+        data = await request.get_json(silent=True) or {}
+        name = str(data.get('name') or time.strftime('Cook %Y-%m-%d %H:%M'))
+        if worker_mode:
+            # Only the hardware owner records samples
+            cook = await send_command(owner_socket_path(), 'start_cook', name=name)
+        else:
+            cook = await asyncio.to_thread(begin_cook, name)
+        return jsonify(cook), 201
+    except Exception as e:
+        app.logger.error("Error starting cook: %s", e, exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/cooks/stop', methods=['POST'])
+async def api_stop_cook():
+    """End the active cook session."""
+    try:
+        if worker_mode:
+            cook = await send_command(owner_socket_path(), 'stop_cook')
+        else:
+            cook = await asyncio.to_thread(finish_cook)
+        if cook is None:
+            return jsonify({'error': 'No cook is active'}), 404
+        return jsonify(cook)
+    except Exception as e:
+        app.logger.error("Error stopping cook: %s", e, exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/cooks/<int:cook_id>', methods=['GET'])
+async def api_cook(cook_id):
+    """Fetch a cook session with a summary of each sensor over the cook."""
+    try:
+        cook = await read_pool.run('get_cook', get_cook, cook_id)
+        if cook is None:
+            return jsonify({'error': 'Cook not found'}), 404
+        cook['sensors'] = await read_pool.run('cook_summary', get_cook_summary, cook_id)
+        return jsonify(cook)
+    except Exception as e:
+        app.logger.error("Error fetching cook %s: %s", cook_id, e, exc_info=True)
+        return jsonify({'error': 'Failed to fetch cook'}), 500
+
+async def cook_series(cook_id, points):
+    """Return a cook and its per-sensor series downsampled to `points`, or None."""
+    cook = await read_pool.run('get_cook', get_cook, cook_id)
+    if cook is None:
+        return None, None
+    return cook, await read_pool.run('cook_data', read_series, get_cook_data, cook_id, points=points)
+
+@app.route('/api/cooks/<int:cook_id>/history', methods=['GET'])
+async def api_cook_history(cook_id):
+    """Fetch one cook's temperature history downsampled to a point budget per sensor."""
+    try:
+        points = max(3, min(request.args.get('points', default=HISTORY_DEFAULT_POINTS, type=int), HISTORY_MAX_POINTS))
+        cook, series = await cook_series(cook_id, points)
+        if cook is None:
+            return jsonify({'error': 'Cook not found'}), 404
+        sensors = [{'label': label, 'timestamps': timestamps, 'temperatures': temperatures}
+                   for label, (timestamps, temperatures) in series.items()]
+        return jsonify({'cook': cook, 'points': points, 'sensors': sensors})
+    except Exception as e:
+        app.logger.error("Error fetching history of cook %s: %s", cook_id, e, exc_info=True)
+        return jsonify({'error': 'Failed to fetch cook history'}), 500
+
+@app.route('/api/cooks/compare', methods=['GET'])
+async def api_compare_cooks():
+    """
+    Fetch several cooks' histories with timestamps as milliseconds since each
+    cook started, so they can be drawn over each other.
+    """
+    try:
+        cook_ids = [int(cook_id) for cook_id in request.args.get('ids', '').split(',') if cook_id.strip()]
+        if not 1 <= len(cook_ids) <= 10:
+            return jsonify({'error': 'Pass between 1 and 10 cook ids as ids=1,2,...'}), 400
+        points = max(3, min(request.args.get('points', default=HISTORY_DEFAULT_POINTS, type=int), HISTORY_MAX_POINTS))
+        cooks = []
+        for cook_id in cook_ids:
+            cook, series = await cook_series(cook_id, points)
+            if cook is None:
+                return jsonify({'error': f'Cook {cook_id} not found'}), 404
+            start_ms = int(cook['started_at'] * 1000)
+            cook['sensors'] = [
+                {'label': label, 'elapsed': [timestamp - start_ms for timestamp in timestamps],
+                 'temperatures': temperatures}
+                for label, (timestamps, temperatures) in series.items()
+            ]
+            cooks.append(cook)
+        return jsonify({'points': points, 'cooks': cooks})
+    except ValueError:
+        return jsonify({'error': 'Cook ids must be integers'}), 400
+    except Exception as e:
+        app.logger.error("Error comparing cooks: %s", e, exc_info=True)
+        return jsonify({'error': 'Failed to compare cooks'}), 500
+
 @app.route('/remove_sensor', methods=['POST'])
 async def remove_sensor():
     """Remove a sensor."""
@@ -569,19 +1261,16 @@ async def remove_sensor():
         if sensor_index is None:
             return jsonify({'error': 'Sensor index is required'}), 400
             
-        config = await load_config()
-        
         # Verify the sensor exists at the specified index
-        if sensor_index >= len(config['sensors']):
+        if sensor_index >= len(config_store.get()['sensors']):
             return jsonify({'error': 'Invalid sensor index'}), 400
             
-        # Remove the sensor at the specified index
-        removed_sensor = config['sensors'].pop(sensor_index)
+        # Remove the sensor at the specified index and save the updated configuration
+        removed = []
+        await config_store.update(lambda config: removed.append(config['sensors'].pop(sensor_index)))
+        removed_sensor = removed[0]
         app.logger.info(f"Removed sensor: {removed_sensor}")
         
-        # Save the updated configuration
-        await save_config(config)
-        
         return jsonify({
             'success': True,
             'message': f'Sensor {removed_sensor["label"]} removed successfully'
@@ -607,10 +1296,8 @@ async def save_sensor_settings():
         data = await request.get_json()
         # Process the sensor settings data
         # For example, update the configuration or database
-        config = await load_config()
         # Assume data contains sensor settings to be updated
-        # Update the config with new sensor settings
-        await save_config(config)
+        # Update the config with new sensor settings through config_store.update()
         
         return jsonify({'message': 'Sensor settings saved successfully'})
     except Exception as e:
@@ -621,12 +1308,13 @@ async def save_sensor_settings():
 async def api_status():
     """Fetch the current status of the system."""
     try:
-        # Read the current temperatures from the sensors
-        temperatures = read_temperatures()
+        # Return the latest snapshot from the sampler instead of reading the sensors
+        temperatures = snapshot_temperatures()
         
         # Fetch the fan status and target temperature
-        fan_on = fan_controller.is_fan_on()
-        target_temperature = pid.setpoint
+        state = control_state()
+        fan_on = state.get('fan_on')
+        target_temperature = state.get('target_temperature')
         
         # Return the status as a JSON response
         return jsonify({
@@ -638,11 +1326,59 @@ async def api_status():
         app.logger.error("Error fetching system status: %s", e, exc_info=True)
         return jsonify({'error': 'Failed to fetch system status'}), 500
 
+@app.route('/api/control', methods=['GET'])
+async def api_control():
+    """Report the control loop's state and how well it keeps its schedule."""
+    if worker_mode:
+        return jsonify(await send_command(owner_socket_path(), 'control_status'))
+    return jsonify(control_status())
+
+@app.route('/metrics', methods=['GET'])
+async def metrics():
+    """Expose the in-process metrics in the Prometheus text format."""
+    return await render_metrics(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+async def render_metrics():
+    """Return every metric in the Prometheus text format, in worker mode merged with the hardware owner's."""
+    if not worker_mode:
+        return registry.render()
+    # The hardware owner records everything but what this worker served itself
+    owner_metrics = await send_command(owner_socket_path(), 'metrics', exclude=list(WORKER_METRICS))
+    return owner_metrics + registry.render(include=WORKER_METRICS)
+
+@app.route('/api/stream', methods=['GET'])
+async def api_stream():
+    """Push every new sampler snapshot to the client as Server-Sent Events."""
+    keepalive = stream_config.get('keepalive', 15)
+
+    async def events():
+        # Subscribed only once the stream runs, so a request cancelled before
+        # its first event never leaves a queue behind
+        subscriber = broadcaster.subscribe()
+        try:
+            # Start with the current snapshot so the client does not wait a sweep
+            yield snapshot_event(current_snapshot())
+            while True:
+                try:
+                    yield await asyncio.wait_for(subscriber.get(), timeout=keepalive)
+                except asyncio.TimeoutError:
+                    yield b': keepalive\n\n'  # Keeps proxies from closing an idle stream
+        finally:
+            broadcaster.unsubscribe(subscriber)
+
+    response = await make_response(events(), {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Tell nginx not to buffer the stream
+    })
+    response.timeout = None  # The stream stays open for as long as the page does
+    return response
+
 @app.route('/get_settings', methods=['GET'])
 async def get_settings():
     """Fetch application settings."""
     try:
-        config = await load_config()
+        config = config_store.get()
         settings = {
             'device': {
                 'name': config['device']['name']
@@ -667,9 +1403,10 @@ async def get_settings():
 async def reinitialize_sensors():
     """Reinitialize sensors after configuration changes."""
     try:
-        global active_sensors
-        config = await load_config()
-        active_sensors = initialize_sensors(config)
+        if worker_mode:
+            await send_command(owner_socket_path(), 'reinitialize_sensors', timeout=60)
+        else:
+            await asyncio.to_thread(initialize_sensors, config_store.get())
         return jsonify({'message': 'Sensors reinitialized successfully'})
     except Exception as e:
         app.logger.error("Error reinitializing sensors: %s", e, exc_info=True)
@@ -684,25 +1421,30 @@ async def edit_sensor():
         sensor_label = data.get('label')
         # Update other properties as needed
 
-        config = await load_config()
-
         # Verify the sensor exists at the specified index
-        if sensor_index >= len(config['sensors']):
+        if sensor_index >= len(config_store.get()['sensors']):
             return jsonify({'error': 'Invalid sensor index'}), 400
 
-        # Update the sensor properties
-        config['sensors'][sensor_index]['label'] = sensor_label
-        # Update other properties
+        def update_sensor(config):
+            # Update the sensor properties
+            config['sensors'][sensor_index]['label'] = sensor_label
+            # Update other properties
 
         # Save the updated configuration
-        await save_config(config)
+        await config_store.update(update_sensor)
 
         return jsonify({'success': True, 'message': f'Sensor {sensor_label} updated successfully'})
     except Exception as e:
         app.logger.error("Error updating sensor: %s", e, exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+# Time taken to import this module and its dependencies
+startup_timings['import'] = time.perf_counter() - _import_started
+STARTUP_PHASE_SECONDS.labels('import').set(startup_timings['import'])
+
 if __name__ == '__main__':
-    nest_asyncio.apply()  # Apply nest_asyncio to allow nested event loops
-    asyncio.run(main())
-    
\ No newline at end of file
+    workers = (config_store.get() or {}).get('quart', {}).get('workers', 1)
+    if workers > 1:
+        serve_workers(workers)
+    else:
+        asyncio.run(main())
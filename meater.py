@@ -1,17 +1,252 @@
-import aiohttp
+"""
+This module talks to the Meater cloud API and polls it in the background, so
+Meater probes can be read like local sensors without a request to the cloud
+for every sweep or page load.
+"""
+
+import asyncio
+import logging
 import os  # Import the os module
+import time
+from collections import namedtuple
+from metrics import registry
+
+DEFAULT_BASE_URL = 'https://public-api.cloud.meater.com/v1/'
+
+# Name the sampler groups Meater probes under; they are read from the poller's
+# cache on their own worker like any other bus
+MEATER_BUS = 'meater'
+
+# A virtual sensor for one temperature of one Meater probe. `channel` is
+# 'internal' (the meat) or 'ambient'.
+MeaterProbe = namedtuple('MeaterProbe', ['device_id', 'channel'])
+
+MEATER_REQUESTS = registry.counter(
+    'masterpi_meater_requests_total', 'Requests to the Meater cloud API by outcome.', ['outcome'])
+
+
+class MeaterError(Exception):
+    """A Meater cloud API request failed."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class MeaterRateLimited(MeaterError):
+    """The Meater cloud API asked us to slow down."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message, status=429)
+        self.retry_after = retry_after
+
 
 class MeaterApi:
-    def __init__(self, session):
+    def __init__(self, session, base_url=None, email=None, password=None, timeout=10.0):
+        """
+        Initializes the client.
+
+        :param session: The application's aiohttp ClientSession, reused for every request.
+        :param base_url: Base URL of the API; defaults to the Meater cloud.
+        :param email: Meater account email, used to log in when MEATER_JWT is not set.
+        :param password: Meater account password.
+        :param timeout: Time in seconds a request may take.
+        """
         self.session = session
-        self.base_url = 'https://public-api.cloud.meater.com/v1/'
+        self.base_url = (base_url or DEFAULT_BASE_URL).rstrip('/') + '/'
         self.jwt = os.getenv('MEATER_JWT')  # Load JWT from environment variable
+        self.email = email
+        self.password = password
+        self.timeout = timeout
 
-    async def devices(self):
-        headers = {
-            'Authorization': f'Bearer {self.jwt}'
-        }
-        async with self.session.get(f'{self.base_url}devices', headers=headers) as response:
+    async def _request(self, method, path, **kwargs):
+        import aiohttp
+        async with self.session.request(method, f'{self.base_url}{path}',
+                                        timeout=aiohttp.ClientTimeout(total=self.timeout),
+                                        **kwargs) as response:
+            if response.status == 429:
+                retry_after = response.headers.get('Retry-After')
+                raise MeaterRateLimited('Meater API rate limit reached',
+                                        retry_after=float(retry_after) if retry_after else None)
             if response.status != 200:
-                raise aiohttp.ClientError(f'Failed to fetch devices: {response.status}')
-            return await response.json()
\ No newline at end of file
+                raise MeaterError(f'Failed to fetch {path}: {response.status}', status=response.status)
+            return await response.json()
+
+    async def login(self):
+        """
+        Logs in with the account email and password and keeps the token.
+        """
+        if not self.email or not self.password:
+            raise MeaterError('No MEATER_JWT and no Meater account configured')
+        body = await self._request('POST', 'login', json={'email': self.email, 'password': self.password})
+        self.jwt = body['data']['token']
+
+    async def devices(self):
+        """
+        Returns the account's devices, logging in first if there is no token.
+
+        :return: The API's JSON response.
+        """
+        if not self.jwt:
+            await self.login()
+        try:
+            return await self._request('GET', 'devices', headers={'Authorization': f'Bearer {self.jwt}'})
+        except MeaterError as e:
+            if e.status != 401 or not self.email:
+                raise
+        # The token expired; log in again once
+        await self.login()
+        return await self._request('GET', 'devices', headers={'Authorization': f'Bearer {self.jwt}'})
+
+
+class MeaterPoller:
+    """
+    Polls the Meater cloud in the background and caches the probe temperatures.
+
+    Sensor reads come from the cache, so the cloud sees one request per poll
+    interval however often the sensors are swept. Failed polls back off
+    exponentially, and a rate-limit response is honoured for at least its
+    Retry-After time. Cached readings older than `ttl` are reported as errors
+    rather than as current temperatures.
+    """
+
+    def __init__(self, api, interval=60.0, ttl=180.0, max_backoff=900.0, labels=None,
+                 include_ambient=False):
+        """
+        Initializes the poller.
+
+        :param api: A MeaterApi.
+        :param interval: Time in seconds between polls.
+        :param ttl: Time in seconds a cached reading stays valid.
+        :param max_backoff: Upper bound in seconds of the delay after failed polls.
+        :param labels: Optional dict mapping device IDs to sensor labels.
+        :param include_ambient: Also expose each probe's ambient temperature as a sensor.
+        """
+        self.api = api
+        self.interval = interval
+        self.ttl = ttl
+        self.max_backoff = max_backoff
+        self.labels = labels or {}
+        self.include_ambient = include_ambient
+        self._readings = {}  # MeaterProbe -> (temperature, fetched_at)
+        self._sensors = []
+        self._delay = interval
+        self._task = None
+
+    def _label(self, device_id, channel):
+        label = self.labels.get(device_id) or f'Meater {device_id[:6]}'
+        return label if channel == 'internal' else f'{label} Ambient'
+
+    def update(self, body, fetched_at=None):
+        """
+        Caches the temperatures of a devices response.
+
+        :param body: JSON response of MeaterApi.devices().
+        :param fetched_at: Time of the response; defaults to now.
+        """
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        channels = ('internal', 'ambient') if self.include_ambient else ('internal',)
+        sensors = []
+        for device in body.get('data', {}).get('devices', []):
+            temperatures = device.get('temperature') or {}
+            for channel in channels:
+                if temperatures.get(channel) is None:
+                    continue
+                probe = MeaterProbe(device['id'], channel)
+                self._readings[probe] = (float(temperatures[channel]), fetched_at)
+                sensors.append((probe, self._label(device['id'], channel)))
+        # A probe missing from one response stays listed with its cached
+        # reading until that expires, so a brief dropout does not remove it
+        current = {probe for probe, _ in sensors}
+        for probe, label in self._sensors:
+            if probe not in current and fetched_at - self._readings[probe][1] < self.ttl:
+                sensors.append((probe, label))
+        self._sensors = sensors
+
+    def sensors(self):
+        """
+        Returns the current Meater probes as (probe, label) tuples, like the active sensors.
+        """
+        return self._sensors
+
+    def read(self, probe, label=None):
+        """
+        Returns a probe's cached temperature, raising an exception if it is missing or expired.
+
+        :param probe: A MeaterProbe.
+        :param label: The sensor label, used in error messages.
+        :return: A (temperature, fetched_at) tuple; fetched_at is the time of
+                 the poll the temperature came from.
+        """
+        cached = self._readings.get(probe)
+        if cached is None:
+            raise MeaterError(f'No reading for Meater probe {label or probe.device_id}')
+        temperature, fetched_at = cached
+        if time.time() - fetched_at > self.ttl:
+            raise MeaterError(f'Meater reading for {label or probe.device_id} is {time.time() - fetched_at:.0f} s old')
+        return temperature, fetched_at
+
+    def read_sweep(self, sensors, results=None):
+        """
+        Reads a list of (probe, label) tuples from the cache. Each reading is
+        timestamped with the poll it came from, so sweeps between two polls
+        return the same reading rather than a new one.
+
+        :param results: Optional list filled in as each read completes, as for bus.pipelined_sweep().
+        :return: List of (temperature, timestamp, error) tuples in the same order.
+        """
+        results = [None] * len(sensors) if results is None else results
+        for i, (probe, label) in enumerate(sensors):
+            try:
+                results[i] = (*self.read(probe, label), None)
+            except Exception as e:
+                results[i] = (None, time.time(), e)
+        return results
+
+    async def poll(self):
+        """
+        Fetches the devices once and caches their temperatures.
+
+        :return: Time in seconds until the next poll.
+        """
+        try:
+            self.update(await self.api.devices())
+        except MeaterRateLimited as e:
+            MEATER_REQUESTS.labels('rate_limited').inc()
+            self._delay = min(self.max_backoff, max(self._delay * 2, e.retry_after or 0))
+            logging.warning("Meater API rate limit reached; next poll in %.0f s", self._delay)
+        except Exception as e:
+            MEATER_REQUESTS.labels('error').inc()
+            self._delay = min(self.max_backoff, self._delay * 2)
+            logging.error("Error polling the Meater API: %s; next poll in %.0f s", e, self._delay)
+        else:
+            MEATER_REQUESTS.labels('ok').inc()
+            self._delay = self.interval
+        return self._delay
+
+    async def run(self):
+        """
+        Polls forever.
+        """
+        while True:
+            await asyncio.sleep(await self.poll())
+
+    def start(self):
+        """
+        Starts the polling task on the running event loop.
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        """
+        Cancels the polling task and waits for it to finish.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
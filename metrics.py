@@ -0,0 +1,302 @@
+"""
+This module provides a small in-process metrics registry with counters,
+gauges and histograms, rendered in the Prometheus text exposition format.
+
+Recording a sample is a dict lookup and a few additions under a lock, cheap
+enough to leave on in the sampling and request hot paths.
+"""
+
+import asyncio
+import bisect
+import math
+import threading
+
+# Default histogram buckets in seconds, from 100 µs to 10 s
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    """
+    Base class of the metric types: a name, help text, label names and one
+    child per combination of label values.
+    """
+
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def _init_default(self):
+        # Unlabelled metrics are exported as zero before anything is recorded
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def labels(self, *values):
+        """
+        Returns the child for a combination of label values, creating it on first use.
+
+        :param values: One value per label name, in order.
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _default(self):
+        # Unlabelled metrics record on their single child directly
+        return self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self):
+        """
+        Returns the metric's samples in the Prometheus text format.
+        """
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type_name}']
+        for values, child in sorted(self._children.items()):
+            lines.extend(child.render(self.name, self.labelnames, values))
+        return lines
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self.value += amount
+
+    def render(self, name, labelnames, values):
+        return [f'{name}{_format_labels(labelnames, values)} {_format_value(self.value)}']
+
+
+class Counter(_Metric):
+    """A monotonically increasing count."""
+
+    type_name = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._init_default()
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1.0):
+        """Increments an unlabelled counter."""
+        self._default().inc(amount)
+
+
+class _GaugeChild:
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        self.function = function
+
+    def render(self, name, labelnames, values):
+        value = self.value
+        if self.function is not None:
+            try:
+                value = self.function()
+            except Exception:
+                value = math.nan
+        return [f'{name}{_format_labels(labelnames, values)} {_format_value(value)}']
+
+
+class Gauge(_Metric):
+    """A value that can go up and down, set directly or computed when scraped."""
+
+    type_name = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._init_default()
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        """Sets an unlabelled gauge."""
+        self._default().set(value)
+
+    def set_function(self, function):
+        """Makes an unlabelled gauge report the result of calling `function` when scraped."""
+        self._default().set_function(function)
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last slot is +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def render(self, name, labelnames, values):
+        with self._lock:
+            counts = list(self.counts)
+            total = self.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            labels = _format_labels(labelnames, values, [('le', _format_value(bound))])
+            lines.append(f'{name}_bucket{labels} {cumulative}')
+        labels = _format_labels(labelnames, values)
+        lines.append(f'{name}_sum{labels} {_format_value(total)}')
+        lines.append(f'{name}_count{labels} {cumulative}')
+        return lines
+
+
+class Histogram(_Metric):
+    """Counts observations, e.g. durations in seconds, into cumulative buckets."""
+
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._init_default()
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        """Records an observation on an unlabelled histogram."""
+        self._default().observe(value)
+
+
+class Registry:
+    """
+    Holds every metric of the process. Registering a name twice returns the
+    existing metric, so modules can declare the metrics they record at import.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.type_name}")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        """Returns the Counter with this name, registering it if needed."""
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        """Returns the Gauge with this name, registering it if needed."""
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """Returns the Histogram with this name, registering it if needed."""
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self, include=None, exclude=()):
+        """
+        Returns metrics in the Prometheus text exposition format.
+
+        :param include: Names of the metrics to render, or None for all of them.
+        :param exclude: Names of metrics to leave out.
+        """
+        lines = []
+        for name in sorted(self._metrics):
+            if (include is not None and name not in include) or name in exclude:
+                continue
+            lines.extend(self._metrics[name].render())
+        return '\n'.join(lines) + '\n'
+
+
+class EventLoopLagMonitor:
+    """
+    Measures how late the event loop wakes a task that sleeps for a fixed
+    interval; a blocked loop shows up as lag in every handler and in the
+    control loop.
+    """
+
+    def __init__(self, histogram, interval=0.5):
+        """
+        Initializes the monitor.
+
+        :param histogram: Histogram the lag in seconds is observed on.
+        :param interval: Time in seconds between measurements.
+        """
+        self.histogram = histogram
+        self.interval = interval
+        self._task = None
+
+    async def run(self):
+        """
+        Measures the lag forever.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.histogram.observe(max(0.0, loop.time() - expected))
+
+    def start(self):
+        """
+        Starts the monitor task on the running event loop.
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        """
+        Cancels the monitor task and waits for it to finish.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+# The single registry shared by the whole application
+registry = Registry()
@@ -0,0 +1,60 @@
+"""
+This module caches rendered HTML pages between configuration changes.
+
+A page is rendered once per configuration version with a placeholder where
+the CSRF token goes. Each request then only swaps in that client's token,
+so serving a page costs a dict lookup and a string replace rather than a
+template render.
+"""
+
+import logging
+import secrets
+
+from metrics import registry
+
+PAGE_CACHE_REQUESTS = registry.counter(
+    'masterpi_page_cache_requests_total', 'Page requests by whether the rendered page was cached.', ['page', 'result'])
+
+
+class PageCache:
+    """
+    Rendered page bodies, keyed on page name and configuration version.
+    Only the newest version of each page is kept.
+    """
+
+    def __init__(self):
+        """
+        Initializes an empty cache.
+        """
+        # Random, so no configuration value can contain it by accident
+        self.placeholder = f'csrf{secrets.token_hex(16)}'
+        self._pages = {}
+
+    async def get(self, name, version, render, csrf_token):
+        """
+        Return a page with the client's CSRF token filled in, rendering it
+        first if the configuration changed since it was last rendered.
+
+        :param name: Name of the page, e.g. "index".
+        :param version: The configuration version the page is rendered from.
+        :param render: Coroutine function taking the CSRF placeholder and
+                       returning the rendered page.
+        :param csrf_token: The token to fill in for this request.
+        :return: The page as a string.
+        """
+        cached = self._pages.get(name)
+        if cached is not None and cached[0] == version:
+            PAGE_CACHE_REQUESTS.labels(name, 'hit').inc()
+            body = cached[1]
+        else:
+            PAGE_CACHE_REQUESTS.labels(name, 'miss').inc()
+            body = await render(self.placeholder)
+            self._pages[name] = (version, body)
+            logging.debug("Rendered page %s for configuration version %d", name, version)
+        return body.replace(self.placeholder, csrf_token)
+
+    def clear(self):
+        """
+        Drop every cached page.
+        """
+        self._pages.clear()
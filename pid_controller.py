@@ -7,25 +7,64 @@ class PIDController:
     A simple PID controller class.
     """
 
-    def __init__(self, kp, ki, kd, setpoint):
+    def __init__(self, kp, ki, kd, setpoint, output_limits=(None, None)):
+        """
+        Initializes the controller.
+
+        :param kp: Proportional gain.
+        :param ki: Integral gain, per second.
+        :param kd: Derivative gain, in seconds.
+        :param setpoint: The target value of the process variable.
+        :param output_limits: (low, high) bounds of the output; None leaves a side unbounded.
+        """
         self.kp = kp
         self.ki = ki
         self.kd = kd
         self.setpoint = setpoint
-        self.previous_error = 0
+        self.output_limits = output_limits
+        self.previous_error = None
         self.integral = 0
 
-    def compute(self, current_value):
+    def _clamp(self, value):
+        low, high = self.output_limits
+        if low is not None and value < low:
+            return low
+        if high is not None and value > high:
+            return high
+        return value
+
+    def compute(self, current_value, dt=1.0):
         """
         Compute the control output for a given current value.
 
+        The integral and derivative terms are scaled by the time since the
+        previous call. While the output is saturated the integral is not grown
+        further in the saturating direction (anti-windup).
+
         :param current_value: The current value of the process variable.
-        :return: The control output.
+        :param dt: Time in seconds since the previous call.
+        :return: The control output, clamped to output_limits.
         """
         error = self.setpoint - current_value
-        self.integral += error
-        derivative = error - self.previous_error
-        output = self.kp * error + self.ki * self.integral + self.kd * derivative
+        if self.previous_error is None or dt <= 0:
+            derivative = 0
+        else:
+            derivative = (error - self.previous_error) / dt
+        integral = self.integral + error * max(dt, 0)
+        output = self.kp * error + self.ki * integral + self.kd * derivative
+        clamped = self._clamp(output)
+        if clamped != output and (output > clamped) == (error > 0):
+            # Saturated and the error pushes further the same way; hold the integral
+            output = self.kp * error + self.ki * self.integral + self.kd * derivative
+            clamped = self._clamp(output)
+        else:
+            self.integral = integral
         self.previous_error = error
-        return output
-    
\ No newline at end of file
+        return clamped
+
+    def reset(self):
+        """
+        Clears the integral and derivative history, e.g. after the loop was idle.
+        """
+        self.previous_error = None
+        self.integral = 0
@@ -0,0 +1,189 @@
+"""
+This module enforces the retention policy for stored temperatures: raw rows
+and rollup buckets older than their configured age are deleted by a
+background job in small batches, optionally after archiving the raw rows to
+compressed CSV files, and the freed pages are returned to the file system
+with incremental_vacuum. Raw rows recorded during a cook are kept, since the
+cook pages read nothing else.
+"""
+
+import asyncio
+import csv
+import gzip
+import logging
+import os
+import sqlite3
+import threading
+import time
+import database
+from database import ROLLUP_TIERS
+from export import COLUMNS
+from metrics import registry
+
+# Default age in days after which each rollup tier is deleted, by the tier's
+# suffix; None keeps a tier forever
+DEFAULT_ROLLUP_DAYS = {'1m': 90, '5m': 365, '1h': None}
+
+ROWS_EXPIRED = registry.counter(
+    'masterpi_db_rows_expired_total', 'Rows deleted by the retention job.', ['table'])
+RETENTION_SECONDS = registry.histogram(
+    'masterpi_db_retention_seconds', 'Time of one retention run, including pauses between batches.',
+    buckets=(0.01, 0.1, 1.0, 10.0, 60.0, 300.0, 1800.0))
+
+
+class RetentionJob:
+    """
+    Deletes expired rows in short transactions so the TemperatureWriter is
+    never locked out for long, then reclaims the freed pages a few at a time.
+    """
+
+    def __init__(self, db_path=None, raw_days=30, rollup_days=None, interval=3600.0, batch_size=500,
+                 batch_pause=0.05, vacuum_pages=256, archive_dir=None):
+        """
+        Initializes the job.
+
+        :param db_path: Path to the SQLite database, defaults to DATABASE_PATH.
+        :param raw_days: Age in days after which raw rows outside a cook are deleted,
+                         or None to keep them.
+        :param rollup_days: Dict of rollup tier suffix ('1m', '5m', '1h') to age in days
+                            or None, merged over DEFAULT_ROLLUP_DAYS.
+        :param interval: Time in seconds between runs.
+        :param batch_size: Rows deleted per transaction.
+        :param batch_pause: Time in seconds to sleep between transactions.
+        :param vacuum_pages: Free pages released per incremental_vacuum step.
+        :param archive_dir: Directory raw rows are appended to as gzipped CSV, one
+                            file per day, before they are deleted; None deletes them outright.
+        """
+        self.db_path = db_path or database.DATABASE_PATH
+        self.raw_days = raw_days
+        self.rollup_days = {**DEFAULT_ROLLUP_DAYS, **(rollup_days or {})}
+        self.interval = interval
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.vacuum_pages = vacuum_pages
+        self.archive_dir = archive_dir
+        self._stopping = threading.Event()
+        self._task = None
+
+    def run_once(self, now=None):
+        """
+        Deletes everything that has expired and reclaims the space. This blocks
+        on the database, so run() calls it in a worker thread.
+
+        :param now: Epoch time to measure ages from, defaults to now.
+        :return: Dict of table name to number of rows deleted.
+        """
+        now = time.time() if now is None else now
+        start = time.perf_counter()
+        deleted = {}
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute('PRAGMA synchronous=NORMAL')
+        try:
+            if self.raw_days is not None:
+                deleted['samples'] = self._expire(
+                    conn, '''SELECT samples.sensor_id, samples.ts,
+                                     strftime('%Y-%m-%dT%H:%M:%fZ', samples.ts / 1000.0, 'unixepoch'),
+                                     sensors.label, samples.temperature, samples.cook_id
+                              FROM samples JOIN sensors ON sensors.id = samples.sensor_id
+                              WHERE samples.ts >= ? AND samples.ts < ? AND samples.cook_id IS NULL
+                              ORDER BY samples.ts LIMIT ?''',
+                    'DELETE FROM samples WHERE sensor_id = ? AND ts = ?',
+                    int((now - self.raw_days * 86400) * 1000), archive=self.archive_dir is not None,
+                    resume=True)
+            for bucket_seconds, table in ROLLUP_TIERS:
+                days = self.rollup_days.get(table.rsplit('_', 1)[1])
+                if days is None:
+                    continue
+                deleted[table] = self._expire(
+                    conn, f'SELECT sensor_id, bucket FROM {table} WHERE bucket < ? LIMIT ?',
+                    f'DELETE FROM {table} WHERE sensor_id = ? AND bucket = ?', int(now - days * 86400))
+            self._vacuum(conn)
+        finally:
+            conn.close()
+        RETENTION_SECONDS.observe(time.perf_counter() - start)
+        for table, count in deleted.items():
+            if count:
+                ROWS_EXPIRED.labels(table).inc(count)
+        if any(deleted.values()):
+            logging.info("Retention deleted %s", ', '.join(f"{count} rows from {table}" for table, count in deleted.items()))
+        return deleted
+
+    def _expire(self, conn, select, delete, cutoff, archive=False, resume=False):
+        # With resume, `select` also takes the timestamp to start from and
+        # orders by it, so each batch starts where the last one ended instead
+        # of scanning again over the rows it keeps
+        start = 0
+        total = 0
+        while not self._stopping.is_set():
+            params = (start, cutoff, self.batch_size) if resume else (cutoff, self.batch_size)
+            rows = conn.execute(select, params).fetchall()
+            if not rows:
+                return total
+            if resume:
+                start = rows[-1][1]
+            if archive:
+                self._archive(rows)
+            with conn:
+                conn.executemany(delete, [row[:2] for row in rows])
+                # Hand the pages of this batch back right away so the file shrinks
+                # while the backlog of an old database is worked through
+                conn.execute(f'PRAGMA incremental_vacuum({self.vacuum_pages})').fetchall()
+            total += len(rows)
+            self._stopping.wait(self.batch_pause)  # Let the writer in between batches
+        return total
+
+    def _vacuum(self, conn):
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            return  # Not converted to incremental auto-vacuum; the free pages are reused instead
+        # Each step is its own short write transaction
+        while not self._stopping.is_set() and conn.execute('PRAGMA freelist_count').fetchone()[0] > 0:
+            conn.execute(f'PRAGMA incremental_vacuum({self.vacuum_pages})').fetchall()
+            self._stopping.wait(self.batch_pause)
+
+    def _archive(self, rows):
+        os.makedirs(self.archive_dir, exist_ok=True)
+        days = {}
+        for _, _, timestamp, label, temperature, cook_id in rows:
+            days.setdefault(timestamp[:10], []).append((timestamp, label, temperature, cook_id))
+        for day, day_rows in days.items():
+            # Appending adds a gzip member per batch; gzip and zcat read them as one file
+            path = os.path.join(self.archive_dir, f'samples-{day}.csv.gz')
+            new_file = not os.path.exists(path)
+            with gzip.open(path, 'at', encoding='utf-8', newline='') as archive_file:
+                writer = csv.writer(archive_file, lineterminator='\n')
+                if new_file:
+                    writer.writerow(COLUMNS)
+                writer.writerows(day_rows)
+
+    async def run(self):
+        """
+        Runs the job forever, once every `interval` seconds.
+        """
+        while True:
+            try:
+                await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                logging.error("Error applying the retention policy: %s", e)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """
+        Starts the job on the running event loop.
+        """
+        if self._task is None or self._task.done():
+            self._stopping.clear()
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        """
+        Cancels the job; a run in progress stops after its current batch.
+        """
+        self._stopping.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,217 @@
+"""
+This module provides fixed-size, array-backed ring buffers holding the recent
+history of each sensor in memory.
+"""
+
+from array import array
+
+
+class SensorRingBuffer:
+    """
+    A ring buffer of (epoch-ms, temperature) samples for one sensor.
+
+    Timestamps are stored as int64 and temperatures as float32 in preallocated
+    arrays, so the memory footprint is 12 bytes per sample and never grows.
+    Samples must be appended in time order.
+    """
+
+    def __init__(self, capacity):
+        """
+        Initializes the buffer.
+
+        :param capacity: Maximum number of samples kept; older ones are overwritten.
+        """
+        self.capacity = capacity
+        self.timestamps = array('q', bytes(8 * capacity))
+        self.values = array('f', bytes(4 * capacity))
+        self._head = 0  # Index the next sample is written to
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, timestamp_ms, value):
+        """
+        Adds a sample, overwriting the oldest one when the buffer is full.
+
+        :param timestamp_ms: Read time in epoch milliseconds.
+        :param value: The temperature.
+        """
+        self.timestamps[self._head] = timestamp_ms
+        self.values[self._head] = value
+        self._head = (self._head + 1) % self.capacity
+        if self._count < self.capacity:
+            self._count += 1
+
+    def _physical(self, i):
+        return (self._head - self._count + i) % self.capacity
+
+    def oldest_timestamp(self):
+        """
+        Returns the read time of the oldest sample, or None if the buffer is empty.
+        """
+        return self.timestamps[self._physical(0)] if self._count else None
+
+    def newest_timestamp(self):
+        """
+        Returns the read time of the newest sample, or None if the buffer is empty.
+        """
+        return self.timestamps[self._physical(self._count - 1)] if self._count else None
+
+    def _first_after(self, timestamp_ms):
+        # Binary search for the first logical index with a timestamp > timestamp_ms
+        low, high = 0, self._count
+        while low < high:
+            mid = (low + high) // 2
+            if self.timestamps[self._physical(mid)] <= timestamp_ms:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def _slice(self, start, stop):
+        start_index = self._physical(start) if start < self._count else self._head
+        length = stop - start
+        if start_index + length <= self.capacity:
+            return (self.timestamps[start_index:start_index + length],
+                    self.values[start_index:start_index + length])
+        wrap = start_index + length - self.capacity
+        return (self.timestamps[start_index:] + self.timestamps[:wrap],
+                self.values[start_index:] + self.values[:wrap])
+
+    def since(self, timestamp_ms):
+        """
+        Returns the samples read strictly after a point in time.
+
+        :param timestamp_ms: Epoch milliseconds.
+        :return: A (timestamps, values) tuple of arrays in time order.
+        """
+        return self._slice(self._first_after(timestamp_ms), self._count)
+
+    def samples(self):
+        """
+        Returns every sample in the buffer.
+
+        :return: A (timestamps, values) tuple of arrays in time order.
+        """
+        return self._slice(0, self._count)
+
+    def load(self, timestamps, values):
+        """
+        Replaces the contents of the buffer, e.g. with samples() of another buffer.
+
+        :param timestamps: Epoch-ms timestamps in time order, at most `capacity` of them.
+        :param values: The matching temperatures.
+        """
+        count = len(timestamps)
+        self.timestamps[:count] = array('q', timestamps)
+        self.values[:count] = array('f', values)
+        self._count = count
+        self._head = count % self.capacity
+
+
+class RingBufferStore:
+    """
+    Holds one SensorRingBuffer per sensor label and fills them from sampler
+    snapshots.
+    """
+
+    def __init__(self, capacity):
+        """
+        Initializes the store.
+
+        :param capacity: Number of samples kept per sensor.
+        """
+        self.capacity = capacity
+        self._buffers = {}
+        self._started_ms = None  # Read time of the first sample in any buffer
+
+    def get(self, label):
+        """
+        Returns the buffer for a sensor label, or None if it has no samples yet.
+        """
+        return self._buffers.get(label)
+
+    def append_snapshot(self, snapshot):
+        """
+        Appends every successful reading of a snapshot to its sensor's buffer,
+        skipping readings no newer than the buffer's newest sample, such as a
+        Meater probe's repeat of its last poll.
+
+        :param snapshot: A sampler Snapshot.
+        """
+        for reading in snapshot.readings:
+            if reading.temperature is None:
+                continue
+            buffer = self._buffers.get(reading.label)
+            if buffer is None:
+                buffer = self._buffers[reading.label] = SensorRingBuffer(self.capacity)
+            timestamp_ms = int(reading.timestamp * 1000)
+            if len(buffer) and timestamp_ms <= buffer.newest_timestamp():
+                continue
+            buffer.append(timestamp_ms, reading.temperature)
+            if self._started_ms is None:
+                self._started_ms = timestamp_ms
+
+    def resize(self, capacity):
+        """
+        Changes the number of samples kept per sensor, keeping the newest
+        samples that fit.
+
+        :param capacity: New number of samples kept per sensor.
+        """
+        if capacity == self.capacity:
+            return
+        buffers = {}
+        for label, buffer in self._buffers.items():
+            timestamps, values = buffer.samples()
+            resized = buffers[label] = SensorRingBuffer(capacity)
+            resized.load(timestamps[-capacity:], values[-capacity:])
+        self.capacity = capacity
+        self._buffers = buffers
+
+    def covers(self, timestamp_ms):
+        """
+        Checks whether the buffers hold every sample read after a point in time.
+
+        :param timestamp_ms: Epoch milliseconds.
+        :return: True if buffering started at or before timestamp_ms and no
+                 buffer has since overwritten a sample newer than it.
+        """
+        if self._started_ms is None or self._started_ms > timestamp_ms:
+            return False
+        for buffer in self._buffers.values():
+            if len(buffer) == buffer.capacity and buffer.oldest_timestamp() > timestamp_ms:
+                return False
+        return True
+
+    def export(self):
+        """
+        Returns the whole store as plain data for another process.
+
+        :return: A (started_ms, {label: (timestamps, values)}) tuple.
+        """
+        return self._started_ms, {label: buffer.samples() for label, buffer in self._buffers.items()}
+
+    @classmethod
+    def restore(cls, capacity, started_ms, samples):
+        """
+        Rebuilds a store from the result of export().
+
+        :param capacity: Number of samples kept per sensor.
+        :param started_ms: Read time of the first sample in any buffer.
+        :param samples: Dict mapping label to (timestamps, values).
+        """
+        store = cls(capacity)
+        store._started_ms = started_ms
+        for label, (timestamps, values) in samples.items():
+            buffer = store._buffers[label] = SensorRingBuffer(capacity)
+            buffer.load(timestamps, values)
+        return store
+
+    def newest_timestamp(self):
+        """
+        Returns the newest read time across all buffers, or None if all are empty.
+        """
+        newest = [buffer.newest_timestamp() for buffer in self._buffers.values() if len(buffer)]
+        return max(newest, default=None)
@@ -0,0 +1,174 @@
+"""
+This module provides a TemperatureSampler that reads every active sensor on a
+fixed schedule and publishes the latest readings as an immutable snapshot.
+"""
+
+import asyncio
+import logging
+import time
+from collections import namedtuple
+from metrics import registry
+
+# A single sensor reading. `temperature` is None and `error` holds the message
+# when the read failed. `raw` is the unfiltered temperature, when it is kept.
+SensorReading = namedtuple('SensorReading', ['label', 'temperature', 'timestamp', 'error', 'raw'], defaults=(None,))
+
+# The readings from one sweep over all sensors. `readings` is a tuple so the
+# snapshot can be handed to any number of request handlers without copying.
+Snapshot = namedtuple('Snapshot', ['readings', 'sequence', 'taken_at'])
+
+EMPTY_SNAPSHOT = Snapshot(readings=(), sequence=0, taken_at=None)
+
+SWEEP_SECONDS = registry.histogram('masterpi_sampler_sweep_seconds', 'Time to read every active sensor once.')
+SENSOR_READ_SECONDS = registry.histogram(
+    'masterpi_sensor_read_seconds',
+    'Time to read a sensor; for one-shot sensors from starting the conversion to collecting it.',
+    ['sensor'])
+SENSOR_READ_FAILURES = registry.counter(
+    'masterpi_sensor_read_failures_total', 'Sensor reads that failed, timed out or were skipped.', ['sensor'])
+
+
+class TemperatureSampler:
+    """
+    Reads all active sensors on a fixed interval in a worker thread and keeps
+    the most recent results as an immutable Snapshot.
+    """
+
+    def __init__(self, get_sensors, read_sensor, interval=5.0, read_sweep=None, filters=None):
+        """
+        Initializes the sampler.
+
+        :param get_sensors: Callable returning the current list of (sensor, label) tuples.
+        :param read_sensor: Callable taking (sensor, label) and returning a temperature,
+                            raising an exception if the read fails.
+        :param interval: Time in seconds between the start of two sweeps.
+        :param read_sweep: Optional callable reading a whole list of (sensor, label)
+                           tuples at once and returning (temperature, timestamp, error)
+                           tuples, used instead of read_sensor when given.
+        :param filters: Optional filters.SensorFilters run over every successful
+                        reading before it is published.
+        """
+        self.get_sensors = get_sensors
+        self.read_sensor = read_sensor
+        self.read_sweep = read_sweep
+        self.filters = filters
+        self.interval = interval
+        self._snapshot = EMPTY_SNAPSHOT
+        self._listeners = []
+        self._task = None
+
+    def add_listener(self, callback):
+        """
+        Registers a callback to be called with every new snapshot.
+
+        Callbacks run on the event loop right after a sweep completes, so they
+        must not block.
+
+        :param callback: Callable taking a Snapshot.
+        """
+        self._listeners.append(callback)
+
+    def snapshot(self):
+        """
+        Returns the most recently published snapshot.
+
+        :return: The latest Snapshot; EMPTY_SNAPSHOT before the first sweep.
+        """
+        return self._snapshot
+
+    def sweep(self):
+        """
+        Reads every active sensor once and publishes the result.
+
+        This blocks on the hardware, so it is run in a worker thread by run().
+
+        :return: The newly published Snapshot.
+        """
+        sweep_start = time.perf_counter()
+        sensors = list(self.get_sensors())
+        if self.read_sweep is not None:
+            results = self.read_sweep(sensors)
+        else:
+            results = []
+            for sensor, label in sensors:
+                start = time.perf_counter()
+                try:
+                    results.append((self.read_sensor(sensor, label), time.time(), None))
+                except Exception as e:
+                    results.append((None, time.time(), e))
+                SENSOR_READ_SECONDS.labels(label).observe(time.perf_counter() - start)
+
+        previous = {reading.label: reading for reading in self._snapshot.readings}
+        readings = []
+        for (sensor, label), (temperature, timestamp, error) in zip(sensors, results):
+            repeated = previous.get(label)
+            if error is None and repeated is not None and repeated.error is None and repeated.timestamp == timestamp:
+                # A cached reading seen last sweep (a Meater probe between polls);
+                # it is not run through the filters a second time
+                readings.append(repeated)
+            elif error is not None:
+                logging.error("Error reading temperature for %s: %s", label, error)
+                SENSOR_READ_FAILURES.labels(label).inc()
+                readings.append(SensorReading(label, None, timestamp, str(error)))
+            elif self.filters is not None:
+                temperature, raw = self.filters.apply(label, temperature, timestamp)
+                readings.append(SensorReading(label, temperature, timestamp, None, raw))
+            else:
+                readings.append(SensorReading(label, temperature, timestamp, None))
+
+        snapshot = Snapshot(
+            readings=tuple(readings),
+            sequence=self._snapshot.sequence + 1,
+            taken_at=time.time()
+        )
+        self._snapshot = snapshot
+        SWEEP_SECONDS.observe(time.perf_counter() - sweep_start)
+        return snapshot
+
+    async def run(self):
+        """
+        Sweeps the sensors forever, once every `interval` seconds.
+        """
+        loop = asyncio.get_running_loop()
+        next_sweep = loop.time()
+        while True:
+            try:
+                snapshot = await asyncio.to_thread(self.sweep)
+                self._publish(snapshot)
+            except Exception as e:
+                logging.error("Error during sensor sweep: %s", e)
+            next_sweep += self.interval
+            delay = next_sweep - loop.time()
+            if delay < 0:
+                # The sweep overran the interval; start the next one now rather
+                # than trying to catch up on the missed ones.
+                next_sweep = loop.time()
+                delay = 0
+            await asyncio.sleep(delay)
+
+    def _publish(self, snapshot):
+        for callback in self._listeners:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                logging.error("Error in snapshot listener %r: %s", callback, e)
+
+    def start(self):
+        """
+        Starts the sampling task on the running event loop.
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        """
+        Cancels the sampling task and waits for it to finish.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
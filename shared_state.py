@@ -0,0 +1,293 @@
+"""
+This module shares the hardware-owner process's state with the web worker
+processes: the latest snapshot, the control state and the ring buffers are
+published into a shared-memory segment guarded by a sequence lock, and the
+workers send control commands back over a Unix socket.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import struct
+import time
+import zlib
+from array import array
+from collections import namedtuple
+from multiprocessing import shared_memory
+from ring_buffer import RingBufferStore
+from sampler import SensorReading, Snapshot, EMPTY_SNAPSHOT
+
+# Segment header: magic, sequence, payload length, payload CRC-32
+HEADER = struct.Struct('<8sQII')
+MAGIC = b'MPISTATE'
+SEQUENCE_OFFSET = 8
+LENGTH_OFFSET = 16
+JSON_LENGTH = struct.Struct('<I')
+
+# Times a reader retries when it races the writer before returning its last good state
+READ_ATTEMPTS = 100
+
+# What a reader sees: the sampler Snapshot, the control state dict and a RingBufferStore
+SharedState = namedtuple('SharedState', ['snapshot', 'state', 'ring_buffers'])
+
+EMPTY_STATE = SharedState(EMPTY_SNAPSHOT, {}, RingBufferStore(1))
+
+
+def _encode_rings(ring_buffers):
+    """Encode a RingBufferStore as (metadata dict, sample bytes)."""
+    started_ms, samples = ring_buffers.export()
+    meta = {
+        'capacity': ring_buffers.capacity,
+        'started_ms': started_ms,
+        'sensors': [[label, len(timestamps)] for label, (timestamps, _) in samples.items()],
+    }
+    chunks = []
+    for timestamps, values in samples.values():
+        chunks.append(timestamps.tobytes())
+        chunks.append(values.tobytes())
+    return meta, b''.join(chunks)
+
+
+def _encode(snapshot, state, rings):
+    doc = {
+        'snapshot': {
+            'readings': [list(reading) for reading in snapshot.readings],
+            'sequence': snapshot.sequence,
+            'taken_at': snapshot.taken_at,
+        },
+        'state': state,
+    }
+    data = b''
+    if rings is not None:
+        doc['ring_buffers'], data = rings
+    encoded = json.dumps(doc, separators=(',', ':')).encode('utf-8')
+    return JSON_LENGTH.pack(len(encoded)) + encoded + data
+
+
+def _decode(payload, previous=EMPTY_STATE):
+    json_length = JSON_LENGTH.unpack_from(payload)[0]
+    offset = JSON_LENGTH.size + json_length
+    doc = json.loads(payload[JSON_LENGTH.size:offset])
+    snapshot = Snapshot(
+        readings=tuple(SensorReading(*reading) for reading in doc['snapshot']['readings']),
+        sequence=doc['snapshot']['sequence'],
+        taken_at=doc['snapshot']['taken_at']
+    )
+    rings = doc.get('ring_buffers')
+    if rings is None:
+        return SharedState(snapshot, doc['state'], RingBufferStore(1))
+    if snapshot.sequence == previous.snapshot.sequence and previous.ring_buffers.capacity == rings['capacity']:
+        # Only the control state changed; the buffers are those of the same sweep
+        return SharedState(snapshot, doc['state'], previous.ring_buffers)
+    samples = {}
+    for label, count in rings['sensors']:
+        timestamps = array('q', payload[offset:offset + 8 * count])
+        offset += 8 * count
+        values = array('f', payload[offset:offset + 4 * count])
+        offset += 4 * count
+        samples[label] = (timestamps, values)
+    return SharedState(snapshot, doc['state'],
+                       RingBufferStore.restore(rings['capacity'], rings['started_ms'], samples))
+
+
+class SharedStateWriter:
+    """
+    Publishes state into a shared-memory segment for any number of readers.
+
+    Each publish bumps the sequence to an odd number, writes the payload and
+    bumps it to the next even number, so readers can tell a torn read from a
+    complete one without taking a lock (a sequence lock). The payload also
+    carries a CRC-32 as a second check.
+    """
+
+    def __init__(self, name, size):
+        """
+        Creates the segment, replacing a stale one left by a previous run.
+
+        :param name: Name of the shared-memory segment.
+        :param size: Size of the segment in bytes.
+        """
+        try:
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self.name = name
+        self.sequence = 0
+        HEADER.pack_into(self.shm.buf, 0, MAGIC, 0, 0, 0)
+        self._rings_dropped = False
+        # Encoded ring buffers and the snapshot sequence they were encoded at
+        self._rings = None
+        self._rings_sequence = None
+
+    def publish(self, snapshot, state, ring_buffers=None):
+        """
+        Publishes a new state.
+
+        :param snapshot: The latest sampler Snapshot.
+        :param state: JSON-serializable dict of control state, e.g. fan and setpoint.
+        :param ring_buffers: RingBufferStore to share, or None. The buffers only
+                             change with the snapshot, so they are encoded once
+                             per snapshot sequence however often the state is published.
+        """
+        rings = None
+        if ring_buffers is not None:
+            if self._rings is None or self._rings_sequence != snapshot.sequence:
+                self._rings = _encode_rings(ring_buffers)
+                self._rings_sequence = snapshot.sequence
+            rings = self._rings
+        payload = _encode(snapshot, state, rings)
+        if HEADER.size + len(payload) > self.shm.size:
+            if not self._rings_dropped:
+                logging.warning("Shared state of %d bytes exceeds the %d byte segment; not sharing ring buffers",
+                                len(payload), self.shm.size)
+                self._rings_dropped = True
+            payload = _encode(snapshot, state, None)
+        buf = self.shm.buf
+        struct.pack_into('<Q', buf, SEQUENCE_OFFSET, self.sequence + 1)
+        buf[HEADER.size:HEADER.size + len(payload)] = payload
+        struct.pack_into('<II', buf, LENGTH_OFFSET, len(payload), zlib.crc32(payload))
+        self.sequence += 2
+        struct.pack_into('<Q', buf, SEQUENCE_OFFSET, self.sequence)
+
+    def close(self):
+        """
+        Closes and removes the segment.
+        """
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 every attach registers with the resource tracker.
+        # The workers share the tracker of the process that started them with
+        # the writer, so the registration is a no-op rather than a second owner.
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedStateReader:
+    """
+    Reads the state published by a SharedStateWriter in another process.
+
+    The decoded state is cached until the writer publishes again, so repeated
+    reads cost one 8-byte comparison.
+    """
+
+    def __init__(self, name, timeout=30.0):
+        """
+        Attaches to the segment, waiting for the writer to create it.
+
+        :param name: Name of the shared-memory segment.
+        :param timeout: Time in seconds to wait for the segment.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self.shm = _attach(name)
+                break
+            except FileNotFoundError:
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.1)
+        self._sequence = 0
+        self._state = EMPTY_STATE
+
+    @property
+    def sequence(self):
+        """
+        The writer's current sequence number; it changes with every publish.
+        """
+        return struct.unpack_from('<Q', self.shm.buf, SEQUENCE_OFFSET)[0]
+
+    def read(self):
+        """
+        Returns the latest complete SharedState.
+        """
+        buf = self.shm.buf
+        for _ in range(READ_ATTEMPTS):
+            sequence = self.sequence
+            if sequence == self._sequence:
+                return self._state
+            if sequence & 1:
+                time.sleep(0.0001)  # The writer is mid-publish
+                continue
+            length, crc = struct.unpack_from('<II', buf, LENGTH_OFFSET)
+            payload = bytes(buf[HEADER.size:HEADER.size + length])
+            if self.sequence != sequence or zlib.crc32(payload) != crc:
+                continue
+            self._state = _decode(payload, self._state)
+            self._sequence = sequence
+            return self._state
+        logging.warning("Could not get a consistent shared state read; using the previous one")
+        return self._state
+
+    def close(self):
+        """
+        Detaches from the segment.
+        """
+        self.shm.close()
+
+
+async def serve_commands(path, handler):
+    """
+    Serve commands from web workers on a Unix socket.
+
+    Each connection carries one JSON request line, {"command": ..., "args": {...}},
+    and gets one JSON response line, {"result": ...} or {"error": ...}.
+
+    :param path: Path of the Unix socket.
+    :param handler: Coroutine function taking (command, args) and returning the result.
+    :return: The asyncio server.
+    """
+    async def handle(reader, writer):
+        try:
+            request = json.loads(await reader.readline())
+            try:
+                response = {'result': await handler(request['command'], request.get('args', {}))}
+            except Exception as e:
+                logging.error("Error handling command %s: %s", request.get('command'), e)
+                response = {'error': str(e)}
+            writer.write(json.dumps(response).encode('utf-8') + b'\n')
+            await writer.drain()
+        finally:
+            writer.close()
+
+    if os.path.exists(path):
+        os.unlink(path)  # Left over from a previous run
+    server = await asyncio.start_unix_server(handle, path=path)
+    os.chmod(path, 0o600)
+    return server
+
+
+async def send_command(path, command, timeout=5.0, **args):
+    """
+    Send a command to the process serving commands on a Unix socket.
+
+    :param path: Path of the Unix socket.
+    :param command: The command name.
+    :param timeout: Time in seconds to wait for the response.
+    :param args: Arguments of the command.
+    :return: The command's result.
+    """
+    async def exchange():
+        reader, writer = await asyncio.open_unix_connection(path, limit=2 ** 22)
+        try:
+            writer.write(json.dumps({'command': command, 'args': args}).encode('utf-8') + b'\n')
+            await writer.drain()
+            return json.loads(await reader.readline())
+        finally:
+            writer.close()
+
+    response = await asyncio.wait_for(exchange(), timeout)
+    if 'error' in response:
+        raise RuntimeError(response['error'])
+    return response['result']
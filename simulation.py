@@ -0,0 +1,356 @@
+"""
+This module provides a simulated hardware backend: sensors with realistic read
+latency and noise, and a first-order smoker thermal model driven by a
+simulated fan, so the application can run on any Linux machine.
+"""
+
+import math
+import random
+import threading
+import time
+import weakref
+from bus import SPIBusManager, pipelined_sweep
+
+class SimulatedClock:
+    """
+    A clock that runs `time_scale` times faster than real time.
+    """
+
+    def __init__(self, time_scale=1.0):
+        """
+        Initializes the clock.
+
+        :param time_scale: How many simulated seconds pass per real second.
+        """
+        self.time_scale = time_scale
+        self._start = time.monotonic()
+
+    def now(self):
+        """
+        Returns the simulated time in seconds since the clock was created.
+        """
+        return (time.monotonic() - self._start) * self.time_scale
+
+    def sleep(self, seconds):
+        """
+        Blocks for a duration of simulated time.
+
+        :param seconds: Simulated seconds to sleep.
+        """
+        if seconds > 0:
+            time.sleep(seconds / self.time_scale)
+
+class SmokerModel:
+    """
+    A first-order thermal model of a gravity-fed smoker.
+
+    The firebox (pit) temperature relaxes towards a high equilibrium while the
+    fan feeds the fire and towards a smoldering equilibrium while it is off.
+    The meat relaxes towards the pit temperature with a much longer time
+    constant. All temperatures are in Celsius, like the sensor chips report.
+    """
+
+    def __init__(self, clock, ambient_temperature=20.0, idle_temperature=65.0, fan_temperature=230.0,
+                 pit_time_constant=600.0, meat_time_constant=7200.0):
+        """
+        Initializes the model with the pit and meat at ambient temperature.
+
+        :param clock: The SimulatedClock driving the model.
+        :param ambient_temperature: Temperature around the smoker.
+        :param idle_temperature: Pit equilibrium with the fan off.
+        :param fan_temperature: Pit equilibrium with the fan on.
+        :param pit_time_constant: Pit time constant in seconds.
+        :param meat_time_constant: Meat time constant in seconds.
+        """
+        self.clock = clock
+        self.ambient_temperature = ambient_temperature
+        self.idle_temperature = idle_temperature
+        self.fan_temperature = fan_temperature
+        self.pit_time_constant = pit_time_constant
+        self.meat_time_constant = meat_time_constant
+        self.pit_temperature = ambient_temperature
+        self.meat_temperature = ambient_temperature
+        self.fan_on = False
+        self._lock = threading.Lock()
+        self._last_update = clock.now()
+
+    def _advance(self):
+        now = self.clock.now()
+        dt = now - self._last_update
+        if dt <= 0:
+            return
+        self._last_update = now
+        target = self.fan_temperature if self.fan_on else self.idle_temperature
+        # Exact step response of a first-order system over dt
+        self.pit_temperature = target + (self.pit_temperature - target) * math.exp(-dt / self.pit_time_constant)
+        self.meat_temperature = self.pit_temperature + (
+            (self.meat_temperature - self.pit_temperature) * math.exp(-dt / self.meat_time_constant)
+        )
+
+    def set_fan(self, on):
+        """
+        Turns the simulated fan on or off.
+
+        :param on: True to feed the fire.
+        """
+        with self._lock:
+            self._advance()
+            self.fan_on = bool(on)
+
+    def temperature(self, source):
+        """
+        Returns the current temperature at a point in the smoker.
+
+        :param source: 'pit', 'meat' or 'ambient'.
+        """
+        with self._lock:
+            self._advance()
+            if source == 'pit':
+                return self.pit_temperature
+            elif source == 'meat':
+                return self.meat_temperature
+            elif source == 'ambient':
+                return self.ambient_temperature
+            raise ValueError(f"Unknown simulation source: {source}")
+
+class SimulatedSensor:
+    """
+    A simulated temperature sensor that blocks for the chip's read latency and
+    adds Gaussian noise to the model temperature.
+    """
+
+    read_latency = 0.0  # Seconds a read blocks on the real chip
+    failure_rate = 0.0  # Fraction of reads that raise, like the real driver
+    failure_message = 'Simulated read failure'
+    default_source = 'pit'
+
+    def __init__(self, model, source=None, noise=0.25):
+        """
+        Initializes the sensor.
+
+        :param model: The SmokerModel to read from.
+        :param source: 'pit', 'meat' or 'ambient'; defaults per sensor type.
+        :param noise: Standard deviation of the read noise in degrees.
+        """
+        self.model = model
+        self.source = source or self.default_source
+        self.noise = noise
+
+    @property
+    def temperature(self):
+        """
+        Reads the temperature, blocking for the simulated read latency.
+        """
+        self.model.clock.sleep(self.read_latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise RuntimeError(self.failure_message)
+        return self.model.temperature(self.source) + random.gauss(0.0, self.noise)
+
+class SimulatedMAX31855(SimulatedSensor):
+    """A MAX31855 thermocouple amplifier; it converts continuously, so reads are quick."""
+    read_latency = 0.001
+
+class SimulatedMAX31856(SimulatedSensor):
+    """
+    A MAX31856 thermocouple amplifier doing a one-shot conversion per read,
+    with the driver's non-blocking one-shot API.
+    """
+    read_latency = 0.185
+
+    def __init__(self, model, source=None, noise=0.25):
+        super().__init__(model, source, noise)
+        self._conversion_done_at = None
+        self._converted = None
+
+    def initiate_one_shot_measurement(self):
+        """
+        Starts a conversion and returns immediately.
+        """
+        self._conversion_done_at = self.model.clock.now() + self.read_latency
+
+    @property
+    def oneshot_pending(self):
+        """
+        True while the conversion started by initiate_one_shot_measurement() is running.
+        """
+        if self._conversion_done_at is None:
+            return False
+        if self.model.clock.now() < self._conversion_done_at:
+            return True
+        self._converted = self.model.temperature(self.source) + random.gauss(0.0, self.noise)
+        self._conversion_done_at = None
+        return False
+
+    def unpack_temperature(self):
+        """
+        Returns the result of the last completed conversion.
+        """
+        if self._converted is None:
+            raise RuntimeError('No conversion has completed')
+        return self._converted
+
+    @property
+    def temperature(self):
+        """
+        Starts a conversion and blocks until it completes, like the driver.
+        """
+        self.initiate_one_shot_measurement()
+        while self.oneshot_pending:
+            self.model.clock.sleep(0.01)
+        return self.unpack_temperature()
+
+class SimulatedMAX31865(SimulatedSensor):
+    """
+    A MAX31865 RTD amplifier. A read biases the RTD and waits for a one-shot
+    conversion unless `auto_convert` is on, when it returns the latest result.
+    """
+    default_source = 'meat'
+    auto_convert = False
+
+    @property
+    def read_latency(self):
+        return 0.001 if self.auto_convert else 0.075
+
+class SimulatedADS1115(SimulatedSensor):
+    """An ADS1115 channel with a TMP36-style probe, read as a voltage."""
+    read_latency = 0.008
+    default_source = 'meat'
+
+    @property
+    def voltage(self):
+        """
+        Reads the probe voltage (10 mV per degree, 0.5 V at zero).
+        """
+        return self.temperature / 100 + 0.5
+
+class SimulatedDHT22(SimulatedSensor):
+    """A DHT22, which is slow to read and regularly fails its checksum."""
+    read_latency = 0.25
+    failure_rate = 0.1
+    failure_message = 'Checksum did not validate. Try again.'
+    default_source = 'ambient'
+
+class SimulatedFan:
+    """
+    Stands in for the fan's DigitalInOut; setting `value` drives the model.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.direction = None
+
+    @property
+    def value(self):
+        return self.model.fan_on
+
+    @value.setter
+    def value(self, on):
+        self.model.set_fan(on)
+
+class SimulatedBackend:
+    """
+    Creates simulated sensors and a simulated fan sharing one SmokerModel.
+    """
+
+    name = 'simulated'
+
+    SENSOR_TYPES = {
+        'MAX31855': SimulatedMAX31855,
+        'MAX31856': SimulatedMAX31856,
+        'MAX31865': SimulatedMAX31865,
+        'ADS1115': SimulatedADS1115,
+        'DHT22': SimulatedDHT22,
+    }
+
+    def __init__(self, settings=None):
+        """
+        Initializes the backend.
+
+        :param settings: The `hardware.simulation` section of config.yaml.
+        """
+        settings = settings or {}
+        self.spi_buses = SPIBusManager(factory=lambda bus_id: None)
+        self._sensor_buses = weakref.WeakKeyDictionary()
+        self._bus_names = weakref.WeakKeyDictionary()
+        self.noise = settings.get('noise', 0.25)
+        self.clock = SimulatedClock(settings.get('time_scale', 1.0))
+        self.model = SmokerModel(
+            self.clock,
+            ambient_temperature=settings.get('ambient_temperature', 20.0),
+            idle_temperature=settings.get('idle_temperature', 65.0),
+            fan_temperature=settings.get('fan_temperature', 230.0),
+            pit_time_constant=settings.get('pit_time_constant', 600.0),
+            meat_time_constant=settings.get('meat_time_constant', 7200.0)
+        )
+
+    def initialize_sensor(self, sensor_config):
+        """
+        Creates a simulated sensor for a sensor configuration.
+
+        A sensor entry may set `sim_source` to 'pit', 'meat' or 'ambient' to
+        choose which part of the model it measures.
+
+        :param sensor_config: The sensor's entry from the `sensors` list in config.yaml.
+        :return: The simulated sensor.
+        """
+        sensor_type = sensor_config['type']
+        sensor_class = self.SENSOR_TYPES.get(sensor_type)
+        if sensor_class is None:
+            raise ValueError(f"Unsupported sensor type: {sensor_type}")
+        sensor = sensor_class(self.model, sensor_config.get('sim_source'), self.noise)
+        if sensor_type in ('MAX31865', 'MAX31855', 'MAX31856'):
+            bus = self._sensor_buses[sensor] = self.spi_buses.get(sensor_config.get('spi_bus', 0))
+            self._bus_names[sensor] = bus.name
+            if sensor_type == 'MAX31865':
+                sensor.auto_convert = True  # As the real backend configures it
+        elif sensor_type == 'ADS1115':
+            self._bus_names[sensor] = 'i2c1'
+        else:
+            self._bus_names[sensor] = f"gpio-{sensor_config.get('chip_select_pin') or 'D4'}"
+        return sensor
+
+    def release_sensor(self, sensor):
+        """
+        Releases a simulated sensor; it holds no pins, so this only forgets its bus.
+        """
+        self._sensor_buses.pop(sensor, None)
+        self._bus_names.pop(sensor, None)
+
+    def read_sensor(self, sensor, sensor_id):
+        """
+        Reads the temperature from a simulated sensor, raising an exception if the read fails.
+        """
+        if isinstance(sensor, SimulatedADS1115):
+            # Same conversion as the real ADS1115 path
+            return (sensor.voltage - 0.5) * 100
+        elif isinstance(sensor, SimulatedSensor):
+            return sensor.temperature
+        raise ValueError(f"Unsupported sensor type for {sensor_id}")
+
+    def read_sweep(self, sensors, results=None):
+        """
+        Reads a list of simulated sensors with the same pipelining as the real backend.
+
+        :param sensors: List of (sensor, label) tuples.
+        :param results: Optional list filled in as each read completes, as for pipelined_sweep().
+        :return: List of (temperature, timestamp, error) tuples in the same order.
+        """
+        return pipelined_sweep(sensors, self.read_sensor, self._bus_lock, results)
+
+    def bus_name(self, sensor):
+        """
+        Returns the name of the bus a sensor is on; sensors on different buses can be read in parallel.
+        """
+        return self._bus_names.get(sensor, 'default')
+
+    def _bus_lock(self, sensor):
+        bus = self._sensor_buses.get(sensor)
+        return bus.lock if bus is not None else None
+
+    def fan_output(self, fan_pin):
+        """
+        Returns a simulated fan output that drives the thermal model.
+
+        :param fan_pin: The fan pin from config.yaml (unused).
+        """
+        return SimulatedFan(self.model)
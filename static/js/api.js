@@ -36,6 +36,31 @@ export function fetchTemperatureData(timeRange) {
         });
 }
 
+export function fetchTemperatureHistory(timeRange, points, since = null) {
+    let url = `/api/history?time_range=${timeRange}&points=${points}`;
+    if (since !== null) {
+        url += `&since=${since}`;  // Only points read after the cursor
+    }
+    return fetch(url)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`Network response was not ok: ${response.statusText}`);
+            }
+            return response.json();
+        })
+        .then(data => {
+            // Check if the data is in the expected format
+            if (!data.sensors || !Array.isArray(data.sensors)) {
+                throw new Error('Invalid data format');
+            }
+            return data;  // {cursor, sensors: [{label, timestamps, temperatures}]}
+        })
+        .catch(error => {
+            console.error('Error fetching temperature history:', error);
+            throw error;
+        });
+}
+
 export async function fetchStatus() {
     try {
         const response = await fetch('/api/status');
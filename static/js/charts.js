@@ -1,6 +1,10 @@
-import { fetchTemperatureData } from './api.js';
+import { fetchTemperatureHistory } from './api.js';
+
+const HISTORY_POINTS = 300;  // Points per chart; the server downsamples to this
 
 let charts = [];
+let cursor = null;  // Read time (epoch ms) of the newest point the charts hold
+let cursorRange = null;  // Time range the cursor belongs to
 let timezone = 'UTC';  // Default timezone
 let tempUnit = 'F';  // Default temperature unit
 
@@ -42,6 +46,7 @@ function initializeCharts() {
         }
     });
     charts = [];
+    cursor = null;  // New charts start empty, so the next update loads the full window
 
     canvases.forEach((canvas, index) => {
         console.log(`Initializing chart for canvas: ${canvas.id}`);  // Log canvas ID
@@ -63,11 +68,14 @@ function initializeCharts() {
                         type: 'time',
                         time: {
                             unit: 'minute',
-                            tooltipFormat: 'MMM d, yyyy, h:mm:ss a',  // Format for tooltip
                             displayFormats: {
                                 minute: 'MMM d, yyyy, h:mm:ss a'
                             }
                         },
+                        ticks: {
+                            // Points hold epoch ms; labels are shown in the configured timezone
+                            callback: value => formatTime(value)
+                        },
                         title: {
                             display: true,
                             text: 'Time'
@@ -80,6 +88,13 @@ function initializeCharts() {
                             text: 'Temperature (°F)'
                         }
                     }
+                },
+                plugins: {
+                    tooltip: {
+                        callbacks: {
+                            title: items => items.length ? formatTime(items[0].parsed.x) : ''
+                        }
+                    }
                 }
             }
         });
@@ -87,29 +102,33 @@ function initializeCharts() {
     });
 }
 
-function updateCharts() {
-    console.log('Updating charts');
+function toPoint(timestamp, temperature) {
+    return {
+        x: timestamp,  // Epoch ms, so the time scale and trimming never parse a formatted string
+        y: convertTemperature(temperature, tempUnit)  // Convert temperature
+    };
+}
+
+function formatTime(timestamp) {
+    return new Date(timestamp).toLocaleString('en-US', { timeZone: timezone });
+}
+
+function loadCharts() {
+    console.log('Loading chart history');
     const timeRange = document.getElementById('time-range').value;
-    fetchTemperatureData(timeRange)
-        .then(data => {
-            console.log('Raw data received:', data);  // Log the raw data for inspection
-            if (!Array.isArray(data)) {
-                console.error('Invalid data format received');
-                return;
-            }
-            if (data.length === 0) {
+    cursorRange = timeRange;
+    fetchTemperatureHistory(timeRange, HISTORY_POINTS)
+        .then(history => {
+            cursor = history.cursor;
+            const sensors = history.sensors;
+            if (sensors.length === 0) {
                 console.warn('No temperature data available');
                 return;
             }
             charts.forEach((chart, index) => {
-                const probeData = data[index];
+                const probeData = sensors[index];
                 if (probeData && probeData.timestamps && probeData.temperatures) {  // Check if probeData and its properties are defined
-                    console.log(`Updating chart ${index} with data:`, probeData);
-                    chart.data.datasets[0].data = probeData.timestamps.map((timestamp, i) => ({
-                        x: new Date(timestamp).toLocaleString('en-US', { timeZone: timezone }),
-                        y: convertTemperature(probeData.temperatures[i], tempUnit)  // Convert temperature
-                    }));
-                    console.log(`Chart ${index} data:`, chart.data.datasets[0].data);
+                    chart.data.datasets[0].data = probeData.timestamps.map((timestamp, i) => toPoint(timestamp, probeData.temperatures[i]));
                     chart.update();
                 } else {
                     console.warn(`No data available for chart ${index}`);
@@ -121,6 +140,39 @@ function updateCharts() {
         });
 }
 
+function updateCharts() {
+    const timeRange = document.getElementById('time-range').value;
+    // A new range needs a fresh window; otherwise only fetch what is new
+    if (cursor === null || timeRange !== cursorRange) {
+        loadCharts();
+        return;
+    }
+    fetchTemperatureHistory(timeRange, HISTORY_POINTS, cursor)
+        .then(history => {
+            cursor = history.cursor;
+            const windowStart = Date.now() - timeRange * 60 * 1000;
+            charts.forEach((chart, index) => {
+                const probeData = history.sensors[index];
+                if (!probeData || probeData.timestamps.length === 0) {
+                    return;
+                }
+                const points = chart.data.datasets[0].data;
+                probeData.timestamps.forEach((timestamp, i) => {
+                    points.push(toPoint(timestamp, probeData.temperatures[i]));
+                });
+                // Drop points that have scrolled out of the selected range
+                const firstKept = points.findIndex(point => point.x >= windowStart);
+                if (firstKept > 0) {
+                    points.splice(0, firstKept);
+                }
+                chart.update('none');
+            });
+        })
+        .catch(error => {
+            console.error('Error fetching temperature data:', error);
+        });
+}
+
 function convertTemperature(value, unit) {
     if (unit === 'C') {
         return (value - 32) * 5 / 9;  // Convert Fahrenheit to Celsius
@@ -73,40 +73,13 @@ document.addEventListener("DOMContentLoaded", function() {
         });
     });
 
-    // Fetch and display status data
+    // Show the current status, then keep it live from the snapshot stream
     fetchStatus()
-        .then(status => {
-            const fanStatusElement = document.getElementById('fan-status');
-            if (fanStatusElement) {
-                fanStatusElement.textContent = status.fan_on ? 'On' : 'Off';
-            } else {
-                console.error('Element with id "fan-status" not found.');
-            }
-
-            const targetTempElement = document.getElementById('current-target-temp');
-            if (targetTempElement) {
-                targetTempElement.textContent = status.target_temperature;
-            } else {
-                console.error('Element with id "current-target-temp" not found.');
-            }
-
-            // Display temperatures
-            if (status.temperatures && Array.isArray(status.temperatures)) {
-                status.temperatures.forEach((temp, index) => {
-                    const probeElement = document.getElementById(`probe-${index}`);
-                    if (probeElement) {
-                        probeElement.textContent = `${temp} °F`;
-                    } else {
-                        console.error(`Element with id "probe-${index}" not found.`);
-                    }
-                });
-            } else {
-                console.error('Invalid or missing temperatures data in status');
-            }
-        })
+        .then(renderStatus)
         .catch(error => {
             console.error('Error fetching status:', error);
         });
+    subscribeToStatus();
 
     // Add event listener for time range change
     document.getElementById('time-range').addEventListener('change', () => {
@@ -167,6 +140,54 @@ document.addEventListener("DOMContentLoaded", function() {
     };
 });
 
+// Display the fan state, target and probe temperatures from a status or stream snapshot
+function renderStatus(status) {
+    const fanStatusElement = document.getElementById('fan-status');
+    if (fanStatusElement) {
+        fanStatusElement.textContent = status.fan_on ? 'On' : 'Off';
+    } else {
+        console.error('Element with id "fan-status" not found.');
+    }
+
+    const targetTempElement = document.getElementById('current-target-temp');
+    if (targetTempElement) {
+        targetTempElement.textContent = status.target_temperature;
+    } else {
+        console.error('Element with id "current-target-temp" not found.');
+    }
+
+    // Display temperatures
+    if (status.temperatures && Array.isArray(status.temperatures)) {
+        status.temperatures.forEach((temp, index) => {
+            // Stream snapshots carry {label, temperature, ...}; /api/status carries plain values
+            const value = (temp !== null && typeof temp === 'object') ? temp.temperature : temp;
+            const probeElement = document.getElementById(`probe-${index}`);
+            if (probeElement) {
+                probeElement.textContent = `${value} °F`;
+            } else {
+                console.error(`Element with id "probe-${index}" not found.`);
+            }
+        });
+    } else {
+        console.error('Invalid or missing temperatures data in status');
+    }
+}
+
+// Receive every new sampler snapshot as soon as it is read instead of polling
+function subscribeToStatus() {
+    if (!window.EventSource) {
+        return;
+    }
+    const source = new EventSource('/api/stream');
+    source.addEventListener('snapshot', event => {
+        renderStatus(JSON.parse(event.data));
+    });
+    source.onerror = error => {
+        // EventSource reconnects on its own; just note it
+        console.warn('Status stream interrupted, reconnecting...', error);
+    };
+}
+
 // Add this new function to update the sensor display
 async function updateSensorDisplay() {
     try {
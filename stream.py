@@ -0,0 +1,71 @@
+"""
+This module provides a SnapshotBroadcaster that fans sampler snapshots out to
+any number of streaming clients without letting a slow client hold up the rest.
+"""
+
+import asyncio
+import json
+
+
+def format_event(event, data):
+    """
+    Format a Server-Sent Events message.
+
+    :param event: The event name.
+    :param data: JSON-serializable payload.
+    :return: The encoded message, ready to be written to the response.
+    """
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode('utf-8')
+
+
+class SnapshotBroadcaster:
+    """
+    Keeps one bounded queue per subscriber. When a subscriber falls behind, its
+    oldest pending message is dropped to make room, so publishing never waits.
+    """
+
+    def __init__(self, queue_size=8):
+        """
+        Initializes the broadcaster.
+
+        :param queue_size: Maximum number of pending messages per subscriber.
+        """
+        self.queue_size = queue_size
+        self._subscribers = set()
+
+    @property
+    def subscriber_count(self):
+        """
+        Returns the number of connected subscribers.
+        """
+        return len(self._subscribers)
+
+    def subscribe(self):
+        """
+        Registers a new subscriber.
+
+        :return: The asyncio.Queue the subscriber should read messages from.
+        """
+        subscriber = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        """
+        Removes a subscriber registered with subscribe().
+
+        :param subscriber: The queue returned by subscribe().
+        """
+        self._subscribers.discard(subscriber)
+
+    def publish(self, message):
+        """
+        Delivers a message to every subscriber. Must be called on the event loop.
+
+        :param message: The message to deliver, typically from format_event().
+        """
+        for subscriber in self._subscribers:
+            if subscriber.full():
+                # Drop the oldest message; the newest snapshot supersedes it
+                subscriber.get_nowait()
+            subscriber.put_nowait(message)
@@ -0,0 +1,32 @@
+"""
+Shared pytest setup. The modules under test live in the repository root, so
+it is put on the import path whichever directory pytest is started from.
+"""
+
+import os
+import sqlite3
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """Path of a database file, not yet created, that the database module uses."""
+    import database
+    path = str(tmp_path / 'test.db')
+    monkeypatch.setattr(database, 'DATABASE_PATH', path)
+    return path
+
+
+@pytest.fixture
+def query():
+    """Function running one SQL statement on a database file and returning its rows."""
+    def run(db_path, sql, params=()):
+        conn = sqlite3.connect(db_path)
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+    return run
@@ -0,0 +1,64 @@
+import asyncio
+import time
+import pytest
+from control_loop import ControlLoop, celsius_to_fahrenheit
+from pid_controller import PIDController
+
+
+class RecordingFan:
+    def __init__(self):
+        self.on = None
+
+    def turn_on_fan(self):
+        self.on = True
+
+    def turn_off_fan(self):
+        self.on = False
+
+
+def run_briefly(pit_celsius, setpoint_fahrenheit):
+    """Run a loop on a pit at a fixed Celsius temperature and return the fan and loop."""
+    fan = RecordingFan()
+    pid = PIDController(kp=10.0, ki=0.0, kd=0.0, setpoint=setpoint_fahrenheit, output_limits=(0, 100))
+    loop = ControlLoop(pid, fan, lambda: (pit_celsius, time.time()), sample_time=0.01)
+
+    async def main():
+        loop.start()
+        await asyncio.sleep(0.035)
+        fan_on = fan.on
+        # Cancel the task without stop(), which always switches the fan off
+        loop._task.cancel()
+        return fan_on
+
+    return asyncio.run(main()), loop
+
+
+def test_celsius_to_fahrenheit():
+    assert celsius_to_fahrenheit(100.0) == pytest.approx(212.0)
+    assert celsius_to_fahrenheit(-40.0) == pytest.approx(-40.0)
+
+
+def test_fan_turns_off_above_a_fahrenheit_setpoint():
+    # 110 °C is 230 °F: above a 225 °F setpoint, though below 225 as a raw number
+    fan_on, loop = run_briefly(110.0, 225.0)
+    assert fan_on is False
+    assert loop.duty == 0.0
+
+
+def test_fan_runs_below_a_fahrenheit_setpoint():
+    # 100 °C is 212 °F, 13 °F short of the setpoint; the output saturates so the fan stays on
+    fan_on, loop = run_briefly(100.0, 225.0)
+    assert fan_on is True
+    assert loop.duty == 1.0
+
+
+def test_fan_is_held_off_without_a_setpoint():
+    fan_on, loop = run_briefly(20.0, 0.0)
+    assert fan_on is False
+
+
+def test_stale_reading_holds_the_fan_off():
+    fan = RecordingFan()
+    pid = PIDController(kp=5.0, ki=0.0, kd=0.0, setpoint=225.0, output_limits=(0, 100))
+    loop = ControlLoop(pid, fan, lambda: (20.0, time.time() - 60), max_reading_age=15)
+    assert loop.step(0.0) == 0.0
@@ -0,0 +1,128 @@
+import sqlite3
+import database
+from database import SchemaMigration, SCHEMA_VERSION
+
+# 2027-01-15 08:00:00 UTC
+EPOCH = 1_800_000_000
+
+
+def make_version_1(db_path):
+    """Write a database as version 1 left it, with the 1m and 5m rollup tiers."""
+    conn = sqlite3.connect(db_path)
+    conn.executescript('''
+        CREATE TABLE temperature_data (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            temperature REAL,
+            sensor_id INTEGER,
+            cook_id INTEGER
+        );
+        CREATE TABLE cooks (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, started_at REAL NOT NULL, ended_at REAL);
+    ''')
+    rows = [(EPOCH + 10 * i, 200.0 + i, 1 + i % 2, 1 if i >= 6 else None) for i in range(10)]
+    conn.executemany('''
+        INSERT INTO temperature_data (timestamp, temperature, sensor_id, cook_id)
+        VALUES (datetime(?, 'unixepoch'), ?, ?, ?)
+    ''', rows)
+    conn.execute("INSERT INTO cooks (name, started_at) VALUES ('Brisket', ?)", (EPOCH + 60,))
+    for bucket_seconds, table in ((60, 'temperature_rollup_1m'), (300, 'temperature_rollup_5m')):
+        conn.execute(f'''
+            CREATE TABLE {table} (
+                sensor_id TEXT NOT NULL, bucket INTEGER NOT NULL, min_temperature REAL,
+                max_temperature REAL, sum_temperature REAL, count INTEGER, PRIMARY KEY (sensor_id, bucket)
+            )
+        ''')
+        conn.execute(f'''
+            INSERT INTO {table}
+            SELECT sensor_id, CAST(strftime('%s', timestamp) AS INTEGER) / ? * ?,
+                   min(temperature), max(temperature), sum(temperature), count(temperature)
+            FROM temperature_data GROUP BY 1, 2
+        ''', (bucket_seconds, bucket_seconds))
+    conn.commit()
+    conn.close()
+
+
+def test_new_database_is_version_2(db_path, query):
+    database.init_db()
+    assert query(db_path, 'PRAGMA user_version') == [(SCHEMA_VERSION,)]
+    assert query(db_path, 'PRAGMA auto_vacuum') == [(2,)]
+    assert query(db_path, 'PRAGMA journal_mode') == [('wal',)]
+
+
+def test_version_1_is_migrated_in_the_background(db_path, query):
+    make_version_1(db_path)
+    database.init_db()
+    # The rollups are upgraded at once; the rows wait for the migration
+    assert query(db_path, 'PRAGMA user_version') == [(1,)]
+    assert SchemaMigration(db_path).pending()
+    assert query(db_path, 'SELECT label FROM sensors ORDER BY label') == [('1',), ('2',)]
+
+    SchemaMigration(db_path, batch_size=3, batch_pause=0).run()
+
+    assert not SchemaMigration(db_path).pending()
+    assert query(db_path, 'PRAGMA user_version') == [(SCHEMA_VERSION,)]
+    samples = query(db_path, '''
+        SELECT samples.ts, samples.temperature, sensors.label, samples.cook_id
+        FROM samples JOIN sensors ON sensors.id = samples.sensor_id ORDER BY samples.ts
+    ''')
+    assert samples == [((EPOCH + 10 * i) * 1000, 200.0 + i, str(1 + i % 2), 1 if i >= 6 else None)
+                       for i in range(10)]
+
+
+def test_migration_keeps_every_rollup_tier_exact(db_path, query):
+    make_version_1(db_path)
+    database.init_db()
+    SchemaMigration(db_path, batch_pause=0).run()
+    for _, table in database.ROLLUP_TIERS:
+        # Carried over (1m, 5m) or backfilled from the version 1 rows (1h), never folded twice
+        assert query(db_path, f'SELECT sum(count), sum(sum_temperature) FROM {table}') == [(10, 2045.0)]
+
+
+def test_migration_resumes_after_being_stopped(db_path, query):
+    make_version_1(db_path)
+    database.init_db()
+    migration = SchemaMigration(db_path, batch_size=4, batch_pause=0)
+    migration._stopping.set()
+    migration.run()  # Stopped before its first batch
+    assert query(db_path, 'SELECT count(*) FROM temperature_data') == [(10,)]
+    SchemaMigration(db_path, batch_size=4, batch_pause=0).run()
+    assert query(db_path, 'SELECT count(*) FROM samples') == [(10,)]
+
+
+def test_duplicate_rows_are_stored_and_counted_once(db_path, query):
+    database.init_db()
+    conn = sqlite3.connect(db_path)
+    with conn:
+        database.write_temperature_rows(conn, [(EPOCH, 200.0, 'Pit', None), (EPOCH, 250.0, 'Pit', None)])
+    with conn:
+        database.write_temperature_rows(conn, [(EPOCH, 300.0, 'Pit', None), (EPOCH + 1, 202.0, 'Pit', None)])
+    conn.close()
+    assert query(db_path, 'SELECT ts, temperature FROM samples') == [(EPOCH * 1000, 200.0), ((EPOCH + 1) * 1000, 202.0)]
+    for _, table in database.ROLLUP_TIERS:
+        assert query(db_path, f'SELECT min_temperature, max_temperature, sum_temperature, count FROM {table}') \
+            == [(200.0, 202.0, 402.0, 2)]
+
+
+def test_auto_vacuum_conversion_is_opt_in(db_path, query):
+    make_version_1(db_path)
+    database.init_db()
+    assert query(db_path, 'PRAGMA auto_vacuum') == [(0,)]
+    database.init_db(convert_auto_vacuum=True)
+    assert query(db_path, 'PRAGMA auto_vacuum') == [(2,)]
+
+
+def test_export_pages_cover_every_row_once(db_path):
+    database.init_db()
+    conn = sqlite3.connect(db_path)
+    with conn:
+        database.write_temperature_rows(conn, [(EPOCH + i // 3, 200.0, f'Probe {i % 3}', None) for i in range(30)])
+    conn.close()
+    rows, after = [], None
+    while True:
+        page, after = database.get_temperature_chunk(chunk_size=7, after=after)
+        rows += page
+        if after is None:
+            break
+    assert len(rows) == 30
+    assert len(set((timestamp, label) for timestamp, label, _, _ in rows)) == 30
+    assert [row[0] for row in rows] == sorted(row[0] for row in rows)
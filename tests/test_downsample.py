@@ -0,0 +1,38 @@
+import math
+import numpy as np
+from downsample import lttb_indices, downsample_series, rows_to_series
+
+
+def test_lttb_keeps_every_point_under_the_threshold():
+    assert lttb_indices([1, 2, 3], [5, 6, 7], 10).tolist() == [0, 1, 2]
+
+
+def test_lttb_keeps_the_endpoints_and_the_threshold():
+    x = np.arange(1000)
+    y = np.sin(x / 50)
+    indices = lttb_indices(x, y, 50)
+    assert len(indices) == 50
+    assert indices[0] == 0 and indices[-1] == 999
+    assert (np.diff(indices) > 0).all()
+
+
+def test_lttb_keeps_a_spike():
+    y = np.zeros(500)
+    y[217] = 100.0
+    assert 217 in lttb_indices(np.arange(500), y, 20)
+
+
+def test_downsample_series_rounds_temperatures():
+    timestamps, temperatures = downsample_series([1000, 2000], [20.123, 21.456])
+    assert timestamps == [1000, 2000]
+    assert temperatures == [20.12, 21.46]
+
+
+def test_rows_to_series_groups_by_label_and_drops_nan():
+    rows = [(1000, 20.0, 'Pit'), (1000, 60.0, 'Meat'), (2000, math.nan, 'Pit'), (3000, 22.0, 'Pit')]
+    series = rows_to_series(rows)
+    assert series == {'Meat': ([1000], [60.0]), 'Pit': ([1000, 3000], [20.0, 22.0])}
+
+
+def test_rows_to_series_without_rows():
+    assert rows_to_series([]) == {}
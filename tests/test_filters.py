@@ -0,0 +1,110 @@
+import math
+import pytest
+from filters import MAX_MEDIAN_WINDOW, MedianFilter, EmaFilter, KalmanFilter, FilterChain, SensorFilters
+
+
+def test_median_rejects_a_single_spike():
+    median = MedianFilter(window=5)
+    outputs = [median.update(value) for value in (200, 201, 500, 202, 203)]
+    assert 500 not in outputs
+    assert outputs[-1] == 202
+
+
+def test_median_returns_the_lower_median_while_filling():
+    median = MedianFilter(window=5)
+    assert median.update(200.0) == 200.0
+    # Two samples; the lower one, not their average
+    assert median.update(300.0) == 200.0
+    assert median.update(250.0) == 250.0
+    assert median.update(260.0) == 250.0
+
+
+def test_median_drops_the_oldest_sample():
+    median = MedianFilter(window=3)
+    for value in (1, 2, 3, 10, 11):
+        result = median.update(value)
+    assert result == 10
+
+
+def test_median_reset():
+    median = MedianFilter(window=3)
+    median.update(100)
+    median.update(100)
+    median.reset()
+    assert median.update(5) == 5
+
+
+@pytest.mark.parametrize('window', [0, MAX_MEDIAN_WINDOW + 1])
+def test_median_window_is_bounded(window):
+    with pytest.raises(ValueError):
+        MedianFilter(window=window)
+
+
+def test_ema_moves_alpha_of_the_way():
+    ema = EmaFilter(alpha=0.5)
+    assert ema.update(100.0) == 100.0
+    assert ema.update(200.0) == 150.0
+    ema.reset()
+    assert ema.update(10.0) == 10.0
+
+
+def test_kalman_converges_on_a_steady_value():
+    kalman = KalmanFilter(process_noise=0.01, measurement_noise=1.0)
+    assert kalman.update(200.0) == 200.0
+    for _ in range(200):
+        estimate = kalman.update(210.0)
+    assert estimate == pytest.approx(210.0, abs=0.01)
+
+
+def test_chain_from_config():
+    chain = FilterChain.from_config([{'type': 'median', 'window': 3}, {'type': 'ema', 'alpha': 1.0}])
+    assert [type(stage) for stage in chain.stages] == [MedianFilter, EmaFilter]
+    assert [chain.update(value) for value in (1, 9, 2)] == [1, 1, 2]
+
+
+@pytest.mark.parametrize('spec', [[{'type': 'mean'}], [{'type': 'ema', 'beta': 1}], [{'type': 'ema', 'alpha': 2}]])
+def test_chain_rejects_invalid_stages(spec):
+    with pytest.raises(ValueError):
+        FilterChain.from_config(spec)
+
+
+def config(**sampler):
+    return {
+        'sampler': {'filters': [{'type': 'ema', 'alpha': 0.5}], **sampler},
+        'sensors': [{'label': 'Pit'}, {'label': 'Meat', 'filters': []}],
+    }
+
+
+def test_sensor_filters_use_the_default_and_per_sensor_chains():
+    filters = SensorFilters(config(keep_raw=True))
+    filters.apply('Pit', 100.0, 0)
+    assert filters.apply('Pit', 200.0, 1) == (150.0, 200.0)
+    # Unfiltered sensors keep no raw copy
+    assert filters.apply('Meat', 200.0, 1) == (200.0, None)
+    # Sensors that are not configured, such as Meater probes, take the default
+    filters.apply('Meater abc', 100.0, 0)
+    assert filters.apply('Meater abc', 200.0, 1) == (150.0, 200.0)
+
+
+def test_sensor_filters_pass_failed_reads_through():
+    filters = SensorFilters(config())
+    assert filters.apply('Pit', None, 0) == (None, None)
+    assert math.isnan(filters.apply('Pit', math.nan, 0)[0])
+
+
+def test_sensor_filters_restart_after_a_gap():
+    filters = SensorFilters(config(filter_reset_after=60))
+    filters.apply('Pit', 100.0, 0)
+    assert filters.apply('Pit', 200.0, 30)[0] == 150.0
+    assert filters.apply('Pit', 300.0, 1000)[0] == 300.0
+
+
+def test_reconfiguring_keeps_unchanged_chains():
+    filters = SensorFilters(config())
+    filters.apply('Pit', 100.0, 0)
+    filters.apply('Meater abc', 100.0, 0)
+    changed = config()
+    changed['sensors'][0]['filters'] = [{'type': 'ema', 'alpha': 1.0}]
+    filters.configure(changed)
+    assert filters.apply('Pit', 200.0, 1)[0] == 200.0  # New chain
+    assert filters.apply('Meater abc', 200.0, 1)[0] == 150.0  # Carried over
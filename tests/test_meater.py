@@ -0,0 +1,53 @@
+import time
+import pytest
+from filters import SensorFilters
+from meater import MeaterPoller, MeaterProbe, MeaterError
+from ring_buffer import RingBufferStore
+from sampler import TemperatureSampler
+
+
+def devices(*temperatures):
+    return {'data': {'devices': [{'id': f'probe{i}abcdef', 'temperature': {'internal': temperature, 'ambient': 90.0}}
+                                 for i, temperature in enumerate(temperatures)]}}
+
+
+def test_read_returns_the_poll_time():
+    poller = MeaterPoller(api=None)
+    poller.update(devices(150.0), fetched_at=time.time() - 5)
+    probe = MeaterProbe('probe0abcdef', 'internal')
+    temperature, fetched_at = poller.read(probe)
+    assert temperature == 150.0
+    assert time.time() - fetched_at == pytest.approx(5, abs=1)
+    [(swept, timestamp, error)] = poller.read_sweep(poller.sensors())
+    assert (swept, timestamp, error) == (150.0, fetched_at, None)
+
+
+def test_expired_readings_are_errors():
+    poller = MeaterPoller(api=None, ttl=60)
+    poller.update(devices(150.0), fetched_at=time.time() - 120)
+    [(temperature, _, error)] = poller.read_sweep(poller.sensors())
+    assert temperature is None
+    assert isinstance(error, MeaterError)
+
+
+def test_labels_and_ambient_channels():
+    poller = MeaterPoller(api=None, labels={'probe0abcdef': 'Brisket'}, include_ambient=True)
+    poller.update(devices(150.0))
+    assert [label for _, label in poller.sensors()] == ['Brisket', 'Brisket Ambient']
+
+
+def test_each_poll_is_recorded_once():
+    poller = MeaterPoller(api=None)
+    poller.update(devices(100.0), fetched_at=time.time() - 2)
+    sampler = TemperatureSampler(poller.sensors, None, read_sweep=poller.read_sweep,
+                                 filters=SensorFilters({'sampler': {'filters': [{'type': 'ema', 'alpha': 0.5}]}}))
+    buffers = RingBufferStore(10)
+    for _ in range(3):
+        snapshot = sampler.sweep()
+        buffers.append_snapshot(snapshot)
+    poller.update(devices(200.0), fetched_at=time.time() - 1)
+    snapshot = sampler.sweep()
+    buffers.append_snapshot(snapshot)
+    # The repeated sweeps neither added samples nor pulled the filter towards 100
+    assert snapshot.readings[0].temperature == 150.0
+    assert list(buffers.get('Meater probe0').samples()[1]) == [100.0, 150.0]
@@ -0,0 +1,42 @@
+import pytest
+from pid_controller import PIDController
+
+
+def test_proportional_only():
+    pid = PIDController(kp=2.0, ki=0.0, kd=0.0, setpoint=100)
+    assert pid.compute(90) == pytest.approx(20.0)
+
+
+def test_integral_scales_with_dt():
+    pid = PIDController(kp=0.0, ki=1.0, kd=0.0, setpoint=100)
+    assert pid.compute(90, dt=1.0) == pytest.approx(10.0)
+    assert pid.compute(90, dt=0.5) == pytest.approx(15.0)
+
+
+def test_derivative_scales_with_dt_and_skips_the_first_call():
+    pid = PIDController(kp=0.0, ki=0.0, kd=1.0, setpoint=100)
+    assert pid.compute(90, dt=2.0) == 0
+    # The error fell from 10 to 6 over 2 s
+    assert pid.compute(94, dt=2.0) == pytest.approx(-2.0)
+
+
+def test_output_is_clamped():
+    pid = PIDController(kp=10.0, ki=0.0, kd=0.0, setpoint=100, output_limits=(0, 100))
+    assert pid.compute(0) == 100
+    assert pid.compute(200) == 0
+
+
+def test_integral_does_not_wind_up_while_saturated():
+    pid = PIDController(kp=1.0, ki=1.0, kd=0.0, setpoint=100, output_limits=(0, 100))
+    for _ in range(100):
+        assert pid.compute(0, dt=1.0) == 100
+    # Released as soon as the error changes sign, not after unwinding 100 s of integral
+    assert pid.compute(110, dt=1.0) < 100
+
+
+def test_reset_clears_the_history():
+    pid = PIDController(kp=0.0, ki=1.0, kd=1.0, setpoint=100)
+    pid.compute(90)
+    pid.reset()
+    assert pid.integral == 0
+    assert pid.compute(90, dt=1.0) == pytest.approx(10.0)
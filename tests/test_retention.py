@@ -0,0 +1,88 @@
+import csv
+import gzip
+import sqlite3
+import pytest
+import database
+from retention import RetentionJob
+
+NOW = 1_800_000_000.0
+DAY = 86400
+
+
+@pytest.fixture(autouse=True)
+def schema(db_path):
+    database.init_db()
+
+
+def write(db_path, rows):
+    conn = sqlite3.connect(db_path)
+    with conn:
+        database.write_temperature_rows(conn, rows)
+    conn.close()
+
+
+def job(db_path, **kwargs):
+    return RetentionJob(db_path, batch_size=3, batch_pause=0, **kwargs)
+
+
+def test_expires_old_raw_rows_only(db_path, query):
+    write(db_path, [(NOW - 40 * DAY + i, 200.0, 'Pit', None) for i in range(10)]
+          + [(NOW - DAY, 210.0, 'Pit', None)])
+    deleted = job(db_path, raw_days=30).run_once(NOW)
+    assert deleted['samples'] == 10
+    assert query(db_path, 'SELECT ts FROM samples') == [(int((NOW - DAY) * 1000),)]
+
+
+def test_keeps_the_samples_of_cooks(db_path, query):
+    cook = database.start_cook('Brisket', started_at=NOW - 40 * DAY)
+    write(db_path, [(NOW - 40 * DAY + i, 200.0, 'Pit', cook['id'] if i % 2 else None) for i in range(10)])
+    deleted = job(db_path, raw_days=30).run_once(NOW)
+    assert deleted['samples'] == 5
+    assert query(db_path, 'SELECT count(*) FROM samples WHERE cook_id IS NOT NULL') == [(5,)]
+
+
+def test_expires_rollup_tiers_by_their_own_age(db_path, query):
+    write(db_path, [(NOW - 100 * DAY, 200.0, 'Pit', None)])
+    deleted = job(db_path, raw_days=None).run_once(NOW)
+    assert 'samples' not in deleted
+    assert deleted['rollup_1m'] == 1
+    assert deleted['rollup_5m'] == 0
+    assert 'rollup_1h' not in deleted  # Kept forever by default
+    assert query(db_path, 'SELECT count(*) FROM samples') == [(1,)]
+
+
+def test_archives_rows_as_csv_with_a_header_per_file(db_path, tmp_path):
+    start = NOW - 40 * DAY
+    write(db_path, [(start + i, 200.0 + i, 'Pit, "left"', None) for i in range(7)])
+    archive_dir = tmp_path / 'archive'
+    job(db_path, raw_days=30, archive_dir=str(archive_dir)).run_once(NOW)
+    files = list(archive_dir.iterdir())
+    assert len(files) == 1
+    with gzip.open(files[0], 'rt', encoding='utf-8', newline='') as archive_file:
+        rows = list(csv.reader(archive_file))
+    # Three batches were appended, but the header is written once
+    assert rows[0] == ['timestamp', 'sensor', 'temperature', 'cook_id']
+    assert len(rows) == 8
+    assert rows[1][1:] == ['Pit, "left"', '200.0', '']
+
+
+def test_reclaims_pages(db_path, query):
+    write(db_path, [(NOW - 40 * DAY + i, 200.0, f'Probe {i % 4}', None) for i in range(20000)])
+    before = query(db_path, 'PRAGMA page_count')[0][0]
+    job(db_path, raw_days=30, rollup_days={'1m': 1, '5m': 1}).run_once(NOW)
+    assert query(db_path, 'PRAGMA freelist_count') == [(0,)]
+    assert query(db_path, 'PRAGMA page_count')[0][0] < before
+
+
+def test_skips_vacuum_on_a_database_without_incremental_auto_vacuum(tmp_path, monkeypatch, query):
+    path = str(tmp_path / 'old.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE placeholder (x)')  # A file with tables cannot switch without a VACUUM
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(database, 'DATABASE_PATH', path)
+    database.init_db()
+    write(path, [(NOW - 40 * DAY + i, 200.0, 'Pit', None) for i in range(2000)])
+    # Returns rather than waiting on a freelist incremental_vacuum cannot shrink
+    assert job(path, raw_days=30).run_once(NOW)['samples'] == 2000
+    assert query(path, 'PRAGMA freelist_count')[0][0] > 0
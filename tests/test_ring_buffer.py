@@ -0,0 +1,84 @@
+from ring_buffer import SensorRingBuffer, RingBufferStore
+from sampler import SensorReading, Snapshot
+
+
+def filled(capacity, count):
+    buffer = SensorRingBuffer(capacity)
+    for i in range(count):
+        buffer.append(1000 * i, float(i))
+    return buffer
+
+
+def test_since_before_the_buffer_wraps():
+    buffer = filled(8, 5)
+    timestamps, values = buffer.since(2000)
+    assert list(timestamps) == [3000, 4000]
+    assert list(values) == [3.0, 4.0]
+
+
+def test_since_is_strictly_after():
+    buffer = filled(8, 5)
+    assert list(buffer.since(4000)[0]) == []
+    assert list(buffer.since(3999)[0]) == [4000]
+
+
+def test_wrap_around_keeps_the_newest_samples_in_order():
+    buffer = filled(5, 12)
+    assert len(buffer) == 5
+    assert buffer.oldest_timestamp() == 7000
+    assert buffer.newest_timestamp() == 11000
+    assert list(buffer.samples()[0]) == [7000, 8000, 9000, 10000, 11000]
+
+
+def test_since_across_the_wrap_point():
+    buffer = filled(5, 12)  # The head sits mid-array, so the result spans the end of the arrays
+    timestamps, values = buffer.since(8500)
+    assert list(timestamps) == [9000, 10000, 11000]
+    assert list(values) == [9.0, 10.0, 11.0]
+    assert list(buffer.since(0)[0]) == [7000, 8000, 9000, 10000, 11000]
+
+
+def test_load_round_trips_samples():
+    source = filled(5, 12)
+    copy = SensorRingBuffer(5)
+    copy.load(*source.samples())
+    assert list(copy.samples()[0]) == list(source.samples()[0])
+    copy.append(12000, 12.0)
+    assert copy.oldest_timestamp() == 8000
+
+
+def snapshot(sequence, *readings):
+    return Snapshot(readings=tuple(SensorReading(*reading) for reading in readings), sequence=sequence, taken_at=None)
+
+
+def test_store_skips_failed_and_repeated_readings():
+    store = RingBufferStore(10)
+    store.append_snapshot(snapshot(1, ('Pit', 200.0, 1.0, None), ('Meat', None, 1.0, 'timeout')))
+    store.append_snapshot(snapshot(2, ('Pit', 200.0, 1.0, None)))  # A cached reading seen again
+    store.append_snapshot(snapshot(3, ('Pit', 201.0, 2.0, None)))
+    assert store.get('Meat') is None
+    assert list(store.get('Pit').samples()[0]) == [1000, 2000]
+
+
+def test_store_covers_only_what_it_still_holds():
+    store = RingBufferStore(3)
+    assert not store.covers(0)
+    for second in range(1, 6):
+        store.append_snapshot(snapshot(second, ('Pit', 200.0, float(second), None)))
+    assert not store.covers(500)  # Samples 1 and 2 were overwritten
+    assert store.covers(3000)
+    assert store.newest_timestamp() == 5000
+
+
+def test_store_resize_keeps_the_newest_samples():
+    store = RingBufferStore(4)
+    for second in range(1, 5):
+        store.append_snapshot(snapshot(second, ('Pit', float(second), float(second), None)))
+    store.resize(2)
+    assert list(store.get('Pit').samples()[0]) == [3000, 4000]
+    assert not store.covers(1500)
+    store.resize(6)
+    for second in range(5, 9):
+        store.append_snapshot(snapshot(second, ('Pit', float(second), float(second), None)))
+    assert list(store.get('Pit').samples()[0]) == [3000, 4000, 5000, 6000, 7000, 8000]
+    assert store.covers(3000)
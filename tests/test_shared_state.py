@@ -0,0 +1,110 @@
+import asyncio
+import uuid
+import pytest
+import shared_state
+from ring_buffer import RingBufferStore
+from sampler import SensorReading, Snapshot
+from shared_state import SharedStateWriter, SharedStateReader, serve_commands, send_command
+
+
+@pytest.fixture
+def segment():
+    name = f'masterpi-test-{uuid.uuid4().hex[:8]}'
+    writer = SharedStateWriter(name, 1 << 16)
+    reader = SharedStateReader(name, timeout=1.0)
+    yield writer, reader
+    reader.close()
+    writer.close()
+
+
+def snapshot(sequence, temperature):
+    return Snapshot(readings=(SensorReading('Pit', temperature, float(sequence), None),
+                              SensorReading('Meat', None, float(sequence), 'timeout')),
+                    sequence=sequence, taken_at=float(sequence))
+
+
+def buffers_with(*snapshots):
+    store = RingBufferStore(4)
+    for snap in snapshots:
+        store.append_snapshot(snap)
+    return store
+
+
+def test_round_trip(segment):
+    writer, reader = segment
+    first, second = snapshot(1, 200.0), snapshot(2, 201.5)
+    writer.publish(second, {'fan_on': True, 'target_temperature': 225}, buffers_with(first, second))
+    state = reader.read()
+    assert state.snapshot == second
+    assert state.state == {'fan_on': True, 'target_temperature': 225}
+    timestamps, values = state.ring_buffers.get('Pit').samples()
+    assert list(timestamps) == [1000, 2000]
+    assert list(values) == [200.0, 201.5]
+    assert state.ring_buffers.covers(1000)
+
+
+def test_read_is_cached_until_the_next_publish(segment):
+    writer, reader = segment
+    writer.publish(snapshot(1, 200.0), {'fan_on': False})
+    assert reader.read() is reader.read()
+    writer.publish(snapshot(1, 200.0), {'fan_on': True})
+    assert reader.read().state == {'fan_on': True}
+
+
+def test_state_only_publish_reuses_the_encoded_buffers(segment, monkeypatch):
+    writer, reader = segment
+    first = snapshot(1, 200.0)
+    store = buffers_with(first)
+    encodes = []
+    encode_rings = shared_state._encode_rings
+    monkeypatch.setattr(shared_state, '_encode_rings', lambda rings: encodes.append(1) or encode_rings(rings))
+    writer.publish(first, {'fan_on': False}, store)
+    buffers = reader.read().ring_buffers
+    writer.publish(first, {'fan_on': True}, store)  # e.g. a fan toggle
+    state = reader.read()
+    assert state.state == {'fan_on': True}
+    assert state.ring_buffers is buffers
+    assert len(encodes) == 1
+    second = snapshot(2, 201.0)
+    store.append_snapshot(second)
+    writer.publish(second, {'fan_on': True}, store)
+    assert list(reader.read().ring_buffers.get('Pit').samples()[0]) == [1000, 2000]
+    assert len(encodes) == 2
+
+
+def test_oversize_buffers_are_dropped():
+    name = f'masterpi-test-{uuid.uuid4().hex[:8]}'
+    writer = SharedStateWriter(name, 1024)
+    reader = SharedStateReader(name, timeout=1.0)
+    try:
+        store = RingBufferStore(200)
+        for sequence in range(1, 201):
+            store.append_snapshot(snapshot(sequence, 200.0))
+        writer.publish(snapshot(200, 200.0), {'fan_on': False}, store)
+        state = reader.read()
+        assert state.snapshot.sequence == 200
+        assert state.ring_buffers.get('Pit') is None
+    finally:
+        reader.close()
+        writer.close()
+
+
+def test_commands_round_trip(tmp_path):
+    async def handler(command, args):
+        if command == 'fail':
+            raise ValueError('bad setpoint')
+        return {'command': command, **args}
+
+    async def exchange():
+        path = str(tmp_path / 'owner.sock')
+        server = await serve_commands(path, handler)
+        try:
+            result = await send_command(path, 'set_target', target_temperature=225)
+            with pytest.raises(RuntimeError, match='bad setpoint'):
+                await send_command(path, 'fail')
+            return result
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    assert asyncio.run(exchange()) == {'command': 'set_target', 'target_temperature': 225}
@@ -0,0 +1,58 @@
+import asyncio
+import re
+import uuid
+import pytest
+import database
+import masterpi
+from metrics import registry
+from page_cache import PageCache
+from shared_state import SharedStateWriter
+
+
+@pytest.fixture
+def worker(db_path, monkeypatch):
+    database.init_db()
+    name = f'masterpi-test-{uuid.uuid4().hex[:8]}'
+    writer = SharedStateWriter(name, 1 << 16)
+    monkeypatch.setattr(masterpi, 'worker_mode', True)
+    monkeypatch.setattr(masterpi, 'config', {'quart': {'shared_memory': name}, 'stream': {}})
+    sent = []
+
+    async def owner(path, command, **args):
+        # The owner shares this process's registry here, so it renders the same metrics
+        sent.append((command, args))
+        return registry.render(exclude=args.get('exclude', ()))
+
+    monkeypatch.setattr(masterpi, 'send_command', owner)
+    yield sent
+    writer.close()
+
+
+def metric_value(body, sample):
+    match = re.search(rf'^{re.escape(sample)} (\S+)$', body, re.MULTILINE)
+    assert match, f"{sample} missing from the metrics"
+    return float(match.group(1))
+
+
+def test_worker_renders_its_own_metrics(worker):
+    async def scrape():
+        await masterpi.start_web_worker()
+        try:
+            subscriber = masterpi.broadcaster.subscribe()
+            await masterpi.read_pool.run('latest_timestamp', database.get_latest_temperature_timestamp)
+
+            async def render(placeholder):
+                return placeholder
+            await PageCache().get('worker_test', 1, render, 'token')
+            return await masterpi.render_metrics()
+        finally:
+            await masterpi.stop_web_worker()
+
+    body = asyncio.run(scrape())
+    assert worker == [('metrics', {'exclude': list(masterpi.WORKER_METRICS)})]
+    assert metric_value(body, 'masterpi_stream_subscribers') == 1
+    assert metric_value(body, 'masterpi_db_read_seconds_count{query="latest_timestamp"}') >= 1
+    assert metric_value(body, 'masterpi_page_cache_requests_total{page="worker_test",result="miss"}') >= 1
+    # Each metric comes from either the owner or the worker, never both
+    families = re.findall(r'^# TYPE (\S+)', body, re.MULTILINE)
+    assert len(families) == len(set(families))
@@ -0,0 +1,72 @@
+"""
+This module serves a stand-in for the Meater cloud API, so the Meater poller
+can be tested without an account or network access.
+
+Run it and point meater_integration.base_url at it:
+
+    python tools/fake_meater_server.py --port 8081 --probes 2 --rate-limit-every 5
+    # config.yaml: base_url: http://localhost:8081/v1/
+"""
+
+import argparse
+import hashlib
+import math
+import time
+from aiohttp import web
+
+TOKEN = 'fake-meater-token'
+
+def make_app(probes, rate_limit_every, retry_after):
+    """
+    Build the aiohttp application.
+
+    :param probes: Number of probes to report.
+    :param rate_limit_every: Answer every Nth devices request with 429; 0 never does.
+    :param retry_after: Retry-After seconds sent with a 429.
+    """
+    started = time.time()
+    requests = {'devices': 0}
+
+    async def login(request):
+        body = await request.json()
+        if not body.get('email') or not body.get('password'):
+            return web.json_response({'status': 'Unauthorized', 'statusCode': 401}, status=401)
+        return web.json_response({'status': 'OK', 'statusCode': 200, 'data': {'token': TOKEN}})
+
+    async def devices(request):
+        if request.headers.get('Authorization') != f'Bearer {TOKEN}':
+            return web.json_response({'status': 'Unauthorized', 'statusCode': 401}, status=401)
+        requests['devices'] += 1
+        if rate_limit_every and requests['devices'] % rate_limit_every == 0:
+            return web.json_response({'status': 'Too Many Requests', 'statusCode': 429}, status=429,
+                                     headers={'Retry-After': str(retry_after)})
+        elapsed = time.time() - started
+        devices = []
+        for n in range(probes):
+            # A slow rise towards 70 °C internal in a 110 °C cooker
+            internal = 70 - 65 * math.exp(-elapsed / (600 * (n + 1)))
+            devices.append({
+                'id': hashlib.sha256(f'probe-{n}'.encode()).hexdigest(),
+                'temperature': {'internal': round(internal, 2), 'ambient': round(110 + 2 * math.sin(elapsed / 60), 2)},
+                'cook': None,
+                'updated_at': int(time.time()),
+            })
+        return web.json_response({'status': 'OK', 'statusCode': 200, 'data': {'devices': devices}, 'meta': {}})
+
+    app = web.Application()
+    app.router.add_post('/v1/login', login)
+    app.router.add_get('/v1/devices', devices)
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a stand-in for the Meater cloud API.')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--probes', type=int, default=1, help='Number of probes to report.')
+    parser.add_argument('--rate-limit-every', type=int, default=0,
+                        help='Answer every Nth devices request with 429 Too Many Requests.')
+    parser.add_argument('--retry-after', type=int, default=30, help='Retry-After seconds sent with a 429.')
+    args = parser.parse_args()
+    web.run_app(make_app(args.probes, args.rate_limit_every, args.retry_after), port=args.port)
+
+if __name__ == '__main__':
+    main()